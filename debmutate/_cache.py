@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Bounded caches for values derived from files on disk."""
+
+import os
+import threading
+from collections import OrderedDict
+from typing import Generic, Hashable, Optional, Tuple, TypeVar
+
+T = TypeVar('T')
+
+FileStamp = Tuple[int, int, int]
+
+
+def file_stamp(path: str) -> FileStamp:
+    """Return a stamp that changes when a file is modified.
+
+    Raises:
+      FileNotFoundError: if the file does not exist
+    """
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def optional_file_stamp(path: str) -> Optional[FileStamp]:
+    """Like file_stamp, but return None if the file does not exist."""
+    try:
+        return file_stamp(path)
+    except FileNotFoundError:
+        return None
+
+
+class FileCache(Generic[T]):
+    """Least-recently-used cache of values derived from files.
+
+    Every entry is stored with a stamp (see file_stamp); lookups with a
+    different stamp miss, so entries are invalidated when the files they
+    were derived from change.
+    """
+
+    def __init__(self, maxsize: int = 128) -> None:
+        self.maxsize = maxsize
+        self._entries: 'OrderedDict[Hashable, Tuple[Hashable, T]]' = (
+            OrderedDict())
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, key: Hashable, stamp: Hashable) -> T:
+        """Look up a value.
+
+        Raises:
+          KeyError: if there is no entry for the key, or the entry has a
+            different stamp
+        """
+        with self._lock:
+            cached_stamp, value = self._entries[key]
+            if cached_stamp != stamp:
+                raise KeyError(key)
+            self._entries.move_to_end(key)
+            return value
+
+    def store(self, key: Hashable, stamp: Hashable, value: T) -> None:
+        """Store a value, evicting the least recently used entries."""
+        with self._lock:
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
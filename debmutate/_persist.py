@@ -0,0 +1,96 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Persistence of indexes and stores as versioned JSON files."""
+
+import json
+import os
+from typing import Optional
+
+
+def check_format_version(data, version: int, kind: str = 'index') -> None:
+    """Check the format version of persisted data.
+
+    Raises:
+      ValueError: if the data has a different format version
+    """
+    if data.get('version') != version:
+        raise ValueError(
+            'unsupported {} format: {!r}'.format(kind, data.get('version')))
+
+
+def save_json(path: str, data) -> None:
+    """Atomically write JSON data to a file."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class JsonStore:
+    """Base class for objects that are persisted as a versioned JSON file.
+
+    Subclasses set _format_version, implement _load and _dump and set
+    _dirty when they are modified. When used as a context manager, the
+    object is saved on exit if it was modified.
+    """
+
+    _format_version: int
+    _format_kind = 'index'
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self.path = path
+        self._dirty = False
+        if path is not None:
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except FileNotFoundError:
+                pass
+            else:
+                check_format_version(
+                    data, self._format_version, self._format_kind)
+                self._load(data)
+
+    def _load(self, data) -> None:
+        raise NotImplementedError(self._load)
+
+    def _dump(self):
+        raise NotImplementedError(self._dump)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write to disk.
+
+        Args:
+          path: Path to write to (defaults to the path this was loaded from)
+        """
+        if path is None:
+            path = self.path
+        if path is None:
+            raise ValueError('no path specified')
+        data = self._dump()
+        data['version'] = self._format_version
+        save_json(path, data)
+        self._dirty = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None and self._dirty and self.path is not None:
+            self.save()
+        return False
@@ -17,14 +17,20 @@
 
 """Utility functions for dealing with rules files."""
 
+import glob
+import logging
 import os
 import re
-from typing import Iterator, List, Optional, Union
+from functools import lru_cache
+from typing import (Callable, Dict, Iterable, Iterator, List, NamedTuple,
+                    Optional, Pattern, Set, Tuple, Union)
 
+from ._cache import FileCache, file_stamp
 from .reformatting import Editor
 
 
-def wildcard_to_re(wildcard: str):
+@lru_cache(maxsize=1024)
+def wildcard_to_re(wildcard: str) -> Pattern[str]:
     wc = []
     for c in wildcard:
         if c == '%':
@@ -42,11 +48,14 @@ def matches_wildcard(text: str, wildcard: str) -> bool:
 class Rule:
     """A make rule."""
 
-    target: Optional[bytes]
     comands: List[bytes]
     prereq_targets: List[bytes]
     precomment: List[bytes]
 
+    # The contents list this rule was last added to; notified when the
+    # target changes, so that its index is invalidated.
+    _owner: Optional['_ContentsList'] = None
+
     def __init__(self, target: Optional[bytes] = None,
                  commands: Optional[List[bytes]] = None,
                  prereq_targets: Optional[List[bytes]] = None,
@@ -79,6 +88,16 @@ class Rule:
     def __repr__(self):
         return "<{}({!r})>".format(type(self).__name__, self.target)
 
+    @property
+    def target(self) -> Optional[bytes]:
+        return self._target
+
+    @target.setter
+    def target(self, target: Optional[bytes]) -> None:
+        self._target = target
+        if self._owner is not None:
+            self._owner.version += 1
+
     @property
     def targets(self) -> List[bytes]:
         if self.target is None:
@@ -90,8 +109,8 @@ class Rule:
             return target in self.targets
         else:
             return any(
-                [matches_wildcard(
-                    target.decode(), t.decode()) for t in self.targets])
+                matches_wildcard(target.decode(), t.decode())
+                for t in self.targets)
 
     def rename_target(self, oldname: bytes, newname: bytes) -> bool:
         # TODO(jelmer): Handle multiple targets
@@ -169,12 +188,143 @@ def _is_rule(line):
     return True
 
 
+_VARIABLE_RE = re.compile(br'(export\s)?([A-Za-z0-9_]+)\s*[:?]?=\s*(.*)')
+
+
+class _ContentsList(list):
+    """List that keeps track of modifications.
+
+    The version attribute is bumped on every modification (including changes
+    to the target of a rule in the list), so that indexes derived from the
+    list can be invalidated.
+    """
+
+    version = 0
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._adopt(self)
+
+    def _adopt(self, entries):
+        for entry in entries:
+            if isinstance(entry, Rule):
+                entry._owner = self
+
+    def __setitem__(self, key, value):
+        self.version += 1
+        if isinstance(key, slice):
+            value = list(value)
+            self._adopt(value)
+        else:
+            self._adopt([value])
+        return super().__setitem__(key, value)
+
+    def __delitem__(self, *args):
+        self.version += 1
+        return super().__delitem__(*args)
+
+    def __iadd__(self, other):  # type: ignore
+        self.version += 1
+        other = list(other)
+        self._adopt(other)
+        return super().__iadd__(other)
+
+    def append(self, entry):
+        self.version += 1
+        self._adopt([entry])
+        return super().append(entry)
+
+    def extend(self, entries):
+        self.version += 1
+        entries = list(entries)
+        self._adopt(entries)
+        return super().extend(entries)
+
+    def insert(self, index, entry):
+        self.version += 1
+        self._adopt([entry])
+        return super().insert(index, entry)
+
+    def pop(self, *args):
+        self.version += 1
+        return super().pop(*args)
+
+    def remove(self, *args):
+        self.version += 1
+        return super().remove(*args)
+
+    def clear(self):
+        self.version += 1
+        return super().clear()
+
+    def sort(self, *args, **kwargs):
+        self.version += 1
+        return super().sort(*args, **kwargs)
+
+    def reverse(self):
+        self.version += 1
+        return super().reverse()
+
+
+class _MakefileIndex:
+
+    def __init__(self, contents: Iterable[Union[bytes, Rule]]) -> None:
+        self.targets: Dict[bytes, List[Tuple[int, Rule]]] = {}
+        self.wildcards: List[Tuple[int, List[str], Rule]] = []
+        self.phony: List[Rule] = []
+        self.variables: Dict[bytes, bytes] = {}
+        for i, entry in enumerate(contents):
+            if isinstance(entry, Rule):
+                targets = entry.targets
+                for target in targets:
+                    self.targets.setdefault(target, []).append((i, entry))
+                wildcards = [t.decode() for t in targets if b'%' in t]
+                if wildcards:
+                    self.wildcards.append((i, wildcards, entry))
+                if b'.PHONY' in targets:
+                    self.phony.append(entry)
+            else:
+                m = _VARIABLE_RE.fullmatch(entry)
+                if m:
+                    self.variables.setdefault(
+                        m.group(2).strip(), m.group(3).strip())
+
+    def lookup(self, target: bytes, exact: bool = True) -> List[Rule]:
+        found = self.targets.get(target, [])
+        if exact:
+            return [rule for (i, rule) in found]
+        decoded = target.decode()
+        matches = dict(found)
+        for i, wildcards, rule in self.wildcards:
+            if i not in matches and any(
+                    matches_wildcard(decoded, wc) for wc in wildcards):
+                matches[i] = rule
+        return [matches[i] for i in sorted(matches)]
+
+
 class Makefile:
-    contents: List[Union[bytes, Rule]]
 
     def __init__(self, contents: Optional[bytes] = None):
+        self._index: Optional[_MakefileIndex] = None
+        self._index_key: Optional[Tuple[int, int]] = None
         self.contents = list(contents or [])  # type: ignore
 
+    @property
+    def contents(self) -> List[Union[bytes, Rule]]:
+        return self._contents
+
+    @contents.setter
+    def contents(self, contents: List[Union[bytes, Rule]]) -> None:
+        self._contents = _ContentsList(contents)
+        self._index = None
+
+    def _get_index(self) -> _MakefileIndex:
+        key = (id(self._contents), self._contents.version)
+        if self._index is None or self._index_key != key:
+            self._index = _MakefileIndex(self._contents)
+            self._index_key = key
+        return self._index
+
     @classmethod
     def from_path(cls, path: str) -> 'Makefile':
         with open(path, 'rb') as f:
@@ -187,21 +337,10 @@ class Makefile:
                 yield entry
 
     def iter_rules(self, target: bytes, exact: bool = True) -> Iterator[Rule]:
-        for rule in self.iter_all_rules():
-            if rule.has_target(target, exact):
-                yield rule
+        return iter(self._get_index().lookup(target, exact))
 
     def get_variable(self, desired_key: bytes) -> bytes:
-        for line in self.contents:
-            if not isinstance(line, bytes):
-                continue
-            m = re.fullmatch(
-                br'(export\s)?([A-Za-z0-9_]+)\s*[:?]?=\s*(.*)', line)
-            if not m:
-                continue
-            if m.group(2).strip() == desired_key:
-                return m.group(3).strip()
-        raise KeyError(desired_key)
+        return self._get_index().variables[desired_key]
 
     @classmethod
     def from_bytes(cls, contents):
@@ -287,26 +426,22 @@ class Makefile:
         return rule
 
     def mark_phony(self, rule):
-        for r in self.iter_rules(b'.PHONY'):
+        phony_rules = self._get_index().phony
+        for r in phony_rules:
             if rule in r.components:
                 return
-        try:
-            phony_rule = list(self.iter_rules(b'.PHONY'))[-1]
-        except IndexError:
-            self.add_rule(b'.PHONY', [rule])
+        if phony_rules:
+            phony_rules[-1].append_component(rule)
         else:
-            phony_rule.append_component(rule)
+            self.add_rule(b'.PHONY', [rule])
 
     def add_phony(self, rule):
-        try:
-            phony_rule = list(self.iter_rules(b'.PHONY'))[-1]
-        except IndexError:
-            return
-
-        phony_rule.append_component(rule)
+        phony_rules = self._get_index().phony
+        if phony_rules:
+            phony_rules[-1].append_component(rule)
 
     def drop_phony(self, rule):
-        for r in self.iter_rules(b'.PHONY'):
+        for r in list(self._get_index().phony):
             if rule in r.components:
                 r.remove_component(rule)
             if not r.components:
@@ -329,11 +464,194 @@ class MakefileEditor(Editor[Makefile, bytes]):
         return self._parsed
 
 
+CommandLineTransform = Callable[
+    [bytes, Optional[bytes]], Union[bytes, List[bytes]]]
+GlobalLineTransform = Callable[[bytes], Union[None, bytes, List[bytes]]]
+RuleTransform = Callable[[Rule], None]
+DhTransform = Callable[['DhInvocation', Optional[bytes]], None]
+MakefileTransform = Callable[[Makefile], None]
+
+
+def _rule_state(rule: Rule):
+    return (rule.target, tuple(rule.precomment), tuple(rule.lines))
+
+
+def _makefile_state(makefile: Makefile):
+    return [entry if isinstance(entry, bytes) else _rule_state(entry)
+            for entry in makefile.contents]
+
+
+class RulesTransformPipeline:
+    """A set of transforms to apply to a rules file in a single pass.
+
+    Transforms are applied in the order in which they were added. Command
+    line transforms are called with the command (without leading tab) and
+    the target of the rule; they return either the new command or a list
+    of commands. Global line transforms are called with a line that is not
+    part of a rule and return the new line, a list of lines or None to
+    drop the line. dh transforms are called with a DhInvocation (parsed once
+    per command line, after the command line transforms have run) and the
+    target of the rule, and modify the invocation in place. Rule transforms
+    modify a rule in place; clearing a rule removes it. Makefile transforms
+    run last, on the entire makefile.
+    """
+
+    def __init__(self, drop_related_comments: bool = False) -> None:
+        self.drop_related_comments = drop_related_comments
+        self.command_line_transforms: List[CommandLineTransform] = []
+        self.dh_transforms: List[DhTransform] = []
+        self.global_line_transforms: List[GlobalLineTransform] = []
+        self.rule_transforms: List[RuleTransform] = []
+        self.makefile_transforms: List[MakefileTransform] = []
+
+    def add_command_line_transform(self, cb: CommandLineTransform) -> None:
+        self.command_line_transforms.append(cb)
+
+    def add_dh_transform(self, cb: DhTransform) -> None:
+        self.dh_transforms.append(cb)
+
+    def add_global_line_transform(self, cb: GlobalLineTransform) -> None:
+        self.global_line_transforms.append(cb)
+
+    def add_rule_transform(self, cb: RuleTransform) -> None:
+        self.rule_transforms.append(cb)
+
+    def add_makefile_transform(self, cb: MakefileTransform) -> None:
+        self.makefile_transforms.append(cb)
+
+    def extend(self, other: 'RulesTransformPipeline') -> None:
+        """Add all transforms from another pipeline."""
+        self.command_line_transforms.extend(other.command_line_transforms)
+        self.dh_transforms.extend(other.dh_transforms)
+        self.global_line_transforms.extend(other.global_line_transforms)
+        self.rule_transforms.extend(other.rule_transforms)
+        self.makefile_transforms.extend(other.makefile_transforms)
+
+    def _transform_command(
+            self, command: bytes, target: Optional[bytes]) -> List[bytes]:
+        commands = [command]
+        for cb in self.command_line_transforms:
+            newcommands = []
+            for command in commands:
+                ret = cb(command, target)
+                if isinstance(ret, bytes):
+                    newcommands.append(ret)
+                elif isinstance(ret, list):
+                    newcommands.extend(ret)
+                else:
+                    raise TypeError(ret)
+            commands = newcommands
+        if self.dh_transforms:
+            for i, command in enumerate(commands):
+                invocation = DhInvocation.parse(command)
+                if invocation is None:
+                    continue
+                for dh_cb in self.dh_transforms:
+                    dh_cb(invocation, target)
+                commands[i] = bytes(invocation)
+        return commands
+
+    def _transform_global_line(self, line: bytes) -> List[bytes]:
+        lines = [line]
+        for cb in self.global_line_transforms:
+            newlines = []
+            for line in lines:
+                ret = cb(line)
+                if ret is None:
+                    continue
+                elif isinstance(ret, list):
+                    newlines.extend(ret)
+                elif isinstance(ret, bytes):
+                    newlines.append(ret)
+                else:
+                    raise TypeError(ret)
+            lines = newlines
+        return lines
+
+    def _transform_rule(self, rule: Rule) -> bool:
+        changed = False
+        if self.command_line_transforms or self.dh_transforms:
+            newlines = [rule.lines[0]]
+            for line in rule.lines[1:]:
+                if line.startswith(b'\t'):
+                    commands = self._transform_command(line[1:], rule.target)
+                    if commands != [line[1:]]:
+                        changed = True
+                    newlines.extend([b'\t' + cmd for cmd in commands])
+                else:
+                    newlines.append(line)
+            rule.lines = newlines
+        if self.rule_transforms:
+            before = _rule_state(rule)
+            for cb in self.rule_transforms:
+                cb(rule)
+            if _rule_state(rule) != before:
+                changed = True
+        return changed
+
+    def apply(self, makefile: Makefile) -> bool:
+        """Apply the transforms to a makefile.
+
+        Returns:
+          boolean indicating whether any transform made changes
+        """
+        changed = False
+        newcontents: List[Union[bytes, Rule]] = []
+        for entry in makefile.contents:
+            if isinstance(entry, Rule):
+                if self._transform_rule(entry):
+                    changed = True
+                if entry:
+                    newcontents.append(entry)
+                elif newcontents and newcontents[-1] == b'':
+                    newcontents.pop(-1)
+                continue
+            if not self.global_line_transforms:
+                newcontents.append(entry)
+                continue
+            lines = self._transform_global_line(entry)
+            if lines != [entry]:
+                changed = True
+            if lines:
+                newcontents.extend(lines)
+                continue
+            if self.drop_related_comments:
+                while (newcontents and isinstance(newcontents[-1], bytes)
+                       and newcontents[-1].startswith(b'#')):
+                    del newcontents[-1]
+            if newcontents and not newcontents[-1]:
+                del newcontents[-1]
+            # TODO(jelmer): If there is no preceding whitespace, drop
+            # next line if it's empty?
+        if changed:
+            makefile.contents = newcontents
+        if self.makefile_transforms:
+            before = _makefile_state(makefile)
+            for cb in self.makefile_transforms:
+                cb(makefile)
+            if _makefile_state(makefile) != before:
+                changed = True
+        return changed
+
+
 class RulesEditor(MakefileEditor):
 
     def __init__(self, path='debian/rules'):
         super().__init__(path)
 
+    def apply_transforms(self, pipeline: RulesTransformPipeline) -> bool:
+        """Apply a set of transforms in a single pass.
+
+        Args:
+          pipeline: Transforms to apply
+        Returns:
+          boolean indicating whether any changes were made
+        """
+        if pipeline.apply(self.makefile):
+            discard_pointless_overrides(self.makefile)
+            return True
+        return False
+
     def legacy_update(self, command_line_cb=None, global_line_cb=None,
                       rule_cb=None, makefile_cb=None,
                       drop_related_comments=False):
@@ -346,65 +664,20 @@ class RulesEditor(MakefileEditor):
         Returns:
           boolean indicating whether any changes were made
         """
-        newcontents: List[Union[bytes, Rule]] = []
-        for entry in self.makefile.contents:
-            if isinstance(entry, Rule):
-                rule = entry
-                newlines = []
-                for line in list(rule.lines[1:]):
-                    if line.startswith(b'\t'):
-                        ret = line[1:]
-                        if callable(command_line_cb):
-                            ret = command_line_cb(ret, rule.target)
-                        elif isinstance(command_line_cb, list):
-                            for fn in command_line_cb:
-                                ret = fn(ret, rule.target)
-                        if isinstance(ret, bytes):
-                            newlines.append(b'\t' + ret)
-                        elif isinstance(ret, list):
-                            for otherl in ret:
-                                newlines.append(b'\t' + otherl)
-                        else:
-                            raise TypeError(ret)
-                    else:
-                        newlines.append(line)
-
-                rule.lines = [rule.lines[0]] + newlines
-
-                if rule_cb:
-                    rule_cb(rule)
-                if rule:
-                    newcontents.append(rule)
-                else:
-                    if newcontents and newcontents[-1] == b'':
-                        newcontents.pop(-1)
-            else:
-                line = entry
-                if global_line_cb:
-                    line = global_line_cb(line)
-                if line is None:
-                    if drop_related_comments:
-                        while newcontents and newcontents[-1].startswith(b'#'):
-                            del newcontents[-1]
-                    if newcontents and not newcontents[-1]:
-                        del newcontents[-1]
-                    # TODO(jelmer): If there is no preceding whitespace, drop
-                    # next line if it's empty?
-                elif isinstance(line, list):
-                    newcontents.extend(line)
-                elif isinstance(line, bytes):
-                    newcontents.append(line)
-                else:
-                    raise TypeError(line)
-
-        self.makefile.contents = newcontents
+        pipeline = RulesTransformPipeline(
+            drop_related_comments=drop_related_comments)
+        if callable(command_line_cb):
+            pipeline.add_command_line_transform(command_line_cb)
+        elif isinstance(command_line_cb, list):
+            for fn in command_line_cb:
+                pipeline.add_command_line_transform(fn)
+        if global_line_cb:
+            pipeline.add_global_line_transform(global_line_cb)
+        if rule_cb:
+            pipeline.add_rule_transform(rule_cb)
         if makefile_cb:
-            makefile_cb(self.makefile)
-        if self.has_changed():
-            discard_pointless_overrides(self.makefile)
-            return True
-        else:
-            return False
+            pipeline.add_makefile_transform(makefile_cb)
+        return self.apply_transforms(pipeline)
 
 
 def discard_pointless_overrides(makefile, ignore_comments=False):
@@ -459,6 +732,244 @@ def update_rules(command_line_cb=None, global_line_cb=None,
     return updater.changed
 
 
+_SHELL_OPERATOR_RE = re.compile(br'(;|&&|\|\||\||>|<|&|#)')
+# Like _SHELL_OPERATOR_RE, but # only starts a comment at the start of a word
+_WORD_END_RE = re.compile(br'(;|&&|\|\||\||>|<|&)')
+_DH_OPTIONS_WITH_VALUE = (
+    b'--with', b'--without', b'--buildsystem', b'-S',
+    b'--sourcedirectory', b'-D', b'--builddirectory', b'-B',
+    b'--package', b'-p', b'--no-package', b'-N', b'--tmpdir', b'-P')
+# Short options that can also be followed directly by their value (-Ssrc)
+_DH_SHORT_OPTIONS_WITH_VALUE = (b'-S', b'-D', b'-B', b'-p', b'-N', b'-P')
+
+
+class DhInvocation:
+    """A parsed invocation of dh.
+
+    The command line is split into tokens; the whitespace in front of each
+    token is kept, so that the invocation serializes back to the original
+    line when it is not modified. Anything after a shell operator (;, &&,
+    ||, |, redirections or a comment) is kept verbatim.
+    """
+
+    _tokens: List[List[bytes]]
+
+    def __init__(self, tokens: List[List[bytes]], tail: bytes = b'') -> None:
+        self._tokens = tokens
+        self.tail = tail
+
+    @classmethod
+    def parse(cls, line: bytes) -> Optional['DhInvocation']:
+        """Parse a command line.
+
+        Returns:
+          a DhInvocation, or None if the line does not invoke dh
+        """
+        tokens: List[List[bytes]] = []
+        i = 0
+        while i < len(line):
+            j = i
+            while j < len(line) and line[j:j+1] in (b' ', b'\t'):
+                j += 1
+            if j == len(line):
+                return cls._finish(tokens, line[i:])
+            if _SHELL_OPERATOR_RE.match(line, j):
+                return cls._finish(tokens, line[i:])
+            k = j
+            quote = None
+            while k < len(line):
+                c = line[k:k+1]
+                if quote is not None:
+                    if c == quote:
+                        quote = None
+                    elif c == b'\\' and quote == b'"':
+                        k += 1
+                elif c in (b'"', b"'"):
+                    quote = c
+                elif c == b'\\':
+                    k += 1
+                elif c in (b' ', b'\t') or _WORD_END_RE.match(line, k):
+                    break
+                k += 1
+            if line[j:k].isdigit() and line[k:k+1] in (b'>', b'<'):
+                # File descriptor redirection, e.g. 2>&1
+                return cls._finish(tokens, line[i:])
+            tokens.append([line[i:j], line[j:k]])
+            i = k
+        return cls._finish(tokens, b'')
+
+    @classmethod
+    def _finish(cls, tokens, tail) -> Optional['DhInvocation']:
+        if not tokens or tokens[0][1].lstrip(b'@-+') != b'dh':
+            return None
+        return cls(tokens, tail)
+
+    def __bytes__(self) -> bytes:
+        return b''.join(ws + token for (ws, token) in self._tokens) + self.tail
+
+    def __repr__(self) -> str:
+        return '{}.parse({!r})'.format(type(self).__name__, bytes(self))
+
+    def _iter_options(
+            self) -> Iterator[Tuple[int, bytes, Optional[int], bytes]]:
+        # Yields (index of option token, option name, index of value token,
+        # prefix of the value in the value token)
+        i = 1
+        end = self._options_end()
+        while i < end:
+            token = self._tokens[i][1]
+            name, sep, value = token.partition(b'=')
+            if sep and name.startswith(b'-'):
+                yield i, name, i, name + sep
+            elif name in _DH_OPTIONS_WITH_VALUE:
+                if i + 1 < end:
+                    yield i, name, i + 1, b''
+                    i += 1
+                else:
+                    yield i, name, None, b''
+            elif token[:2] in _DH_SHORT_OPTIONS_WITH_VALUE:
+                yield i, token[:2], i, token[:2]
+            elif token.startswith(b'-'):
+                yield i, name, None, b''
+            i += 1
+
+    def _value(self, index: int, prefix: bytes) -> bytes:
+        return self._tokens[index][1][len(prefix):]
+
+    def _set_value(self, index: int, prefix: bytes, value: bytes) -> None:
+        self._tokens[index][1] = prefix + value
+
+    def _remove(self, *indexes: int) -> None:
+        for index in sorted(set(indexes), reverse=True):
+            del self._tokens[index]
+
+    def _options_end(self) -> int:
+        # Anything after "--" is passed on to the debhelper commands
+        for i, (ws, token) in enumerate(self._tokens):
+            if i > 0 and token == b'--':
+                return i
+        return len(self._tokens)
+
+    def _append(self, token: bytes) -> None:
+        self._tokens.insert(self._options_end(), [b' ', token])
+
+    @property
+    def arguments(self) -> List[bytes]:
+        """Positional arguments (including the sequence)."""
+        option_indexes: Set[Optional[int]] = set()
+        for i, name, value_index, prefix in self._iter_options():
+            option_indexes.update([i, value_index])
+        return [token for (i, (ws, token)) in enumerate(self._tokens)
+                if 0 < i < self._options_end() and i not in option_indexes]
+
+    @property
+    def sequence(self) -> Optional[bytes]:
+        """The sequence (e.g. $@ or binary) dh is invoked for."""
+        args = self.arguments
+        if args:
+            return args[0]
+        return None
+
+    def _get_list(self, option: bytes) -> List[bytes]:
+        ret: List[bytes] = []
+        for i, name, value_index, prefix in self._iter_options():
+            if name == option and value_index is not None:
+                ret.extend(self._value(value_index, prefix).split(b','))
+        return ret
+
+    def get_with(self) -> List[bytes]:
+        """Return the addons enabled with --with."""
+        return self._get_list(b'--with')
+
+    def get_without(self) -> List[bytes]:
+        """Return the addons disabled with --without."""
+        return self._get_list(b'--without')
+
+    def _add_to_list(self, option: bytes, value: bytes) -> None:
+        if value in self._get_list(option):
+            return
+        for i, name, value_index, prefix in self._iter_options():
+            if name == option and value_index is not None:
+                self._set_value(
+                    value_index, prefix,
+                    self._value(value_index, prefix) + b',' + value)
+                return
+        self._append(option + b'=' + value)
+
+    def _drop_from_list(self, option: bytes, value: bytes) -> None:
+        for i, name, value_index, prefix in self._iter_options():
+            if name != option or value_index is None:
+                continue
+            values = self._value(value_index, prefix).split(b',')
+            if value not in values:
+                continue
+            values = [v for v in values if v != value]
+            if values:
+                self._set_value(value_index, prefix, b','.join(values))
+            else:
+                self._remove(i, value_index)
+                # Indexes have shifted; start over.
+                self._drop_from_list(option, value)
+                return
+
+    def add_with(self, addon: bytes) -> None:
+        self._add_to_list(b'--with', addon)
+
+    def drop_with(self, addon: bytes) -> None:
+        self._drop_from_list(b'--with', addon)
+
+    def add_without(self, addon: bytes) -> None:
+        self._add_to_list(b'--without', addon)
+
+    def drop_without(self, addon: bytes) -> None:
+        self._drop_from_list(b'--without', addon)
+
+    @property
+    def buildsystem(self) -> Optional[bytes]:
+        """The build system selected with --buildsystem or -S."""
+        ret = None
+        for i, name, value_index, prefix in self._iter_options():
+            if name in (b'--buildsystem', b'-S') and value_index is not None:
+                ret = self._value(value_index, prefix)
+        return ret
+
+    @buildsystem.setter
+    def buildsystem(self, value: Optional[bytes]) -> None:
+        options = [
+            (i, value_index, prefix)
+            for (i, name, value_index, prefix) in self._iter_options()
+            if name in (b'--buildsystem', b'-S')]
+        if value is not None and options and options[-1][1] is not None:
+            i, value_index, prefix = options.pop(-1)
+            assert value_index is not None
+            self._set_value(value_index, prefix, value)
+            value = None
+        indexes = []
+        for (i, value_index, prefix) in options:
+            indexes.append(i)
+            if value_index is not None:
+                indexes.append(value_index)
+        self._remove(*indexes)
+        if value is not None:
+            self._append(b'--buildsystem=' + value)
+
+    def has_argument(self, argument: bytes) -> bool:
+        return any(token == argument for (ws, token) in self._tokens[1:])
+
+    def add_argument(self, argument: bytes) -> None:
+        if not self.has_argument(argument):
+            self._append(argument)
+
+    def drop_argument(self, argument: bytes) -> None:
+        self._tokens[1:] = [
+            t for t in self._tokens[1:] if t[1] != argument]
+
+    def replace_argument(self, old: bytes, new: bytes) -> None:
+        for t in self._tokens[1:]:
+            if t[1] == old:
+                t[1] = new
+
+
 def dh_invoke_add_with(line, with_argument):
     """Add a particular value to a with argument."""
     if with_argument in line:
@@ -518,11 +1029,337 @@ def dh_invoke_replace_argument(line, old, new):
     return line
 
 
+class Assignment(NamedTuple):
+    """A variable assignment."""
+
+    name: bytes
+    operator: bytes
+    value: bytes
+    export: bool = False
+
+
+class RuleNode(NamedTuple):
+    """A rule, as found in a parsed rules tree."""
+
+    targets: List[bytes]
+    prerequisites: List[bytes]
+    commands: List[bytes]
+
+
+class ConditionalBranch(NamedTuple):
+    """A single branch of a conditional.
+
+    The directive is one of ifeq, ifneq, ifdef and ifndef, or else for
+    the final unconditional branch.
+    """
+
+    directive: bytes
+    condition: bytes
+    body: List['Node']
+
+
+class Conditional(NamedTuple):
+    """A conditional block (ifeq/ifneq/ifdef/ifndef ... endif)."""
+
+    branches: List[ConditionalBranch]
+
+
+class Include:
+    """An include directive.
+
+    Included files are only read when resolve() is called.
+    """
+
+    def __init__(self, paths: List[bytes], optional: bool = False,
+                 base_dir: str = '.') -> None:
+        self.paths = paths
+        self.optional = optional
+        self.base_dir = base_dir
+
+    def __repr__(self) -> str:
+        return '{}({!r}, optional={!r})'.format(
+            type(self).__name__, self.paths, self.optional)
+
+    def __eq__(self, other: object) -> bool:
+        return (isinstance(other, type(self))
+                and self.paths == other.paths
+                and self.optional == other.optional)
+
+    def iter_filenames(self) -> Iterator[str]:
+        """Iterate over the names of the files that are included.
+
+        Paths that reference make variables can not be resolved and are
+        skipped.
+        """
+        for path in self.paths:
+            if b'$' in path:
+                logging.debug('Unable to resolve include of %r', path)
+                continue
+            filename = os.path.join(self.base_dir, os.fsdecode(path))
+            if glob.has_magic(filename):
+                yield from sorted(glob.glob(filename))
+            else:
+                yield filename
+
+    def resolve(self, cache: Optional['FileCache[RulesTree]'] = None
+                ) -> List['RulesTree']:
+        """Parse the included files.
+
+        Included files that do not exist are skipped.
+
+        Args:
+          cache: Optional cache to reuse earlier parses from (see
+            load_rules_tree)
+        """
+        ret = []
+        for filename in self.iter_filenames():
+            try:
+                ret.append(load_rules_tree(
+                    filename, base_dir=self.base_dir, cache=cache))
+            except FileNotFoundError:
+                logging.debug('Included file %s does not exist', filename)
+        return ret
+
+
+Node = Union[Assignment, RuleNode, Conditional, Include]
+
+
+_CONDITIONAL_DIRECTIVES = (b'ifeq', b'ifneq', b'ifdef', b'ifndef')
+_INCLUDE_DIRECTIVES = (b'include', b'-include', b'sinclude')
+_ASSIGNMENT_RE = re.compile(
+    br'((?:export|override)\s+)*([^:#=\s]+)\s*(::=|:=|\?=|\+=|!=|=)\s*(.*)',
+    re.DOTALL)
+_CONTINUATION_RE = re.compile(br'[ \t]*\\\n[ \t]*')
+
+
+def _iter_logical_lines(contents: bytes) -> Iterator[bytes]:
+    keep = b''
+    for line in contents.splitlines():
+        line = keep + line
+        if line.endswith(b'\\'):
+            keep = line + b'\n'
+            continue
+        keep = b''
+        yield line
+    if keep:
+        yield keep
+
+
+def _parse_rules_tree(contents: bytes, base_dir: str) -> List[Node]:
+    root: List[Node] = []
+    # Stack of (conditional, body) for the open conditionals
+    stack: List[Tuple[Conditional, List[Node]]] = []
+    body = root
+    rule: Optional[RuleNode] = None
+    define: Optional[Tuple[bytes, bool, List[bytes]]] = None
+    for line in _iter_logical_lines(contents):
+        if define is not None:
+            if line.strip() == b'endef':
+                name, export, value = define
+                body.append(Assignment(
+                    name, b'=', b'\n'.join(value), export=export))
+                define = None
+            else:
+                value = define[2]
+                value.append(line)
+            continue
+        if line.startswith(b'\t'):
+            if rule is not None:
+                rule.commands.append(line[1:])
+            continue
+        stripped = _CONTINUATION_RE.sub(b' ', line).strip()
+        if not stripped or stripped.startswith(b'#'):
+            continue
+        directive, _, rest = stripped.partition(b' ')
+        rest = rest.strip()
+        if directive in _CONDITIONAL_DIRECTIVES:
+            conditional = Conditional(
+                [ConditionalBranch(directive, rest, [])])
+            body.append(conditional)
+            stack.append((conditional, body))
+            body = conditional.branches[-1].body
+        elif directive == b'else' and stack:
+            conditional = stack[-1][0]
+            subdirective, _, condition = rest.partition(b' ')
+            if subdirective in _CONDITIONAL_DIRECTIVES:
+                branch = ConditionalBranch(
+                    subdirective, condition.strip(), [])
+            else:
+                branch = ConditionalBranch(b'else', b'', [])
+            conditional.branches.append(branch)
+            body = branch.body
+        elif directive == b'endif' and stack:
+            body = stack.pop()[1]
+        elif directive in _INCLUDE_DIRECTIVES:
+            body.append(Include(
+                rest.split(), optional=(directive != b'include'),
+                base_dir=base_dir))
+        elif directive == b'define' or stripped.startswith(b'export define '):
+            words = stripped.split()
+            i = words.index(b'define') + 1
+            define = (
+                words[i] if i < len(words) else b'', directive == b'export',
+                [])
+        else:
+            m = _ASSIGNMENT_RE.fullmatch(stripped)
+            if m:
+                rule = None
+                body.append(Assignment(
+                    m.group(2), m.group(3), m.group(4).strip(),
+                    export=(directive == b'export')))
+            elif _is_rule(stripped):
+                before, after = stripped.split(b':', 1)
+                after = after.lstrip(b':')
+                if b'=' in after.partition(b';')[0]:
+                    # Target-specific variable assignment
+                    continue
+                prereqs, _, recipe = after.partition(b';')
+                rule = RuleNode(
+                    before.split(),
+                    [p for p in prereqs.split() if p != b'|'],
+                    [recipe.strip()] if recipe.strip() else [])
+                body.append(rule)
+    return root
+
+
+class RulesTree:
+    """Read-only parse tree of a makefile.
+
+    Unlike Makefile, this does not preserve formatting; it is meant for
+    answering questions about rules files rather than for editing them.
+    Conditionals are not evaluated; queries consider all branches.
+    """
+
+    def __init__(self, nodes: List[Node], path: Optional[str] = None,
+                 cache: Optional['FileCache[RulesTree]'] = None) -> None:
+        self.nodes = nodes
+        self.path = path
+        self._cache = cache
+
+    def __repr__(self) -> str:
+        return '<{}({!r})>'.format(type(self).__name__, self.path)
+
+    @classmethod
+    def from_bytes(cls, contents: bytes, path: Optional[str] = None,
+                   base_dir: str = '.',
+                   cache: Optional['FileCache[RulesTree]'] = None
+                   ) -> 'RulesTree':
+        return cls(
+            _parse_rules_tree(contents, base_dir), path=path, cache=cache)
+
+    def iter_nodes(self, follow_includes: bool = False,
+                   _seen: Optional[Set[str]] = None) -> Iterator[Node]:
+        """Iterate over all nodes, descending into conditionals.
+
+        Args:
+          follow_includes: Whether to also yield nodes in included files
+        """
+        if _seen is None:
+            _seen = set()
+        if self.path is not None:
+            _seen.add(os.path.abspath(self.path))
+        todo = list(reversed(self.nodes))
+        while todo:
+            node = todo.pop()
+            yield node
+            if isinstance(node, Conditional):
+                for branch in reversed(node.branches):
+                    todo.extend(reversed(branch.body))
+            elif isinstance(node, Include) and follow_includes:
+                for tree in node.resolve(cache=self._cache):
+                    if (tree.path is not None
+                            and os.path.abspath(tree.path) in _seen):
+                        continue
+                    yield from tree.iter_nodes(
+                        follow_includes=True, _seen=_seen)
+
+    def iter_includes(self, follow_includes: bool = False
+                      ) -> Iterator[Include]:
+        for node in self.iter_nodes(follow_includes=follow_includes):
+            if isinstance(node, Include):
+                yield node
+
+    def iter_rules(self, target: Optional[bytes] = None,
+                   follow_includes: bool = False) -> Iterator[RuleNode]:
+        for node in self.iter_nodes(follow_includes=follow_includes):
+            if isinstance(node, RuleNode) and (
+                    target is None or target in node.targets):
+                yield node
+
+    def has_target(self, target: bytes,
+                   follow_includes: bool = False) -> bool:
+        return any(self.iter_rules(target, follow_includes=follow_includes))
+
+    def get_variable(self, name: bytes,
+                     follow_includes: bool = False) -> bytes:
+        """Determine the value of a variable.
+
+        Variable references in the value are not expanded.
+
+        Raises:
+          KeyError: if the variable is never assigned
+        """
+        value: Optional[bytes] = None
+        for node in self.iter_nodes(follow_includes=follow_includes):
+            if not isinstance(node, Assignment) or node.name != name:
+                continue
+            if node.operator == b'+=' and value:
+                value = value + b' ' + node.value
+            elif node.operator != b'?=' or value is None:
+                value = node.value
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def includes_path(self, prefix: bytes) -> bool:
+        """Check whether a path starting with prefix is included."""
+        return any(
+            path.startswith(prefix)
+            for include in self.iter_includes()
+            for path in include.paths)
+
+    def uses_cdbs(self) -> bool:
+        return self.includes_path(b'/usr/share/cdbs/')
+
+
+def load_rules_tree(path: str = 'debian/rules',
+                    base_dir: Optional[str] = None,
+                    cache: Optional[FileCache[RulesTree]] = None
+                    ) -> RulesTree:
+    """Parse a makefile.
+
+    Args:
+      path: Path to the makefile
+      base_dir: Directory that make runs in; relative includes are
+        resolved against this directory. Defaults to the parent of the
+        directory that contains the makefile, which is right for
+        debian/rules.
+      cache: Optional cache to reuse earlier parses from, as long as the
+        files have not changed. It is also used for included files. Trees
+        in the cache are shared between lookups, so they should not be
+        modified.
+    Returns:
+      A RulesTree
+    """
+    if base_dir is None:
+        base_dir = os.path.dirname(os.path.dirname(os.path.abspath(path)))
+    if cache is not None:
+        key = (os.path.abspath(path), base_dir)
+        stamp = file_stamp(path)
+        try:
+            return cache.lookup(key, stamp)
+        except KeyError:
+            pass
+    with open(path, 'rb') as f:
+        tree = RulesTree.from_bytes(
+            f.read(), path=path, base_dir=base_dir, cache=cache)
+    if cache is not None:
+        cache.store(key, stamp, tree)
+    return tree
+
+
 def check_cdbs(path='debian/rules'):
-    if not os.path.exists(path):
+    try:
+        return load_rules_tree(path).uses_cdbs()
+    except FileNotFoundError:
         return False
-    with open(path, 'rb') as f:
-        for line in f:
-            if line.lstrip(b'-').startswith(b'include /usr/share/cdbs/'):
-                return True
-    return False
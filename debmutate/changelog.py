@@ -32,6 +32,8 @@ __all__ = [
     'all_sha_prefixed',
     'any_long_lines',
     'find_extra_authors',
+    'ChangelogBlockHeader',
+    'scan_changelog_headers',
     'find_thanks',
     'rewrap_change',
     'strip_changelog_message',
@@ -44,7 +46,8 @@ import re
 import textwrap
 from datetime import datetime
 from email.utils import format_datetime, parseaddr
-from typing import Iterator, List, Optional, Tuple
+from functools import lru_cache
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 from debian.changelog import (ChangeBlock, Changelog, ChangelogCreateError,
                               ChangelogParseError, Version, format_date,
@@ -146,6 +149,9 @@ def changelog_auto_version(
             date=format_datetime(timestamp))
 
 
+_SECTION_RE = re.compile(r'  \[ (.*) \]')
+
+
 def changes_sections(
         changes: List[str]
         ) -> Iterator[
@@ -170,7 +176,7 @@ def changes_sections(
         if not line:
             section[1].append(i)
             continue
-        m = re.fullmatch(r'  \[ (.*) \]', line)
+        m = _SECTION_RE.fullmatch(line)
         if m:
             if change:
                 section[2].append(change)
@@ -213,6 +219,10 @@ class TextWrapper(textwrap.TextWrapper):
 
     whitespace = r'[%s]' % re.escape('\t\n\x0b\x0c\r ')
     wordsep_simple_re = re.compile(r'(%s+)' % whitespace)
+    # Bug closers ("Closes: #123", "LP: #123") are kept together
+    _chunk_re = re.compile(
+        r'([^%(ws)s]*(?:Closes|LP):)[%(ws)s]+(#[^%(ws)s]*)'
+        r'|[%(ws)s]+|[^%(ws)s]+' % {'ws': whitespace[1:-1]})
 
     def __init__(self, initial_indent=INITIAL_INDENT):
         super().__init__(
@@ -221,38 +231,40 @@ class TextWrapper(textwrap.TextWrapper):
             break_long_words=False, break_on_hyphens=False)
 
     def _split(self, text):
-        chunks = [c for c in self.wordsep_simple_re.split(text) if c]
         ret = []
-        i = 0
-        while i < len(chunks):
-            if (any(chunks[i].endswith(x) for x in ['Closes:', 'LP:']) and
-                    i+2 < len(chunks) and chunks[i+2].startswith('#')):
-                ret.append('{} {}'.format(chunks[i], chunks[i+2]))
-                i += 3
+        for m in self._chunk_re.finditer(text):
+            if m.group(1) is not None:
+                ret.append('{} {}'.format(m.group(1), m.group(2)))
             else:
-                ret.append(chunks[i])
-                i += 1
+                ret.append(m.group(0))
         return ret
 
 
+@lru_cache(maxsize=32)
+def _get_wrapper(initial_indent: str) -> TextWrapper:
+    # TextWrapper objects don't keep any state between calls to wrap()
+    return TextWrapper(initial_indent)
+
+
 _initial_re = re.compile(r'^[  ]+[\+\-\*] ')
+_sub_initial_re = re.compile(r'^[  ]*[\+\-\*] ')
 
 
 def _can_join(line1, line2):
     if line1.endswith(':'):
         return False
     if line2 and line2[:1].isupper():
-        if line1.endswith(']') or line1.endswith('}'):
+        if line1.endswith((']', '}')):
             return False
         if not line1.endswith('.'):
             return False
     return True
 
 
-def any_long_lines(lines: List[str], width: int = WIDTH) -> bool:
+def any_long_lines(lines: Iterable[str], width: int = WIDTH) -> bool:
     """Check if any lines are longer than the specified width.
     """
-    return any([len(line) > width for line in lines])
+    return any(len(line) > width for line in lines)
 
 
 def rewrap_change(change: List[str]) -> List[str]:
@@ -266,40 +278,65 @@ def rewrap_change(change: List[str]) -> List[str]:
     if not change:
         return change
     m = _initial_re.match(change[0])
-    if not any_long_lines(change) or not m:
+    if not m or not any_long_lines(change):
         return change
-    wrapper = TextWrapper(m.group(0))
     prefix_len = len(m.group(0))
+    wrapper = _get_wrapper(m.group(0))
     lines = [line[prefix_len:] for line in change]
     todo = [lines[0]]
+    todo_long = len(lines[0]) > WIDTH - prefix_len
     ret = []
     for i in range(len(lines) - 1):
-        if _can_join(lines[i], lines[i+1]) and any_long_lines(
-                todo, WIDTH-prefix_len):
+        if todo_long and _can_join(lines[i], lines[i+1]):
             todo.append(lines[i+1])
+            todo_long = todo_long or len(lines[i+1]) > WIDTH - prefix_len
         else:
             ret.extend(wrapper.wrap('\n'.join(todo)))
-            wrapper = TextWrapper(change[i+1][:len(m.group(0))])
+            wrapper = _get_wrapper(change[i+1][:prefix_len])
             todo = [lines[i+1]]
+            todo_long = len(lines[i+1]) > WIDTH - prefix_len
     ret.extend(wrapper.wrap('\n'.join(todo)))
     return ret
 
 
-def rewrap_changes(changes: Iterator[str]) -> Iterator[str]:
+def rewrap_changes(changes: Iterable[str]) -> Iterator[str]:
+    """Rewrap the entries in a list of change lines.
+
+    Entries without long lines are passed through as they are.
+
+    Args:
+      changes: Iterable over change lines
+    Returns:
+      iterator over the rewrapped lines
+    """
     change: List[str] = []
-    indent = None
+    indent = ''
+    long_lines = False
     for line in changes:
         m = _initial_re.match(line)
         if m:
-            yield from rewrap_change(change)
+            if long_lines:
+                yield from rewrap_change(change)
+            else:
+                yield from change
             change = [line]
-            indent = len(m.group(0))
-        elif change and line.startswith(' ' * indent):  # type: ignore
+            indent = ' ' * len(m.group(0))
+            long_lines = len(line) > WIDTH
+        elif change and line.startswith(indent):
             change.append(line)
+            long_lines = long_lines or len(line) > WIDTH
         else:
-            yield from rewrap_change(change)
+            if long_lines:
+                yield from rewrap_change(change)
+            else:
+                yield from change
             change = []
+            long_lines = False
             yield line
+    if long_lines:
+        yield from rewrap_change(change)
+    else:
+        yield from change
 
 
 def increment_version(version: Version) -> Version:
@@ -386,18 +423,21 @@ def changelog_add_entry(
 
 
 def changeblock_add_line(block, lines):
-    wrapper = TextWrapper(INITIAL_INDENT)
-    block._changes.extend(wrapper.wrap(lines[0]))
+    block._changes.extend(_get_wrapper(INITIAL_INDENT).wrap(lines[0]))
     for line in lines[1:]:
         prefix = len(INITIAL_INDENT) * ' '
-        m = re.match(r'^[  ]*[\+\-\*] ', line)
+        m = _sub_initial_re.match(line)
         if m:
             prefix += m.group(0)
             line = line[len(m.group(0)):]
-        block._changes.extend(TextWrapper(prefix).wrap(line))
+        block._changes.extend(_get_wrapper(prefix).wrap(line))
     block._changes.append('')
 
 
+_WHITESPACE_COLUMN_RE = re.compile(r'  |\t')
+_LEADER_RE = re.compile(r'[ \t]*[*+-] ')
+
+
 def strip_changelog_message(changes: List[str]) -> List[str]:
     """Strip a changelog message like debcommit does.
 
@@ -416,19 +456,16 @@ def strip_changelog_message(changes: List[str]) -> List[str]:
     while changes and changes[0] == '':
         changes.pop(0)
 
-    whitespace_column_re = re.compile(r'  |\t')
-    changes = [whitespace_column_re.sub('', line, 1) for line in changes]
+    changes = [_WHITESPACE_COLUMN_RE.sub('', line, 1) for line in changes]
 
-    leader_re = re.compile(r'[ \t]*[*+-] ')
-    count = len([line for line in changes if leader_re.match(line)])
+    count = sum(1 for line in changes if _LEADER_RE.match(line))
     if count == 1:
-        return [leader_re.sub('', line, 1).lstrip() for line in changes]
+        return [_LEADER_RE.sub('', line, 1).lstrip() for line in changes]
     else:
         return changes
 
 
-def new_changelog_entries(
-        old_text: List[bytes], new_text: List[bytes]) -> List[str]:
+def _diff_changes(old_text: List[bytes], new_text: List[bytes]) -> List[str]:
     import difflib
     sequencematcher = difflib.SequenceMatcher
     changes = []
@@ -443,6 +480,41 @@ def new_changelog_entries(
     return changes
 
 
+def _block_starts(lines: List[bytes]) -> List[int]:
+    return [i for i, line in enumerate(lines) if _HEADER_RE.match(line)]
+
+
+def new_changelog_entries(
+        old_text: List[bytes], new_text: List[bytes]) -> List[str]:
+    """Find the change lines that were added to a changelog.
+
+    Blocks at the end of the changelog that are unchanged are skipped, so
+    that only the (usually small) part of the changelog that changed is
+    compared line by line.
+
+    Args:
+      old_text: Lines of the old changelog
+      new_text: Lines of the new changelog
+    Returns:
+      list of added change lines
+    """
+    old_starts = _block_starts(old_text)
+    new_starts = _block_starts(new_text)
+    old_end = len(old_text)
+    new_end = len(new_text)
+    while old_starts and new_starts:
+        old_start = old_starts.pop()
+        new_start = new_starts.pop()
+        if (old_end - old_start != new_end - new_start
+                or old_text[old_start] != new_text[new_start]
+                or old_text[old_start:old_end]
+                != new_text[new_start:new_end]):
+            break
+        old_end = old_start
+        new_end = new_start
+    return _diff_changes(old_text[:old_end], new_text[:new_end])
+
+
 def new_upstream_package_version(
         upstream_version: str, distribution_name: str,
         epoch: Optional[str] = None) -> Version:
@@ -463,6 +535,9 @@ def new_upstream_package_version(
     return ret
 
 
+_SHA_PREFIX_RE = re.compile(r'  \* \[[0-9a-f]{7}\] ')
+
+
 def all_sha_prefixed(cb: ChangeBlock) -> bool:
     """Check if all lines in a changelog entry are prefixed with a sha.
 
@@ -476,7 +551,7 @@ def all_sha_prefixed(cb: ChangeBlock) -> bool:
     for change in cb.changes():
         if not change.startswith('  * '):
             continue
-        if re.match(r'  \* \[[0-9a-f]{7}\] ', change):
+        if _SHA_PREFIX_RE.match(change):
             sha_prefixed += 1
         else:
             return False
@@ -577,6 +652,90 @@ def find_last_distribution(changelog):
     return None
 
 
+class ChangelogBlockHeader(NamedTuple):
+    """Metadata from the header and trailer lines of a changelog block."""
+
+    package: str
+    version: str
+    distributions: str
+    urgency: Optional[str]
+    author: Optional[str]
+    date: Optional[str]
+
+
+# Same as debian.changelog.topline, but for bytes
+_HEADER_RE = re.compile(
+    rb'^(\w[-+0-9a-z.]*) \(([^\(\) \t]+)\)((?:\s+[-+0-9a-z.]+)+)\;(.*)$',
+    re.IGNORECASE)
+_URGENCY_RE = re.compile(
+    rb'(?:^|,)\s*urgency\s*=\s*([^\s,]+)', re.IGNORECASE)
+_TRAILER_RE = re.compile(rb'^ -- (.*<.*>)  ?(.*\S)\s*$')
+# Lines that debian.changelog ignores between blocks
+_COMMENT_RE = re.compile(rb'^(?:\# |/\*.*\*/|\$\w+:.*\$)')
+
+
+def _block_header(header_match, trailer_match) -> ChangelogBlockHeader:
+    (package, version, distributions, rest) = header_match.groups()
+    m = _URGENCY_RE.search(rest)
+    if trailer_match is not None:
+        author, date = [
+            v.decode('utf-8', 'replace') for v in trailer_match.groups()]
+    else:
+        author = date = None
+    return ChangelogBlockHeader(
+        package.decode('utf-8'), version.decode('utf-8'),
+        distributions.decode('utf-8').strip(),
+        m.group(1).decode('utf-8') if m else None, author, date)
+
+
+def _scan_changelog(
+        lines: Iterable[bytes]
+        ) -> Iterator[Tuple[int, int, ChangelogBlockHeader]]:
+    """Scan a changelog, yielding (start, end, header) for each block."""
+    current = None
+    trailer = None
+    trailing = False
+    offset = 0
+    for line in lines:
+        start = offset
+        offset += len(line)
+        if trailing:
+            continue
+        if line[:1].isspace():
+            if current is not None and trailer is None:
+                trailer = _TRAILER_RE.match(line)
+        else:
+            m = _HEADER_RE.match(line)
+            if m:
+                if current is not None:
+                    yield current[0], start, _block_header(current[1], trailer)
+                current = (start, m)
+                trailer = None
+            elif current is not None and not _COMMENT_RE.match(line):
+                # Old-style changelog or editor variables; like
+                # debian.changelog, treat the rest of the file as trailing
+                # text of the last block.
+                trailing = True
+    if current is not None:
+        yield current[0], offset, _block_header(current[1], trailer)
+
+
+def scan_changelog_headers(
+        lines: Iterable[bytes]) -> Iterator[ChangelogBlockHeader]:
+    """Scan the blocks in a changelog without parsing the changes.
+
+    Only the header and trailer lines of each block are looked at, so this
+    is much cheaper than parsing the changelog with debian.changelog.
+
+    Args:
+      lines: Lines of the changelog (e.g. a file opened in binary mode)
+    Returns:
+      iterator over ChangelogBlockHeader objects, newest first
+    """
+    for _start, _end, header in _scan_changelog(lines):
+        yield header
+
+
 def find_extra_authors(changes):
     """Find additional authors from a changelog entry.
 
@@ -584,40 +743,43 @@ def find_extra_authors(changes):
     """
     authors: List[str] = []
     for new_author, _linenos, _lines in changes_by_author(changes):
-        if new_author is None:
-            continue
-        already_included = False
-        for author in authors:
-            if author.startswith(new_author):
-                already_included = True
-                break
-        if not already_included:
-            authors.append(new_author)
+        if new_author is not None:
+            _add_author(authors, new_author)
     return authors
 
 
+def _add_author(authors: List[str], new_author: str) -> None:
+    for author in authors:
+        if author.startswith(new_author):
+            return
+    authors.append(new_author)
+
+
+_THANKS_RE = re.compile(
+    r"[tT]hank(?:(?:s)|(?:you))(?:\s*to)?"
+    "((?:\\s+(?:(?:\\w\\.)|(?:\\w+(?:-\\w+)*)))+"
+    "(?:\\s+<[^@>]+@[^@>]+>)?)",
+    re.UNICODE)
+_WHITESPACE_RUN_RE = re.compile(r"\s+")
+
+
 def find_thanks(changes):
     """Find all people thanked in a changelog entry.
 
     :param changes: String with the contents of the changelog entry
     :return: List of people thanked, optionally including email address.
     """
-    thanks_re = re.compile(
-        r"[tT]hank(?:(?:s)|(?:you))(?:\s*to)?"
-        "((?:\\s+(?:(?:\\w\\.)|(?:\\w+(?:-\\w+)*)))+"
-        "(?:\\s+<[^@>]+@[^@>]+>)?)",
-        re.UNICODE)
     thanks: List[str] = []
     for _new_author, _linenos, lines in changes_by_author(changes):
-        for match in thanks_re.finditer(''.join(lines)):
-            if thanks is None:
-                thanks = []
-            thanks_str = match.group(1).strip()
-            thanks_str = re.sub(r"\s+", " ", thanks_str)
-            thanks.append(thanks_str)
+        thanks.extend(_find_thanks(''.join(lines)))
     return thanks
 
 
+def _find_thanks(text: str) -> Iterator[str]:
+    for match in _THANKS_RE.finditer(text):
+        yield _WHITESPACE_RUN_RE.sub(" ", match.group(1).strip())
+
+
 def upstream_merge_changelog_line(upstream_version: str) -> str:
     """Describe that a new upstream revision was merged.
 
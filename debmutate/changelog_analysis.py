@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Analysis of the changes in changelog blocks.
+
+The helpers in debmutate.changelog (changes_sections, find_extra_authors,
+find_thanks, all_sha_prefixed, ...) each walk the changes of a block
+separately. analyze_changes() walks the changes once and collects all of
+this information together, which matters when analyzing every block of
+many changelogs.
+"""
+
+__all__ = [
+    'ChangesAnalysis',
+    'analyze_changes',
+    'analyze_block',
+    'analyze_changelog',
+]
+
+import re
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from debian.changelog import ChangeBlock, Changelog
+
+from .changelog import (INITIAL_INDENT, _SHA_PREFIX_RE, _add_author,
+                        _find_thanks, changes_sections)
+
+# Same as the patterns used by ChangeBlock.bugs_closed and
+# ChangeBlock.lp_bugs_closed
+_CLOSES_RE = re.compile(
+    r'closes:\s*(?:bug)?\#?\s?\d+(?:,\s*(?:bug)?\#?\s?\d+)*',
+    re.IGNORECASE)
+_CLOSES_LP_RE = re.compile(r'lp:\s+\#\d+(?:,\s*\#\d+)*', re.IGNORECASE)
+_NUMBER_RE = re.compile(r'\d+')
+
+
+class ChangesAnalysis(NamedTuple):
+    """Information extracted from the changes in a changelog block."""
+
+    # (author, line numbers, entries) tuples, as from changes_sections
+    sections: List[
+        Tuple[Optional[str], List[int], List[List[Tuple[int, str]]]]]
+    # As find_extra_authors
+    authors: List[str]
+    # As find_thanks
+    thanks: List[str]
+    # As ChangeBlock.bugs_closed and ChangeBlock.lp_bugs_closed
+    bugs_closed: List[int]
+    lp_bugs_closed: List[int]
+    # As all_sha_prefixed
+    sha_prefixed: bool
+
+
+def _bugs_closed(pattern, text: str) -> List[int]:
+    return [int(bug) for m in pattern.finditer(text)
+            for bug in _NUMBER_RE.findall(m.group(0))]
+
+
+def analyze_changes(changes: List[str]) -> ChangesAnalysis:
+    """Analyze the changes from a changelog block.
+
+    Args:
+      changes: Change lines (as from ChangeBlock.changes())
+    Returns:
+      a ChangesAnalysis
+    """
+    sections = list(changes_sections(changes))
+    authors: List[str] = []
+    thanks: List[str] = []
+    sha_prefixed = 0
+    sha_unprefixed = 0
+    for (author, _linenos, entries) in sections:
+        if author is not None:
+            _add_author(authors, author)
+        for entry in entries:
+            lines = [line for (_lineno, line) in entry]
+            thanks.extend(_find_thanks(''.join(lines)))
+            for line in lines:
+                if line.startswith(INITIAL_INDENT):
+                    if _SHA_PREFIX_RE.match(line):
+                        sha_prefixed += 1
+                    else:
+                        sha_unprefixed += 1
+    text = ' '.join(changes)
+    return ChangesAnalysis(
+        sections, authors, thanks,
+        _bugs_closed(_CLOSES_RE, text), _bugs_closed(_CLOSES_LP_RE, text),
+        sha_prefixed > 0 and not sha_unprefixed)
+
+
+def analyze_block(block: ChangeBlock) -> ChangesAnalysis:
+    """Analyze the changes in a changelog block."""
+    return analyze_changes(block.changes())
+
+
+def analyze_changelog(
+        cl: Changelog) -> Iterator[Tuple[ChangeBlock, ChangesAnalysis]]:
+    """Analyze all blocks in a changelog.
+
+    Returns:
+      iterator over (block, analysis) tuples
+    """
+    for block in cl:
+        yield block, analyze_block(block)
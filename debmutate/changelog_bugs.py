@@ -0,0 +1,246 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Extraction and indexing of bugs closed in changelogs.
+
+This maps Debian bugs ("Closes: #123") and Launchpad bugs ("LP: #456") to
+the package versions that closed them. BugClosureIndex keeps the results for
+many changelogs on disk, so that re-indexing only processes changelogs that
+have changed.
+"""
+
+__all__ = [
+    'BugClosure',
+    'BugClosureIndex',
+    'iter_bug_closures',
+    'scan_bug_closures',
+]
+
+import hashlib
+import os
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from debian.changelog import Changelog
+
+from ._persist import JsonStore
+from .changelog import _scan_changelog
+from .changelog_analysis import _CLOSES_LP_RE, _CLOSES_RE, _bugs_closed
+
+INDEX_FORMAT_VERSION = 1
+
+DEBIAN = 'debian'
+LAUNCHPAD = 'launchpad'
+
+
+class BugClosure(NamedTuple):
+    """A bug closed by a changelog block."""
+
+    tracker: str
+    bug: int
+    package: str
+    version: str
+    date: Optional[str]
+
+
+def _closures(text: str, package: str, version: str,
+              date: Optional[str]) -> Iterator[BugClosure]:
+    for bug in _bugs_closed(_CLOSES_RE, text):
+        yield BugClosure(DEBIAN, bug, package, version, date)
+    for bug in _bugs_closed(_CLOSES_LP_RE, text):
+        yield BugClosure(LAUNCHPAD, bug, package, version, date)
+
+
+def iter_bug_closures(cl: Changelog) -> Iterator[BugClosure]:
+    """Iterate over the bugs closed in a parsed changelog.
+
+    Args:
+      cl: Changelog object
+    Returns:
+      iterator over BugClosure objects, newest block first
+    """
+    for block in cl:
+        yield from _closures(
+            ' '.join(block.changes()), block.package or '',
+            str(block.version),
+            block.date)
+
+
+def scan_bug_closures(content: bytes) -> Iterator[BugClosure]:
+    """Iterate over the bugs closed in raw changelog contents.
+
+    This does not parse the changelog with debian.changelog, and only
+    decodes one block at a time.
+
+    Args:
+      content: Changelog contents
+    Returns:
+      iterator over BugClosure objects, newest block first
+    """
+    for (start, end, header) in _scan_changelog(content.splitlines(True)):
+        text = content[start:end]
+        # Anything after the trailer (e.g. "Old Changelog:") is not part of
+        # the changes of the block
+        trailer = text.find(b'\n -- ')
+        if trailer != -1:
+            text = text[:trailer]
+        yield from _closures(
+            text.decode('utf-8', 'replace'), header.package, header.version,
+            header.date)
+
+
+def _file_stamp(path: str) -> Tuple[int, int]:
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size)
+
+
+class BugClosureIndex(JsonStore):
+    """Persistent index of bugs closed in a set of changelogs.
+
+    Changelogs are added under a key (e.g. the source package name or a
+    path). Bug closures are stored per content hash, so changelogs whose
+    contents have not changed are not scanned again, and identical
+    changelogs are only scanned once.
+    """
+
+    _format_version = INDEX_FORMAT_VERSION
+
+    # key -> (content hash, file stamp)
+    _files: Dict[str, Tuple[str, Optional[Tuple[int, int]]]]
+    _closures: Dict[str, List[BugClosure]]
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._files = {}
+        self._closures = {}
+        self._bugs: Optional[Dict[Tuple[str, int], List[str]]] = None
+        super().__init__(path)
+
+    def _load(self, data) -> None:
+        for key, (content_hash, stamp) in data['files'].items():
+            self._files[key] = (
+                content_hash, tuple(stamp) if stamp else None)  # type: ignore
+        for content_hash, closures in data['closures'].items():
+            self._closures[content_hash] = [
+                BugClosure(*closure) for closure in closures]
+
+    def _dump(self):
+        used = {content_hash for (content_hash, _) in self._files.values()}
+        return {
+            'files': self._files,
+            'closures': {
+                content_hash: [list(closure) for closure in closures]
+                for content_hash, closures in self._closures.items()
+                if content_hash in used},
+        }
+
+    def update(self, key: str, content: bytes,
+               stamp: Optional[Tuple[int, int]] = None) -> bool:
+        """Update the index for a changelog.
+
+        Args:
+          key: Key to store the changelog under
+          content: Changelog contents
+          stamp: Optional file stamp, used by update_file
+        Returns:
+          whether the changelog had to be scanned
+        """
+        content_hash = hashlib.sha256(content).hexdigest()
+        old = self._files.get(key)
+        if old is None or old[0] != content_hash or old[1] != stamp:
+            self._files[key] = (content_hash, stamp)
+            self._bugs = None
+            self._dirty = True
+        if content_hash in self._closures:
+            return False
+        self._closures[content_hash] = list(scan_bug_closures(content))
+        return True
+
+    def update_file(self, path: str, key: Optional[str] = None) -> bool:
+        """Update the index for a changelog file.
+
+        The file is only read if its modification time or size changed.
+
+        Args:
+          path: Path to the changelog file
+          key: Key to store the changelog under (defaults to the path)
+        Returns:
+          whether the changelog had to be scanned
+        """
+        if key is None:
+            key = path
+        stamp = _file_stamp(path)
+        old = self._files.get(key)
+        if old is not None and old[1] == stamp:
+            return False
+        with open(path, 'rb') as f:
+            content = f.read()
+        return self.update(key, content, stamp)
+
+    def update_files(self, paths: Iterable[str]) -> int:
+        """Update the index for many changelog files.
+
+        Returns:
+          number of changelogs that had to be scanned
+        """
+        return sum(1 for path in paths if self.update_file(path))
+
+    def remove(self, key: str) -> None:
+        """Remove a changelog from the index."""
+        del self._files[key]
+        self._bugs = None
+        self._dirty = True
+
+    def keys(self) -> List[str]:
+        return list(self._files)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._files
+
+    def closures(self, key: str) -> List[BugClosure]:
+        """Return the bug closures for a changelog.
+
+        Raises:
+          KeyError: if the changelog is not in the index
+        """
+        return self._closures[self._files[key][0]]
+
+    def __iter__(self) -> Iterator[Tuple[str, BugClosure]]:
+        """Iterate over all (key, closure) tuples."""
+        for key, (content_hash, _) in self._files.items():
+            for closure in self._closures[content_hash]:
+                yield key, closure
+
+    def lookup(self, bug: int,
+               tracker: str = DEBIAN) -> List[Tuple[str, BugClosure]]:
+        """Find the changelogs that close a bug.
+
+        Args:
+          bug: Bug number
+          tracker: Bug tracker ('debian' or 'launchpad')
+        Returns:
+          list of (key, closure) tuples
+        """
+        if self._bugs is None:
+            self._bugs = {}
+            for key, closure in self:
+                self._bugs.setdefault(
+                    (closure.tracker, closure.bug), []).append(key)
+        ret = []
+        for key in dict.fromkeys(self._bugs.get((tracker, bug), [])):
+            for closure in self.closures(key):
+                if closure.tracker == tracker and closure.bug == bug:
+                    ret.append((key, closure))
+        return ret
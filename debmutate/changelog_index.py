@@ -0,0 +1,226 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Index of the blocks in a changelog file.
+
+Parsing a long changelog completely is expensive, while most consumers only
+need a handful of blocks ("the block for version X", "all uploads to
+experimental"). The index in this module only looks at the header and
+trailer lines of each block and records where every block starts, so that
+blocks can be looked up quickly and parsed individually.
+"""
+
+__all__ = [
+    'ChangelogIndex',
+    'load_changelog_index',
+]
+
+import bisect
+import hashlib
+import json
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+from debian.changelog import ChangeBlock, Changelog, Version
+
+from ._persist import check_format_version, save_json
+from .changelog import (ChangelogBlockHeader, _scan_changelog,
+                        distribution_is_unreleased)
+from .versions import version_sort_key
+
+INDEX_FORMAT_VERSION = 2
+
+
+def _content_hash(content: bytes) -> str:
+    return hashlib.sha256(content).hexdigest()
+
+
+class ChangelogIndex:
+    """Index of the blocks in a changelog.
+
+    Blocks are numbered like in debian.changelog.Changelog, i.e. the newest
+    block first.
+    """
+
+    def __init__(self, headers: List[ChangelogBlockHeader],
+                 spans: List[Tuple[int, int]], content_hash: str,
+                 content: Optional[bytes] = None) -> None:
+        self.headers = headers
+        self._spans = spans
+        self.content_hash = content_hash
+        self._content = content
+        self._blocks: Dict[int, ChangeBlock] = {}
+        self._versions = sorted(
+            (version_sort_key(h.version), i) for i, h in enumerate(headers))
+        self._distributions: Dict[str, List[int]] = {}
+        for i, header in enumerate(headers):
+            for distribution in header.distributions.split():
+                self._distributions.setdefault(distribution, []).append(i)
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> 'ChangelogIndex':
+        """Build an index for changelog contents."""
+        headers = []
+        spans = []
+        for (start, end, header) in _scan_changelog(content.splitlines(True)):
+            headers.append(header)
+            spans.append((start, end))
+        return cls(headers, spans, _content_hash(content), content)
+
+    @classmethod
+    def from_file(cls, path: str = 'debian/changelog') -> 'ChangelogIndex':
+        with open(path, 'rb') as f:
+            return cls.from_bytes(f.read())
+
+    def __len__(self) -> int:
+        return len(self.headers)
+
+    def __getitem__(self, i: int) -> ChangelogBlockHeader:
+        return self.headers[i]
+
+    def __iter__(self) -> Iterator[ChangelogBlockHeader]:
+        return iter(self.headers)
+
+    def span(self, i: int) -> Tuple[int, int]:
+        """Return the start and end offset of a block."""
+        return self._spans[i]
+
+    def find_version(self, version: Union[str, Version]) -> Optional[int]:
+        """Find the block for a version.
+
+        Args:
+          version: Version to look for
+        Returns:
+          index of the (newest) block with the version, or None
+        """
+        key = version_sort_key(version)
+        i = bisect.bisect_left(self._versions, (key, -1))
+        if i < len(self._versions) and self._versions[i][0] == key:
+            return self._versions[i][1]
+        return None
+
+    def find_distribution(self, distribution: str) -> List[int]:
+        """Find the blocks that target a distribution.
+
+        Returns:
+          list of block indexes, newest first
+        """
+        return list(self._distributions.get(distribution, []))
+
+    def last_released(self) -> Optional[int]:
+        """Find the newest block that is not UNRELEASED."""
+        for i, header in enumerate(self.headers):
+            if not distribution_is_unreleased(
+                    header.distributions.split(' ')[0]):
+                return i
+        return None
+
+    def last_distribution(self) -> Optional[str]:
+        """Find the last distribution that was uploaded to.
+
+        See debmutate.changelog.find_last_distribution.
+        """
+        i = self.last_released()
+        if i is None:
+            return None
+        return self.headers[i].distributions.split(' ')[0]
+
+    def attach(self, content: bytes) -> None:
+        """Attach the changelog contents, e.g. after loading from disk.
+
+        Raises:
+          ValueError: if the contents do not match the index
+        """
+        if _content_hash(content) != self.content_hash:
+            raise ValueError('changelog contents do not match index')
+        self._content = content
+        self._blocks = {}
+
+    def block_bytes(self, i: int) -> bytes:
+        """Return the raw text of a block."""
+        if self._content is None:
+            raise ValueError('no changelog contents attached')
+        start, end = self._spans[i]
+        return self._content[start:end]
+
+    def block(self, i: int) -> ChangeBlock:
+        """Parse a single block.
+
+        Blocks are parsed on first access and then cached.
+        """
+        try:
+            return self._blocks[i]
+        except KeyError:
+            pass
+        cl = Changelog()
+        cl.parse_changelog(
+            self.block_bytes(i), max_blocks=1, allow_empty_author=True,
+            strict=False)
+        self._blocks[i] = block = cl[0]
+        return block
+
+    def to_json(self):
+        return {
+            'version': INDEX_FORMAT_VERSION,
+            'sha256': self.content_hash,
+            'headers': [list(header) for header in self.headers],
+            'spans': [list(span) for span in self._spans],
+        }
+
+    @classmethod
+    def from_json(cls, data) -> 'ChangelogIndex':
+        check_format_version(data, INDEX_FORMAT_VERSION)
+        return cls(
+            [ChangelogBlockHeader(*header) for header in data['headers']],
+            [(start, end) for (start, end) in data['spans']],
+            data['sha256'])
+
+    def save(self, path: str) -> None:
+        """Write the index to disk."""
+        save_json(path, self.to_json())
+
+
+def load_changelog_index(
+        path: str = 'debian/changelog',
+        index_path: Optional[str] = None) -> ChangelogIndex:
+    """Load the index for a changelog file.
+
+    If a persisted index exists at index_path and matches the current
+    contents of the changelog, it is reused; otherwise a new index is built
+    (and written to index_path, if specified).
+
+    Args:
+      path: Path to the changelog file
+      index_path: Optional path to persist the index at
+    Returns:
+      a ChangelogIndex with the changelog contents attached
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    if index_path is not None:
+        try:
+            with open(index_path) as f:
+                index = ChangelogIndex.from_json(json.load(f))
+        except (FileNotFoundError, ValueError, KeyError, TypeError):
+            pass
+        else:
+            if index.content_hash == _content_hash(content):
+                index.attach(content)
+                return index
+    index = ChangelogIndex.from_bytes(content)
+    if index_path is not None:
+        index.save(index_path)
+    return index
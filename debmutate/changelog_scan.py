@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Extraction of changelog metadata for many packages.
+
+This runs debmutate.changelog.scan_changelog_headers over a large number of
+changelog files in parallel, e.g. to gather statistics about uploads
+across an archive.
+"""
+
+__all__ = [
+    'ChangelogScanResult',
+    'scan_changelog_file',
+    'scan_changelog_files',
+    'write_changelog_csv',
+]
+
+import csv
+import gzip
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, NamedTuple, Optional, TextIO
+
+from .changelog import ChangelogBlockHeader, scan_changelog_headers
+
+CSV_FIELDS = ('path', ) + ChangelogBlockHeader._fields
+
+
+class ChangelogScanResult(NamedTuple):
+    """Result of scanning a single changelog file."""
+
+    path: str
+    headers: Optional[List[ChangelogBlockHeader]]
+    error: Optional[str]
+
+
+def scan_changelog_file(path: str) -> List[ChangelogBlockHeader]:
+    """Scan the block headers in a changelog file.
+
+    Args:
+      path: Path to the changelog file; files ending in .gz are
+        decompressed
+    """
+    if path.endswith('.gz'):
+        with gzip.open(path, 'rb') as f:
+            return list(scan_changelog_headers(f))
+    with open(path, 'rb') as f:
+        return list(scan_changelog_headers(f))
+
+
+def _scan_one(path: str) -> ChangelogScanResult:
+    try:
+        headers = scan_changelog_file(path)
+    except (OSError, UnicodeDecodeError, EOFError) as e:
+        return ChangelogScanResult(path, None, str(e))
+    return ChangelogScanResult(path, headers, None)
+
+
+def scan_changelog_files(
+        paths: Iterable[str], max_workers: Optional[int] = None,
+        chunksize: int = 32) -> Iterator[ChangelogScanResult]:
+    """Scan many changelog files in parallel.
+
+    Args:
+      paths: Paths of the changelog files
+      max_workers: Number of worker processes (defaults to the number of
+        CPUs); 1 scans in the current process
+      chunksize: Number of files to hand to a worker at a time
+    Returns:
+      iterator over ChangelogScanResult objects, in the order of paths
+    """
+    if max_workers == 1:
+        yield from map(_scan_one, paths)
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(_scan_one, paths, chunksize=chunksize)
+
+
+def write_changelog_csv(
+        f: TextIO, results: Iterable[ChangelogScanResult]) -> int:
+    """Write changelog metadata as CSV, with one row per block.
+
+    Files that could not be scanned are logged and skipped.
+
+    Args:
+      f: File to write to
+      results: Scan results (see scan_changelog_files)
+    Returns:
+      number of rows written
+    """
+    writer = csv.writer(f)
+    writer.writerow(CSV_FIELDS)
+    rows = 0
+    for result in results:
+        if result.headers is None:
+            logging.warning('Unable to scan %s: %s', result.path, result.error)
+            continue
+        for header in result.headers:
+            writer.writerow((result.path, ) + tuple(header))
+            rows += 1
+    return rows
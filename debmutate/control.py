@@ -36,6 +36,8 @@ __all__ = [
     'delete_from_list',
     'is_dep_implied',
     'is_relation_implied',
+    'simplify_relations',
+    'VersionInterval',
     'parse_standards_version',
     'PkgRelationFieldEditor',
     ]
@@ -46,18 +48,20 @@ import operator
 import os
 import re
 import subprocess
-import time
 import warnings
 from itertools import takewhile
-from typing import (Callable, ContextManager, Dict, Iterable, List, Optional,
-                    Tuple, Union)
+from typing import (Callable, Container, ContextManager, Dict, Iterable,
+                    List, NamedTuple, Optional, Set, Tuple, Union)
 
 from debian.changelog import Version
 
+from ._cache import FileCache, optional_file_stamp
 from ._deb822 import PkgRelation
+from ._rules import RulesTree
 from .deb822 import (ChangeConflict, Deb822Editor, Deb822Paragraph,
                      parse_deb822_file)
 from .reformatting import GeneratedFile
+from .versions import version_sort_key
 
 # TODO(jelmer): dedupe with scripts/wrap-and-sort in devscripts
 CONTROL_LIST_FIELDS = (
@@ -178,30 +182,65 @@ def pg_buildext_updatecontrol(path: str = '.') -> None:
         raise TemplateExpandCommandMissing("pg_buildext") from e
 
 
+def _rules_generates_control(rules: RulesTree) -> bool:
+    for rule in rules.iter_rules():
+        if b'debian/control' in rule.targets:
+            return True
+        if (b'debian/%' in rule.targets
+                and b'debian/%.in' in rule.prerequisites):
+            return True
+    return rules.includes_path(b'/usr/share/blends-dev/rules')
+
+
+_template_type_cache: FileCache[Optional[str]] = FileCache(maxsize=128)
+
+
 def guess_template_type(
         template_path: str,
         debian_path: Optional[str] = None) -> Optional[str]:
     """Guess the type for a control template.
 
+    Results are cached until the template, debian/rules or
+    debian/debcargo.toml change.
+
     Args:
       template_path: Template path
       debian_path: Path to debian directory
     Returns:
       Name of template type; None if unknown
     """
-    # TODO(jelmer): This should use a proper make file parser of some sort..
+    paths = [template_path]
+    if debian_path is not None:
+        paths.append(os.path.join(debian_path, 'rules'))
+        paths.append(os.path.join(debian_path, 'debcargo.toml'))
+    key = (os.path.abspath(template_path),
+           os.path.abspath(debian_path) if debian_path is not None else None)
+    stamp = tuple(optional_file_stamp(p) for p in paths)
+    try:
+        return _template_type_cache.lookup(key, stamp)
+    except KeyError:
+        pass
+    template_type = _guess_template_type(template_path, debian_path)
+    _template_type_cache.store(key, stamp, template_type)
+    return template_type
+
+
+def _guess_template_type(
+        template_path: str,
+        debian_path: Optional[str] = None) -> Optional[str]:
     if debian_path is not None:
         try:
             with open(os.path.join(debian_path, 'rules'), 'rb') as f:
-                for line in f:
-                    if line.startswith(b'debian/control:'):
-                        return 'rules'
-                    if line.startswith(b'debian/%: debian/%.in'):
-                        return 'rules'
-                    if line.startswith(b'include /usr/share/blends-dev/rules'):
-                        return 'rules'
+                rules = f.read()
         except FileNotFoundError:
             pass
+        else:
+            # Only parse rules files that could possibly generate
+            # debian/control
+            if ((b'debian/control' in rules or b'debian/%' in rules
+                    or b'/usr/share/blends-dev/rules' in rules)
+                    and _rules_generates_control(RulesTree.from_bytes(rules))):
+                return 'rules'
     try:
         with open(template_path, 'rb') as f:
             template = f.read()
@@ -211,7 +250,7 @@ def guess_template_type(
                 return 'cdbs'
             elif b'PGVERSION' in template:
                 return 'postgresql'
-            else:
+            elif b'gnome-pkg-tools' in template or b'cdbs' in template:
                 try:
                     deb822 = next(iter(
                         parse_deb822_file(
@@ -249,29 +288,180 @@ def _cdbs_resolve_conflict(
             return actual_new_value.replace(
                 actual_old_value, template_old_value)
         else:
-            existing = [v[1] for v in parse_relations(actual_old_value)]
-            ret = template_old_value
+            existing: Dict[str, List[List[PkgRelation]]] = {}
+            for _, r, _ in parse_relations(actual_old_value):
+                for name in {dep.name for dep in r}:
+                    existing.setdefault(name, []).append(r)
+            relations = parse_relations(template_old_value)
+            added: Set[str] = set()
             for _, v, _ in parse_relations(actual_new_value):
-                if any(is_relation_implied(v, r) for r in existing):
+                if not v or any(
+                        is_relation_implied(v, r)
+                        for dep in v for r in existing.get(dep.name, [])):
                     continue
-                ret = ensure_relation(ret, v)
-            return ret
+                _add_relation(relations, v)
+                added.update(dep.name for dep in v)
+            if not added:
+                return template_old_value
+            return simplify_relations(
+                format_relations(relations), packages=added)
     raise ChangeConflict(
         para_key, field, actual_old_value, template_old_value,
         actual_new_value)
 
 
+_TEMPLATE_VARIABLE_RE = re.compile(r'(@[A-Za-z0-9_-]+@)')
+_PARAGRAPH_SEPARATOR_RE = re.compile(r'\n{2,}')
+
+
+def _learn_template_substitutions(
+        template: str, expanded: str) -> Optional[Dict[str, str]]:
+    """Learn the values of @VARIABLE@ placeholders from an expanded template.
+
+    Args:
+      template: Template text
+      expanded: Text that was generated from the template
+    Returns:
+      dictionary mapping placeholders to values, or None if the
+      expanded text can not be generated from the template by simple
+      substitution
+    """
+    groups: Dict[str, str] = {}
+    pattern = []
+    for i, part in enumerate(_TEMPLATE_VARIABLE_RE.split(template)):
+        if i % 2 == 0:
+            pattern.append(re.escape(part))
+        elif part in groups:
+            pattern.append('(?P=%s)' % groups[part])
+        else:
+            groups[part] = 'v%d' % len(groups)
+            pattern.append('(?P<%s>.*?)' % groups[part])
+    m = re.fullmatch(''.join(pattern), expanded, re.DOTALL)
+    if m is None:
+        return None
+    return {var: m.group(name) for (var, name) in groups.items()}
+
+
+def _expand_template_substitutions(
+        template: str, substitutions: Dict[str, str]) -> str:
+    """Expand @VARIABLE@ placeholders.
+
+    Raises:
+      KeyError: if the template contains an unknown placeholder
+    """
+    return _TEMPLATE_VARIABLE_RE.sub(
+        lambda m: substitutions[m.group(0)], template)
+
+
+def _learn_pgversions(template: str, expanded: str) -> Optional[List[str]]:
+    """Learn the PostgreSQL versions a template was expanded for."""
+    for paragraph in _PARAGRAPH_SEPARATOR_RE.split(template.strip('\n')):
+        if 'PGVERSION' not in paragraph:
+            continue
+        parts = paragraph.split('PGVERSION')
+        pattern = (
+            re.escape(parts[0]) + '(?P<version>[0-9.]+)' + re.escape(parts[1])
+            + ''.join('(?P=version)' + re.escape(part)
+                      for part in parts[2:]))
+        return [m.group('version') for m in re.finditer(pattern, expanded)]
+    return None
+
+
+def _expand_pgversions(template: str, versions: List[str]) -> str:
+    paragraphs = []
+    for paragraph in _PARAGRAPH_SEPARATOR_RE.split(template.strip('\n')):
+        if 'PGVERSION' in paragraph:
+            paragraphs.extend(
+                [paragraph.replace('PGVERSION', version)
+                 for version in versions])
+        else:
+            paragraphs.append(paragraph)
+    return '\n\n'.join(paragraphs) + '\n'
+
+
+def _expand_control_template_natively(
+        template_type: str, old_template: str, template: str,
+        expanded: str) -> Optional[str]:
+    """Expand a template without running external tools.
+
+    This works by finding out how the previous version of the template was
+    expanded and then applying the same expansion to the new template.
+
+    Args:
+      template_type: Template type
+      old_template: Previous template contents
+      template: New template contents
+      expanded: Current contents of the file generated from the old
+        template
+    Returns:
+      expanded new template, or None if it could not be expanded
+    """
+    if template_type in ('rules', 'gnome'):
+        substitutions = _learn_template_substitutions(old_template, expanded)
+        if substitutions is None:
+            return None
+        try:
+            return _expand_template_substitutions(template, substitutions)
+        except KeyError:
+            return None
+    if template_type == 'postgresql':
+        versions = _learn_pgversions(old_template, expanded)
+        if not versions or (
+                _expand_pgversions(old_template, versions) != expanded):
+            return None
+        return _expand_pgversions(template, versions)
+    return None
+
+
+def _changelog_changed_since(path: str) -> bool:
+    """Check whether debian/changelog was modified after a file."""
+    changelog_path = os.path.join(os.path.dirname(path), 'changelog')
+    try:
+        changelog_mtime = os.stat(changelog_path).st_mtime_ns
+    except FileNotFoundError:
+        return False
+    try:
+        return changelog_mtime > os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return True
+
+
 def _expand_control_template(
-        template_path: str, path: str, template_type: str):
+        template_path: str, path: str, template_type: str,
+        old_template: Optional[str] = None):
+    # dh_gnome_clean expands @GNOME_TEAM@ to the team members that uploaded
+    # recent changelog entries, which needs the team list that ships with
+    # gnome-pkg-tools. The previous expansion is only reused if the
+    # changelog has not changed since; otherwise dh_gnome_clean is run to
+    # recompute Uploaders.
+    if old_template is not None and not (
+            template_type == 'gnome' and _changelog_changed_since(path)):
+        try:
+            with open(path) as f:
+                expanded = f.read()
+            with open(template_path) as f:
+                template = f.read()
+        except FileNotFoundError:
+            pass
+        else:
+            result = _expand_control_template_natively(
+                template_type, old_template, template, expanded)
+            if result is not None:
+                with open(path, 'w') as f:
+                    f.write(result)
+                return
     package_root = os.path.dirname(os.path.dirname(path)) or '.'
     if template_type == 'rules':
         try:
-            path_mtime = os.stat(path).st_mtime
+            st = os.stat(path)
         except FileNotFoundError:
-            path_mtime = None
-        while os.stat(template_path).st_mtime == path_mtime:
-            # Wait until mtime has changed, so that make knows to regenerate.
-            os.utime(template_path, (time.time(), time.time()))
+            pass
+        else:
+            # Make sure make considers the generated file out of date.
+            template_mtime = os.stat(template_path).st_mtime_ns
+            if st.st_mtime_ns >= template_mtime:
+                os.utime(path, ns=(
+                    st.st_atime_ns, template_mtime - 1000000000))
         try:
             subprocess.check_call(
                 ['./debian/rules', 'debian/control'],
@@ -299,6 +489,15 @@ def _update_control_template(
     if template_type == 'directory':
         # We can't handle these yet
         raise GeneratedFile(path, template_path)
+    old_template: Optional[str]
+    # cdbs templates are not expanded at all: @cdbs@ is substituted at
+    # build time with dependencies computed by cdbs, so the changes are
+    # applied to both the template and the generated file instead.
+    if expand_template and template_type != 'cdbs':
+        with open(template_path) as f:
+            old_template = f.read()
+    else:
+        old_template = None
     with Deb822Editor(
             template_path, accept_files_with_error_tokens=True) as updater:
         resolve_conflict: Optional[Callable[[
@@ -318,7 +517,8 @@ def _update_control_template(
             with Deb822Editor(path, allow_generated=True) as updater:
                 updater.apply_changes(changes)
         else:
-            _expand_control_template(template_path, path, template_type)
+            _expand_control_template(
+                template_path, path, template_type, old_template)
     return True
 
 
@@ -677,16 +877,14 @@ def ensure_minimum_version(
       updated relation string
     """
     def is_obsolete(relation):
-        for r in relation:
-            if r.name != package:
-                continue
-            if r.version[0] == '>>' and r.version[1] < minimum_version:
-                return True
-            if r.version[0] == '>=' and r.version[1] <= minimum_version:
-                return True
-        return False
+        return any(
+            r.name == package and minimum.issubset(
+                VersionInterval.from_constraint(r.version))
+            for r in relation)
 
     minimum_version = Version(minimum_version)
+    minimum_key = version_sort_key(minimum_version)
+    minimum = VersionInterval(lower=(str(minimum_version), True))
     found = False
     changed = False
     relations = parse_relations(relationstr)
@@ -702,7 +900,7 @@ def ensure_minimum_version(
             continue
         found = True
         if (relation[0].version is None or
-                Version(relation[0].version[1]) < minimum_version):
+                version_sort_key(relation[0].version[1]) < minimum_key):
             relation[0].version = ('>=', minimum_version)
             changed = True
     if not found:
@@ -746,7 +944,8 @@ def ensure_exact_version(
         found = True
         if (relation[0].version is None or
                 (relation[0].version[0],
-                 Version(relation[0].version[1])) != ('=', version)):
+                 version_sort_key(relation[0].version[1])) != (
+                     '=', version_sort_key(version))):
             relation[0].version = ('=', version)
             changed = True
     if not found:
@@ -979,6 +1178,127 @@ def delete_from_list(
     return ','.join(items)
 
 
+def _tighter_bound(a, b, lower: bool):
+    if a is None:
+        return b
+    if b is None:
+        return a
+    akey = version_sort_key(a[0])
+    bkey = version_sort_key(b[0])
+    if akey != bkey:
+        return a if (akey > bkey) == lower else b
+    return a if (not a[1] or b[1]) else b
+
+
+def _looser_bound(a, b, lower: bool):
+    if a is None or b is None:
+        return None
+    akey = version_sort_key(a[0])
+    bkey = version_sort_key(b[0])
+    if akey != bkey:
+        return a if (akey < bkey) == lower else b
+    return a if (a[1] or not b[1]) else b
+
+
+class VersionInterval(NamedTuple):
+    """Range of versions allowed by one or more version constraints.
+
+    Bounds are (version, inclusive) tuples, or None if unbounded.
+    """
+
+    lower: Optional[Tuple[str, bool]] = None
+    upper: Optional[Tuple[str, bool]] = None
+
+    @classmethod
+    def from_constraint(
+            cls, version: Optional[Tuple[str, str]]) -> 'VersionInterval':
+        """Create an interval from a relation version constraint.
+
+        Args:
+          version: (operator, version) tuple, as in PkgRelation.version, or
+            None for an unversioned relation
+        Raises:
+          ValueError: if the operator is not known
+        """
+        if version is None:
+            return cls()
+        (op, v) = version
+        if op in ('>=', '>'):
+            return cls(lower=(v, True))
+        if op == '>>':
+            return cls(lower=(v, False))
+        if op in ('<=', '<'):
+            return cls(upper=(v, True))
+        if op == '<<':
+            return cls(upper=(v, False))
+        if op == '=':
+            return cls(lower=(v, True), upper=(v, True))
+        raise ValueError('unsupported version operator: %s' % op)
+
+    def is_empty(self) -> bool:
+        """Check whether no version satisfies this interval."""
+        if self.lower is None or self.upper is None:
+            return False
+        lower_key = version_sort_key(self.lower[0])
+        upper_key = version_sort_key(self.upper[0])
+        if lower_key != upper_key:
+            return lower_key > upper_key
+        return not (self.lower[1] and self.upper[1])
+
+    def intersection(self, other: 'VersionInterval') -> 'VersionInterval':
+        """Return the versions that are in both intervals."""
+        return VersionInterval(
+            _tighter_bound(self.lower, other.lower, True),
+            _tighter_bound(self.upper, other.upper, False))
+
+    def union(self, other: 'VersionInterval') -> Optional['VersionInterval']:
+        """Return the versions that are in either interval.
+
+        Returns:
+          the union, or None if it is not a single interval
+        """
+        if self.is_empty():
+            return other
+        if other.is_empty():
+            return self
+        if self.intersection(other).is_empty():
+            for (a, b) in ((self, other), (other, self)):
+                if (a.upper is not None and b.lower is not None
+                        and (a.upper[1] or b.lower[1])
+                        and version_sort_key(a.upper[0])
+                        == version_sort_key(b.lower[0])):
+                    break
+            else:
+                return None
+        return VersionInterval(
+            _looser_bound(self.lower, other.lower, True),
+            _looser_bound(self.upper, other.upper, False))
+
+    def issubset(self, other: 'VersionInterval') -> bool:
+        """Check whether all versions in this interval are in another."""
+        if self.is_empty():
+            return True
+        return self.intersection(other) == self
+
+    def constraints(self) -> List[Tuple[str, str]]:
+        """Return the version constraints for this interval.
+
+        Returns:
+          list of (operator, version) tuples; empty if unbounded
+        """
+        if (self.lower is not None and self.upper is not None
+                and self.lower[1] and self.upper[1]
+                and version_sort_key(self.lower[0])
+                == version_sort_key(self.upper[0])):
+            return [('=', self.lower[0])]
+        ret = []
+        if self.lower is not None:
+            ret.append(('>=' if self.lower[1] else '>>', self.lower[0]))
+        if self.upper is not None:
+            ret.append(('<=' if self.upper[1] else '<<', self.upper[0]))
+        return ret
+
+
 def is_dep_implied(dep: PkgRelation, outer: PkgRelation) -> bool:
     """Check if one dependency is implied by another.
 
@@ -986,53 +1306,16 @@ def is_dep_implied(dep: PkgRelation, outer: PkgRelation) -> bool:
     """
     if dep.name != outer.name:
         return False
-    if not dep.version:
-        return True
-    if outer.version == dep.version:
+    if not dep.version or outer.version == dep.version:
         return True
-    if not outer.version:
+    if (outer.version is not None and outer.version[0] == '>>'
+            and dep.version[0] == '>='
+            and version_sort_key(outer.version[1])
+            == version_sort_key(dep.version[1])):
+        # "foo (>> 1)" has never been considered to imply "foo (>= 1)"
         return False
-    if dep.version[0] == '>=':
-        if outer.version[0] == '>>':
-            return Version(outer.version[1]) > Version(dep.version[1])
-        elif outer.version[0] in ('>=', '='):
-            return Version(outer.version[1]) >= Version(dep.version[1])
-        elif outer.version[0] in ('<<', '<='):
-            return False
-        else:
-            raise AssertionError('unsupported: %s' % outer.version[0])
-    elif dep.version[0] == '=':
-        if outer.version[0] == '=':
-            return Version(outer.version[1]) == Version(dep.version[1])
-        else:
-            return False
-    elif dep.version[0] == '<<':
-        if outer.version[0] == '<<':
-            return Version(outer.version[1]) <= Version(dep.version[1])
-        if outer.version[0] in ('<=', '='):
-            return Version(outer.version[1]) < Version(dep.version[1])
-        elif outer.version[0] in ('>>', '>='):
-            return False
-        else:
-            raise AssertionError('unsupported: %s' % outer.version[0])
-    elif dep.version[0] == '<=':
-        if outer.version[0] in ('<=', '=', '<<'):
-            return Version(outer.version[1]) <= Version(dep.version[1])
-        elif outer.version[0] in ('>>', '>='):
-            return False
-        else:
-            raise AssertionError('unsupported: %s' % outer.version[0])
-    elif dep.version[0] == '>>':
-        if outer.version[0] == '>>':
-            return Version(outer.version[1]) >= Version(dep.version[1])
-        elif outer.version[0] in ('=', '>='):
-            return Version(outer.version[1]) > Version(dep.version[1])
-        elif outer.version[0] in ('<<', '<='):
-            return False
-        else:
-            raise AssertionError('unsupported: %s' % outer.version[0])
-    else:
-        raise AssertionError('unable to handle checks for %s' % dep.version[0])
+    return VersionInterval.from_constraint(outer.version).issubset(
+        VersionInterval.from_constraint(dep.version))
 
 
 def is_relation_implied(
@@ -1065,6 +1348,82 @@ def is_relation_implied(
     return False
 
 
+def _relation_group_key(dep: PkgRelation) -> Tuple[str, str, str]:
+    # Only relations with the same qualifiers can be merged
+    return (dep.name, dep.archqual or '',
+            PkgRelation(dep.name, None, dep.arch, None,
+                        dep.restrictions).str())
+
+
+def simplify_relations(
+        relationstr: str, packages: Optional[Container[str]] = None) -> str:
+    """Merge relations on the same package and drop redundant relations.
+
+    Relations without alternatives on the same package (and with the same
+    architecture and build profile restrictions) are merged into a single
+    relation with the intersection of their version constraints, at the
+    position of the first of them. Relations with alternatives that are
+    implied by those are dropped. Conflicting constraints are left alone.
+
+    Args:
+      relationstr: package relation string
+      packages: Optional names of the packages to simplify the relations
+        for; relations on other packages are left untouched
+    Returns:
+      updated relation string
+    """
+    relations = parse_relations(relationstr)
+    groups: Dict[Tuple[str, str, str], List[int]] = {}
+    for i, (_head_whitespace, relation, _tail_whitespace) in enumerate(
+            relations):
+        if len(relation) == 1 and not relation[0].name.startswith('${') and (
+                packages is None or relation[0].name in packages):
+            groups.setdefault(
+                _relation_group_key(relation[0]), []).append(i)
+    drop = set()
+    changed = False
+    implied: Dict[str, VersionInterval] = {}
+    for key, indices in groups.items():
+        interval = VersionInterval()
+        for i in indices:
+            interval = interval.intersection(
+                VersionInterval.from_constraint(relations[i][1][0].version))
+        if interval.is_empty():
+            continue
+        first = relations[indices[0]][1][0]
+        if (first.arch, first.archqual, first.restrictions) == (
+                None, None, None):
+            implied[first.name] = interval
+        if len(indices) == 1:
+            continue
+        constraints: List[Optional[Tuple[str, str]]] = list(
+            interval.constraints()) or [None]
+        for i, version in zip(indices, constraints):
+            (head_whitespace, relation, tail_whitespace) = relations[i]
+            new_relation = [PkgRelation(
+                first.name, version, first.arch, first.archqual,
+                first.restrictions)]
+            if new_relation != relation:
+                relations[i] = (head_whitespace, new_relation, tail_whitespace)
+                changed = True
+        drop.update(indices[len(constraints):])
+    for i, (_head_whitespace, relation, _tail_whitespace) in enumerate(
+            relations):
+        if len(relation) > 1 and any(
+                dep.name in implied and dep.arch is None
+                and dep.archqual is None and dep.restrictions is None
+                and implied[dep.name].issubset(
+                    VersionInterval.from_constraint(dep.version))
+                for dep in relation):
+            drop.add(i)
+    if not changed and not drop:
+        # Just return the original; we don't preserve all formatting yet.
+        return relationstr
+    dropped = {id(relations[i][1]) for i in drop}
+    return format_relations(filter_dependencies(
+        relations, lambda relation: id(relation) not in dropped))
+
+
 def parse_standards_version(v: str) -> Tuple[int, ...]:
     """Parse a standards version.
 
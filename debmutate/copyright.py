@@ -81,24 +81,27 @@ class CopyrightEditor(Editor[Copyright, str]):
 
 
 def upstream_fields_in_copyright(
-        path: str = 'debian/copyright') -> Dict[str, RestrictedField]:
+        path: str = 'debian/copyright',
+        copyright: Optional[Copyright] = None
+        ) -> Dict[str, RestrictedField]:
     """Extract upstream fields from a copyright file.
 
     Args:
       path: Copyright file to open
+      copyright: Already parsed copyright file to use instead of path
     Returns:
       Dictionary with Contact/Name keys
     """
     ret = {}
-    try:
-        with open(path) as f:
-            c = Copyright(f, strict=False)
-    except (ValueError, FileNotFoundError, NotMachineReadableError,
-            MachineReadableFormatError):
-        return {}
-    else:
-        if c.header.upstream_contact:
-            ret['Contact'] = c.header.upstream_contact
-        if c.header.upstream_name:
-            ret['Name'] = c.header.upstream_name
+    if copyright is None:
+        try:
+            with open(path) as f:
+                copyright = Copyright(f, strict=False)
+        except (ValueError, FileNotFoundError, NotMachineReadableError,
+                MachineReadableFormatError):
+            return {}
+    if copyright.header.upstream_contact:
+        ret['Contact'] = copyright.header.upstream_contact
+    if copyright.header.upstream_name:
+        ret['Name'] = copyright.header.upstream_name
     return ret
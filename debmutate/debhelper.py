@@ -110,17 +110,28 @@ def get_debhelper_compat_level_from_control(control) -> Optional[int]:
         return int(str(relation.version[1]))
 
 
-def get_debhelper_compat_level(path: str = '.') -> Optional[int]:
+def get_debhelper_compat_level(
+        path: str = '.', control=None) -> Optional[int]:
+    """Determine the debhelper compat level.
+
+    Args:
+      path: Path to the package tree
+      control: Already parsed source paragraph of the control file; if
+        not specified, debian/control is read
+    Returns:
+      compat level, or None if it could not be determined
+    """
     try:
         return read_debhelper_compat_file(os.path.join(path, 'debian/compat'))
     except FileNotFoundError:
         pass
 
-    try:
-        with open(os.path.join(path, 'debian/control')) as f:
-            control = Deb822(f)
-    except FileNotFoundError:
-        return None
+    if control is None:
+        try:
+            with open(os.path.join(path, 'debian/control')) as f:
+                control = Deb822(f)
+        except FileNotFoundError:
+            return None
 
     return get_debhelper_compat_level_from_control(control)
 
@@ -286,12 +297,26 @@ class MaintscriptEditor(Editor[List[Union[str, MaintscriptEntry]], str]):
         return None
 
 
-def get_sequences(debian_path='debian', control_editor=None):
+def _sequences_from_source(source):
+    for _ws1, entry, _ws2 in parse_relations(
+            source.get('Build-Depends', '')):
+        for option in entry:
+            if option.name.startswith('dh-sequence-'):
+                yield option.name[len('dh-sequence-'):]
+
+
+def get_sequences(debian_path='debian', control_editor=None, source=None):
+    """Return the dh sequences enabled through dh-sequence-* dependencies.
+
+    Args:
+      debian_path: Path to the debian directory
+      control_editor: Control editor to use
+      source: Already parsed source paragraph to use
+    """
+    if source is not None:
+        yield from _sequences_from_source(source)
+        return
     if control_editor is None:
         control_editor = ControlEditor(os.path.join(debian_path, 'control'))
     with control_editor:
-        for _ws1, entry, _ws2 in parse_relations(
-                control_editor.source.get('Build-Depends', '')):
-            for option in entry:
-                if option.name.startswith('dh-sequence-'):
-                    yield option.name[len('dh-sequence-'):]
+        yield from _sequences_from_source(control_editor.source)
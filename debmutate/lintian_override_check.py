@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Detection of stale lintian overrides for many packages.
+
+This joins lintian output for a set of source packages with the overrides
+shipped in their debian/ directories, and reports overrides that no longer
+match any issue. The lintian output has to include overridden tags
+(lintian --show-overrides), since those are the ones the overrides are
+used for.
+"""
+
+__all__ = [
+    'StaleOverride',
+    'find_override_files',
+    'find_stale_overrides',
+    'parse_lintian_output',
+]
+
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from typing import (Dict, Iterable, Iterator, List, Mapping, NamedTuple,
+                    Optional, Tuple)
+
+from debian.deb822 import Deb822
+
+from .lintian_overrides import (LintianIssue, LintianOverride,
+                                load_lintian_overrides)
+
+UNUSED = 'unused'
+OUTDATED = 'outdated'
+
+_LINTIAN_LINE_RE = re.compile(
+    r'^[EWIPXOCM]: (?P<package>[a-z0-9][a-z0-9+.-]*)'
+    r'(?: (?P<type>source|binary|udeb|changes|buildinfo))?'
+    r'(?: (?P<arch>[a-z0-9-]+))?'
+    r': (?P<tag>\S+)(?: (?P<info>.*\S))?\s*$')
+
+
+class StaleOverride(NamedTuple):
+    """An override that does not match any issue reported by lintian."""
+
+    source: str
+    path: str
+    override: LintianOverride
+    # UNUSED if lintian did not report the tag at all, OUTDATED if it
+    # reported the tag with different information
+    reason: str
+
+
+def parse_lintian_output(lines: Iterable[str]) -> Iterator[LintianIssue]:
+    """Parse the issues from lintian output.
+
+    Explanations ("N:" lines) and other lines that are not issues are
+    skipped. Issues without an explicit package type are binary issues.
+
+    Args:
+      lines: Lines of lintian output
+    Returns:
+      iterator over LintianIssue objects
+    """
+    for line in lines:
+        m = _LINTIAN_LINE_RE.match(line)
+        if m is None:
+            continue
+        yield LintianIssue(
+            m.group('tag'), m.group('info'), m.group('package'),
+            m.group('type') or 'binary', m.group('arch'))
+
+
+def _first_binary(control_path: str) -> Optional[str]:
+    try:
+        with open(control_path) as f:
+            for paragraph in Deb822.iter_paragraphs(f):
+                if 'Package' in paragraph:
+                    return paragraph['Package']
+    except FileNotFoundError:
+        pass
+    return None
+
+
+def find_override_files(
+        source: str, path: str) -> List[Tuple[str, str, str]]:
+    """Find the lintian overrides files in a source tree.
+
+    Args:
+      source: Source package name
+      path: Path to the source tree
+    Returns:
+      list of (path, package, type) tuples, where type is 'source' for the
+      source package overrides and 'binary' otherwise
+    """
+    debian_path = os.path.join(path, 'debian')
+    ret = []
+    source_path = os.path.join(debian_path, 'source', 'lintian-overrides')
+    if os.path.exists(source_path):
+        ret.append((source_path, source, 'source'))
+    try:
+        names = sorted(os.listdir(debian_path))
+    except FileNotFoundError:
+        return ret
+    for name in names:
+        if name == 'lintian-overrides':
+            # dh_lintian installs this for the first binary package
+            package = _first_binary(os.path.join(debian_path, 'control'))
+        elif name.endswith('.lintian-overrides'):
+            package = name[:-len('.lintian-overrides')]
+        else:
+            continue
+        if package is not None:
+            ret.append((os.path.join(debian_path, name), package, 'binary'))
+    return ret
+
+
+class _CheckTask(NamedTuple):
+
+    source: str
+    files: List[Tuple[str, str, str]]
+    issues: List[LintianIssue]
+
+
+def _check_one(task: _CheckTask) -> List[StaleOverride]:
+    ret = []
+    for (path, package, kind) in task.files:
+        overrides = load_lintian_overrides(path)
+        issues = [
+            issue for issue in task.issues
+            if issue.package == package and (
+                (issue.type == 'source') == (kind == 'source'))]
+        usage = overrides.match_all(issues)
+        tags = {issue.tag for issue in issues}
+        for override in usage.unused:
+            if any(override.matches(tag=tag) for tag in tags):
+                reason = OUTDATED
+            else:
+                reason = UNUSED
+            ret.append(StaleOverride(task.source, path, override, reason))
+    return ret
+
+
+def find_stale_overrides(
+        trees: Mapping[str, str], lintian_output: Iterable[str],
+        max_workers: Optional[int] = None,
+        chunksize: int = 8) -> Iterator[StaleOverride]:
+    """Find stale overrides for a set of source packages.
+
+    The lintian output is read once and the issues are grouped by source
+    package; the overrides for each source package are then checked in
+    worker processes.
+
+    Args:
+      trees: Dictionary mapping source package names to source tree paths
+      lintian_output: Lines of lintian output for the source packages and
+        the binary packages built from them
+      max_workers: Number of worker processes (defaults to the number of
+        CPUs); 1 checks in the current process
+      chunksize: Number of source packages to hand to a worker at a time
+    Returns:
+      iterator over StaleOverride objects, in the order of trees
+    """
+    tasks: Dict[str, _CheckTask] = {}
+    # (package, is source) -> source package
+    owners: Dict[Tuple[Optional[str], bool], str] = {}
+    for source, path in trees.items():
+        files = find_override_files(source, path)
+        if not files:
+            continue
+        tasks[source] = _CheckTask(source, files, [])
+        for (_path, package, kind) in files:
+            owners[(package, kind == 'source')] = source
+    for issue in parse_lintian_output(lintian_output):
+        try:
+            source = owners[(issue.package, issue.type == 'source')]
+        except KeyError:
+            continue
+        tasks[source].issues.append(issue)
+    if max_workers == 1:
+        for result in map(_check_one, tasks.values()):
+            yield from result
+        return
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        for result in executor.map(
+                _check_one, tasks.values(), chunksize=chunksize):
+            yield from result
@@ -17,10 +17,12 @@
 
 """Utility functions for dealing with lintian overrides files."""
 
-import fnmatch
+import os
 import re
-from typing import List, Optional, Union
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Union
 
+from ._cache import FileCache, file_stamp
 from .reformatting import Editor
 
 # https://lintian.debian.org/manual/section-2.4.html
@@ -31,12 +33,32 @@ from .reformatting import Editor
 VALID_TYPES = ['udeb', 'source', 'binary']
 
 
+def _has_wildcard(value: str) -> bool:
+    return '*' in value
+
+
+@lru_cache(maxsize=4096)
 def _create_matcher(value):
-    if value:
-        p = re.compile(fnmatch.translate(value))
-        return lambda x: bool(p.match(x))
-    else:
+    if not value:
         return lambda x: True
+    if not _has_wildcard(value):
+        return value.__eq__
+    # Like lintian, only support '*' as wildcard; other characters
+    # (including the brackets around pointers) match literally.
+    p = re.compile(
+        '.*'.join(re.escape(part) for part in value.split('*')) + r'\Z',
+        re.DOTALL)
+    return lambda x: bool(p.match(x))
+
+
+class LintianIssue(NamedTuple):
+    """An issue reported by lintian."""
+
+    tag: str
+    info: Optional[str] = None
+    package: Optional[str] = None
+    type: Optional[str] = None
+    arch: Optional[str] = None
 
 
 class LintianOverride:
@@ -50,9 +72,21 @@ class LintianOverride:
             raise ValueError(type)
         self.type = type
         self.tag = tag
-        self._tag_match = _create_matcher(self.tag)
         self.info = info
-        self._info_match = _create_matcher(self.info)
+
+    @property
+    def archset(self) -> Optional[FrozenSet[str]]:
+        """The architecture list as a set, or None."""
+        if not self.archlist:
+            return None
+        return frozenset(self.archlist)
+
+    @property
+    def pointer(self) -> Optional['LintianPointer']:
+        """The pointer in the information, if any."""
+        if self.info is None:
+            return None
+        return parse_pointer(self.info)
 
     def __repr__(self):
         return (
@@ -70,10 +104,10 @@ class LintianOverride:
         if self.type is not None and type is not None and self.type != type:
             return False
         if (self.tag is not None and tag is not None
-                and not self._tag_match(tag)):
+                and not _create_matcher(self.tag)(tag)):
             return False
         if (self.info is not None and info is not None
-                and not self._info_match(info)):
+                and not _create_matcher(self.info)(info)):
             return False
         # TODO(jelmer): wildcards in the arch list?
         if self.archlist and arch is not None and arch not in self.archlist:
@@ -89,6 +123,98 @@ class LintianOverride:
                 and self.info == other.info)
 
 
+class OverrideUsage(NamedTuple):
+    """Result of matching a set of issues against overrides."""
+
+    used: List[LintianOverride]
+    unused: List[LintianOverride]
+    # Issues that are not overridden
+    unmatched: List[LintianIssue]
+
+
+class LintianOverrideSet:
+    """A set of overrides, indexed by tag.
+
+    Overrides with a plain tag are only considered for issues with that
+    tag; only overrides with a wildcard in their tag are checked against
+    every issue.
+
+    The set reflects the overrides at the time it was created; changes to
+    the overrides afterwards are not picked up.
+    """
+
+    def __init__(self, overrides: Iterable[LintianOverride]) -> None:
+        self.overrides = list(overrides)
+        self._by_tag: Dict[str, List[int]] = {}
+        self._wildcard: List[int] = []
+        self._archsets: List[Optional[FrozenSet[str]]] = []
+        for i, override in enumerate(self.overrides):
+            if override.tag and not _has_wildcard(override.tag):
+                self._by_tag.setdefault(override.tag, []).append(i)
+            else:
+                self._wildcard.append(i)
+            self._archsets.append(override.archset)
+
+    def __len__(self) -> int:
+        return len(self.overrides)
+
+    def _candidates(self, tag: Optional[str]) -> List[int]:
+        if tag is None:
+            return list(range(len(self.overrides)))
+        by_tag = self._by_tag.get(tag)
+        if not by_tag:
+            return self._wildcard
+        if not self._wildcard:
+            return by_tag
+        return sorted(by_tag + self._wildcard)
+
+    def _matches(self, i: int, issue: LintianIssue) -> bool:
+        archset = self._archsets[i]
+        if archset is not None and issue.arch is not None:
+            if issue.arch not in archset:
+                return False
+            issue = issue._replace(arch=None)
+        return self.overrides[i].matches(
+            package=issue.package, tag=issue.tag, info=issue.info,
+            type=issue.type, arch=issue.arch)
+
+    def find(self, issue: LintianIssue) -> Optional[LintianOverride]:
+        """Find the first override that matches an issue."""
+        for i in self._candidates(issue.tag):
+            if self._matches(i, issue):
+                return self.overrides[i]
+        return None
+
+    def __contains__(self, issue: object) -> bool:
+        if not isinstance(issue, LintianIssue):
+            return False
+        return self.find(issue) is not None
+
+    def match_all(self, issues: Iterable[LintianIssue]) -> OverrideUsage:
+        """Match a set of issues against the overrides.
+
+        Args:
+          issues: Issues reported by lintian
+        Returns:
+          an OverrideUsage with the overrides that matched at least one
+          issue, the overrides that matched none and the issues that
+          were not matched by any override
+        """
+        used = [False] * len(self.overrides)
+        unmatched = []
+        for issue in issues:
+            matched = False
+            for i in self._candidates(issue.tag):
+                if self._matches(i, issue):
+                    used[i] = matched = True
+            if not matched:
+                unmatched.append(issue)
+        return OverrideUsage(
+            [o for (o, u) in zip(self.overrides, used) if u],
+            [o for (o, u) in zip(self.overrides, used) if not u],
+            unmatched)
+
+
 class LintianOverridesEditor(Editor[List[Union[str, LintianOverride]], str]):
 
     def _parse(self, content):
@@ -126,6 +252,10 @@ class LintianOverridesEditor(Editor[List[Union[str, LintianOverride]], str]):
                 return True
         return False
 
+    def override_set(self) -> LintianOverrideSet:
+        """Return an index of the current overrides."""
+        return LintianOverrideSet(self.overrides)
+
     def _format(self, parsed):
         """Serialize the parsed object."""
         if self._parsed is None:
@@ -139,6 +269,77 @@ class LintianOverridesEditor(Editor[List[Union[str, LintianOverride]], str]):
         return ''.join(ret)
 
 
+_override_set_cache: FileCache[LintianOverrideSet] = FileCache(maxsize=64)
+
+
+def load_lintian_overrides(path: str) -> LintianOverrideSet:
+    """Load an overrides file, reusing an earlier parse if it has not changed.
+
+    Only the most recently loaded files are kept around. The returned set
+    may be shared with other callers, so it should not be modified.
+
+    Args:
+      path: Path to the overrides file
+    Returns:
+      A LintianOverrideSet
+    Raises:
+      FileNotFoundError: if the overrides file does not exist
+    """
+    key = os.path.abspath(path)
+    stamp = file_stamp(path)
+    try:
+        return _override_set_cache.lookup(key, stamp)
+    except KeyError:
+        pass
+    with LintianOverridesEditor(path) as editor:
+        overrides = editor.override_set()
+    _override_set_cache.store(key, stamp, overrides)
+    return overrides
+
+
+_OVERRIDE_RE = re.compile(
+    r'(?:(?:(?!(?:source|binary|udeb)[:\[ ])(?P<package>[^\s:\[\]]+) *)?'
+    r'(?:\[(?P<archlist>[^\]]*)\] *)?'
+    r'(?:(?P<type>source|binary|udeb) *)?'
+    r': +)?'
+    r'(?P<tag>[^\s:\[\]]+)(?:\s+(?P<info>.+))?')
+# Origin fields following the package name in an order that _OVERRIDE_RE
+# does not handle, e.g. "foo binary [amd64]: tag"
+_ORIGIN_TAIL_RE = re.compile(r'(?:\[[^\]]*\] *|(?:source|binary|udeb) *)+:\s')
+
+_POINTER_RE = re.compile(
+    r'(?:(?P<context>.*?)\s+)?\[(?P<path>[^\[\]]+?)(?::(?P<line>\d+|\*))?\]$')
+
+
+class LintianPointer(NamedTuple):
+    """A pointer to a location in a package, as used by lintian.
+
+    Newer versions of lintian append pointers like [usr/bin/foo:12] to the
+    information for a tag.
+    """
+
+    # Information before the pointer, if any
+    context: Optional[str]
+    path: str
+    line: Optional[str]
+
+
+@lru_cache(maxsize=4096)
+def parse_pointer(info: str) -> Optional[LintianPointer]:
+    """Parse the pointer from lintian tag information.
+
+    Args:
+      info: Tag information
+    Returns:
+      a LintianPointer, or None if the information does not end with a
+      pointer
+    """
+    m = _POINTER_RE.match(info)
+    if m is None:
+        return None
+    return LintianPointer(m.group('context'), m.group('path'), m.group('line'))
+
+
 def parse_override(line: str) -> LintianOverride:
     """Parse an override line
 
@@ -149,6 +350,22 @@ def parse_override(line: str) -> LintianOverride:
     Raises:
       ValueError: when encountering invalid syntax
     """
+    m = _OVERRIDE_RE.fullmatch(line.strip())
+    if m is None or (
+            m.group('package') is None and m.group('archlist') is None
+            and m.group('type') is None and (
+                m.group('tag') in VALID_TYPES
+                or _ORIGIN_TAIL_RE.match(m.group('info') or ''))):
+        # Fields in the origin in an unusual order
+        return _parse_override_fallback(line)
+    archlist = m.group('archlist')
+    return LintianOverride(
+        package=m.group('package'),
+        archlist=archlist.split() if archlist is not None else None,
+        type=m.group('type'), tag=m.group('tag'), info=m.group('info'))
+
+
+def _parse_override_fallback(line: str) -> LintianOverride:
     info: Optional[str]
     line = line.strip()
     archlist = None
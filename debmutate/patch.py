@@ -20,7 +20,7 @@
 
 import os
 from collections import namedtuple
-from typing import Iterator, List, Optional
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
 
 from .reformatting import Editor
 
@@ -92,7 +92,237 @@ def write_quilt_series(entries):
         yield line
 
 
-class QuiltSeriesEditor(Editor[List[QuiltSeriesEntry], bytes]):
+class _SeriesLine:
+
+    __slots__ = ('line', 'entry', 'prev', 'next')
+
+    def __init__(self, line: bytes,
+                 entry: Optional[QuiltSeriesEntry]) -> None:
+        self.line = line
+        self.entry = entry
+        self.prev: '_SeriesLine' = self
+        self.next: '_SeriesLine' = self
+
+
+def _format_series_entry(entry: QuiltSeriesEntry) -> bytes:
+    return next(write_quilt_series([entry]))
+
+
+class QuiltSeries:
+    """Lossless model of a quilt series file.
+
+    All lines (including comments, blank lines and options) are kept, and
+    lines that are not changed are written out as they were read. Lines
+    are kept in a linked list with an index by patch name, so that
+    patches can be looked up, removed and inserted in constant time.
+    """
+
+    def __init__(self) -> None:
+        self._root = _SeriesLine(b'', None)
+        # Patch name -> lines, for patches that are not commented out. A
+        # patch that is listed more than once has several lines, in order.
+        self._index: Dict[str, List[_SeriesLine]] = {}
+
+    @classmethod
+    def from_bytes(cls, content: bytes) -> 'QuiltSeries':
+        """Parse the contents of a series file."""
+        series = cls()
+        for line in content.splitlines(True):
+            series._link_before(
+                series._root, line, parse_quilt_series_line(line))
+        series._reindex()
+        return series
+
+    def _reindex(self) -> None:
+        self._index = {}
+        for node in self._nodes():
+            if node.entry is not None and not node.entry.quoted:
+                self._index.setdefault(node.entry.name, []).append(node)
+
+    def to_bytes(self) -> bytes:
+        """Serialize the series file."""
+        return b''.join(node.line for node in self._nodes())
+
+    def _nodes(self) -> Iterator[_SeriesLine]:
+        node = self._root.next
+        while node is not self._root:
+            yield node
+            node = node.next
+
+    def _link_before(self, other: _SeriesLine, line: bytes,
+                     entry: Optional[QuiltSeriesEntry]) -> _SeriesLine:
+        prev = other.prev
+        if prev is not self._root and not prev.line.endswith(b'\n'):
+            prev.line += b'\n'
+        node = _SeriesLine(line, entry)
+        node.prev = prev
+        node.next = other
+        prev.next = node
+        other.prev = node
+        return node
+
+    def _add(self, before: _SeriesLine, name: str,
+             options: Optional[List[str]]) -> _SeriesLine:
+        entry = QuiltSeriesEntry(name, False, options or [])
+        return self._link_before(before, _format_series_entry(entry), entry)
+
+    def _unlink(self, node: _SeriesLine) -> None:
+        node.prev.next = node.next
+        node.next.prev = node.prev
+
+    def __len__(self) -> int:
+        return sum(len(nodes) for nodes in self._index.values())
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._index
+
+    def patches(self) -> Iterator[str]:
+        """Iterate over the names of the patches, in order."""
+        for node in self._nodes():
+            if node.entry is not None and not node.entry.quoted:
+                yield node.entry.name
+
+    def entries(self) -> Iterator[QuiltSeriesEntry]:
+        """Iterate over all entries, including commented out patches."""
+        for node in self._nodes():
+            if node.entry is not None:
+                yield node.entry
+
+    def options(self, name: str) -> List[str]:
+        """Return the options for a patch.
+
+        Raises:
+          KeyError: if the patch is not in the series
+        """
+        return self._index[name][0].entry.options  # type: ignore
+
+    def append(self, name: str, options: Optional[List[str]] = None) -> None:
+        """Add a patch at the end of the series.
+
+        This does not check whether the patch is already in the series.
+        """
+        self._index.setdefault(name, []).append(
+            self._add(self._root, name, options))
+
+    def extend(self, names: Iterable[str]) -> None:
+        """Add patches at the end of the series."""
+        for name in names:
+            self.append(name)
+
+    def insert_after(self, after: Optional[str], name: str,
+                     options: Optional[List[str]] = None) -> None:
+        """Add a patch after another patch.
+
+        Args:
+          after: Name of the patch to insert after; None to insert at the
+            start of the series
+          name: Name of the patch to add
+          options: Options for the patch
+        Raises:
+          KeyError: if after is not in the series
+          ValueError: if the patch is already in the series
+        """
+        if after is None:
+            before = self._root.next
+        else:
+            before = self._index[after][0].next
+        if name in self._index:
+            raise ValueError('patch %s already in series' % name)
+        self._index[name] = [self._add(before, name, options)]
+
+    def remove(self, name: str) -> None:
+        """Remove a patch.
+
+        Patches that are commented out are removed too. If the patch is
+        listed more than once, only the first occurrence is removed.
+
+        Raises:
+          KeyError: if the patch is not in the series
+        """
+        try:
+            nodes = self._index[name]
+        except KeyError:
+            for node in self._nodes():
+                if node.entry is not None and node.entry.name == name:
+                    break
+            else:
+                raise
+        else:
+            node = nodes.pop(0)
+            if not nodes:
+                del self._index[name]
+        self._unlink(node)
+
+    def rename(self, old: str, new: str) -> None:
+        """Rename a patch, keeping its options and position.
+
+        Raises:
+          KeyError: if the old patch is not in the series
+          ValueError: if the new patch is already in the series
+        """
+        self.rename_many({old: new})
+
+    def rename_many(self, renames: Mapping[str, str]) -> None:
+        """Rename several patches at once.
+
+        All occurrences of a patch that is listed more than once are
+        renamed.
+
+        Args:
+          renames: Dictionary mapping old names to new names
+        Raises:
+          KeyError: if one of the old patches is not in the series
+          ValueError: if one of the new patches is already in the series
+        """
+        nodes = [self._index[old] for old in renames]
+        new_names = set(renames.values())
+        if len(new_names) != len(renames) or any(
+                name in self._index and name not in renames
+                for name in new_names):
+            raise ValueError('duplicate patch names after rename')
+        for old in renames:
+            del self._index[old]
+        for old_nodes, (old, new) in zip(nodes, renames.items()):
+            for node in old_nodes:
+                line = node.line
+                start = len(line) - len(line.lstrip())
+                end = start + len(old.encode('utf-8'))
+                node.line = line[:start] + new.encode('utf-8') + line[end:]
+                node.entry = node.entry._replace(name=new)  # type: ignore
+            self._index[new] = old_nodes
+
+    def reorder(self, names: Iterable[str]) -> None:
+        """Change the order of the patches.
+
+        Comments and blank lines stay where they are; the patches are
+        rearranged over the lines that held patches before. Only the first
+        occurrence of a patch that is listed more than once is moved.
+
+        Args:
+          names: All patch names, in the new order
+        Raises:
+          ValueError: if names is not a permutation of the patches
+        """
+        names = list(names)
+        if len(names) != len(self._index) or set(names) != set(self._index):
+            raise ValueError('names do not match the patches in the series')
+        contents = {
+            name: (nodes[0].line, nodes[0].entry)
+            for (name, nodes) in self._index.items()}
+        slots = [
+            node for node in self._nodes()
+            if node.entry is not None
+            and node.entry.name in self._index
+            and self._index[node.entry.name][0] is node]
+        for node, name in zip(slots, names):
+            line, entry = contents[name]
+            if node.next is not self._root and not line.endswith(b'\n'):
+                line += b'\n'
+            node.line, node.entry = line, entry
+        self._reindex()
+
+
+class QuiltSeriesEditor(Editor[Optional[QuiltSeries], bytes]):
     """Edit a debian/patches/series file."""
 
     def __init__(
@@ -102,7 +332,7 @@ class QuiltSeriesEditor(Editor[List[QuiltSeriesEntry], bytes]):
             path, mode='b', allow_reformatting=allow_reformatting)
 
     def _parse(self, content):
-        return list(read_quilt_series(content.splitlines(True)))
+        return QuiltSeries.from_bytes(content)
 
     def _nonexistant(self):
         return None
@@ -110,26 +340,39 @@ class QuiltSeriesEditor(Editor[List[QuiltSeriesEntry], bytes]):
     def _format(self, parsed):
         if parsed is None:
             return None
-        # TODO(jelmer): Support formatting comments and options
-        return b''.join(write_quilt_series(parsed))
+        return parsed.to_bytes()
 
-    def append(self, name, options=None):
-        if options is None:
-            options = []
+    @property
+    def series(self) -> QuiltSeries:
+        """The series, created if the file does not exist yet."""
         if self._parsed is None:
-            self._parsed = []
-        self._parsed.append(QuiltSeriesEntry(name, False, options))
+            self._parsed = QuiltSeries()
+        return self._parsed
+
+    def append(self, name, options=None):
+        self.series.append(name, options)
+
+    def extend(self, names):
+        self.series.extend(names)
+
+    def insert_after(self, after, name, options=None):
+        self.series.insert_after(after, name, options)
 
     def patches(self):
         if self._parsed is None:
             return
-        for entry in self._parsed:
-            if not entry.quoted:
-                yield entry.name
+        yield from self._parsed.patches()
+
+    def __contains__(self, name):
+        return self._parsed is not None and name in self._parsed
 
     def remove(self, name):
-        for i, entry in enumerate(self._parsed):
-            if entry.name == name:
-                del self._parsed[i]
-                return
-        raise KeyError(name)
+        if self._parsed is None:
+            raise KeyError(name)
+        self._parsed.remove(name)
+
+    def rename(self, old, new):
+        self.series.rename(old, new)
+
+    def reorder(self, names):
+        self.series.reorder(names)
@@ -0,0 +1,326 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Graph of the relations between packages.
+
+The graph has a node for every package and an edge for every relation in
+one of the relation fields (Depends, Build-Depends, Provides, etc). Source
+packages are named src:<name>, so that they don't clash with binary
+packages of the same name.
+"""
+
+__all__ = [
+    'RELATION_FIELDS',
+    'RelationEdge',
+    'RelationGraph',
+]
+
+from collections import deque
+from typing import (Dict, Iterable, Iterator, List, Mapping, NamedTuple,
+                    Optional, Set, Tuple)
+
+from ._deb822 import PkgRelation
+from .control import is_relation_implied, parse_relations
+
+RELATION_FIELDS = [
+    'Pre-Depends', 'Depends', 'Recommends', 'Suggests', 'Enhances',
+    'Breaks', 'Conflicts', 'Replaces', 'Provides', 'Built-Using',
+    'Build-Depends', 'Build-Depends-Indep', 'Build-Depends-Arch',
+    'Build-Conflicts', 'Build-Conflicts-Indep', 'Build-Conflicts-Arch',
+]
+
+DEPENDS_FIELDS = ('Pre-Depends', 'Depends')
+
+
+def _is_substvar(name: str) -> bool:
+    return name.startswith('${')
+
+
+class RelationEdge(NamedTuple):
+    """A single relation (possibly with alternatives) in a field."""
+
+    package: str
+    field: str
+    position: int
+    relation: List[PkgRelation]
+
+    @property
+    def targets(self) -> List[str]:
+        """Names of the packages this relation refers to."""
+        return [r.name for r in self.relation if not _is_substvar(r.name)]
+
+
+class RelationGraph:
+    """Relations between a set of packages.
+
+    Fields are parsed once, when they are added. Reverse relations are
+    indexed, and fields can be updated incrementally with set_field().
+    """
+
+    def __init__(self) -> None:
+        # package -> field -> (raw value, edges)
+        self._fields: Dict[str, Dict[str, Tuple[str, List[RelationEdge]]]] = {}
+        # target -> (package, field) -> edges
+        self._reverse: Dict[
+            str, Dict[Tuple[str, str], List[RelationEdge]]] = {}
+        self._architecture: Dict[str, Optional[str]] = {}
+
+    @classmethod
+    def from_paragraphs(
+            cls, paragraphs: Iterable[Mapping[str, str]]) -> 'RelationGraph':
+        """Build a graph from control paragraphs.
+
+        Args:
+          paragraphs: Paragraphs from a control file or from an archive
+            index (Packages or Sources)
+        """
+        graph = cls()
+        for paragraph in paragraphs:
+            graph.update_paragraph(paragraph)
+        return graph
+
+    @classmethod
+    def from_control(cls, editor) -> 'RelationGraph':
+        """Build a graph from a ControlEditor."""
+        return cls.from_paragraphs(editor.paragraphs)
+
+    @staticmethod
+    def package_name(paragraph: Mapping[str, str]) -> str:
+        """Return the node name for a paragraph."""
+        if 'Source' in paragraph and 'Package' not in paragraph:
+            return 'src:' + paragraph['Source']
+        if 'Binary' in paragraph:
+            # Sources index
+            return 'src:' + paragraph['Package']
+        return paragraph['Package']
+
+    def update_paragraph(self, paragraph: Mapping[str, str]) -> None:
+        """Add or update the package described by a paragraph.
+
+        Only fields that have changed since the last update are parsed.
+        """
+        package = self.package_name(paragraph)
+        self._architecture[package] = paragraph.get('Architecture')
+        fields = self._fields.setdefault(package, {})
+        for field in RELATION_FIELDS:
+            value = paragraph.get(field)
+            if value is None:
+                if field in fields:
+                    self.set_field(package, field, None)
+            elif field not in fields or fields[field][0] != value:
+                self.set_field(package, field, value)
+
+    def set_field(self, package: str, field: str,
+                  value: Optional[str]) -> None:
+        """Update a single relation field.
+
+        Args:
+          package: Package name
+          field: Field name
+          value: New value, or None to remove the field
+        """
+        fields = self._fields.setdefault(package, {})
+        try:
+            old_value, old_edges = fields.pop(field)
+        except KeyError:
+            pass
+        else:
+            for target in {t for edge in old_edges for t in edge.targets}:
+                reverse = self._reverse[target]
+                del reverse[(package, field)]
+                if not reverse:
+                    del self._reverse[target]
+        if value is None:
+            return
+        edges = []
+        for i, (_ws1, relation, _ws2) in enumerate(parse_relations(value)):
+            if not relation:
+                continue
+            edge = RelationEdge(package, field, i, relation)
+            edges.append(edge)
+            for target in set(edge.targets):
+                self._reverse.setdefault(target, {}).setdefault(
+                    (package, field), []).append(edge)
+        fields[field] = (value, edges)
+
+    def remove_package(self, package: str) -> None:
+        """Remove a package and all of its relations."""
+        for field in list(self._fields.get(package, {})):
+            self.set_field(package, field, None)
+        self._fields.pop(package, None)
+        self._architecture.pop(package, None)
+
+    def packages(self) -> List[str]:
+        """Return the names of all packages in the graph."""
+        return list(self._fields)
+
+    def __contains__(self, package: object) -> bool:
+        return package in self._fields
+
+    def relations(self, package: str,
+                  fields: Optional[Iterable[str]] = None
+                  ) -> Iterator[RelationEdge]:
+        """Iterate over the relations of a package.
+
+        Args:
+          package: Package name
+          fields: Fields to consider (defaults to all)
+        """
+        try:
+            package_fields = self._fields[package]
+        except KeyError:
+            return
+        if fields is None:
+            fields = list(package_fields)
+        for field in fields:
+            try:
+                yield from package_fields[field][1]
+            except KeyError:
+                pass
+
+    def reverse_relations(self, target: str,
+                          fields: Optional[Iterable[str]] = None
+                          ) -> Iterator[RelationEdge]:
+        """Iterate over the relations that refer to a package.
+
+        Args:
+          target: Name of the package that is referred to
+          fields: Fields to consider (defaults to all)
+        """
+        field_set = set(fields) if fields is not None else None
+        for (package, field), edges in self._reverse.get(target, {}).items():
+            if field_set is None or field in field_set:
+                yield from edges
+
+    def dependencies(self, package: str,
+                     fields: Iterable[str] = DEPENDS_FIELDS) -> Set[str]:
+        """Return the names of the packages a package refers to."""
+        return {target for edge in self.relations(package, fields)
+                for target in edge.targets}
+
+    def dependents(self, target: str,
+                   fields: Iterable[str] = DEPENDS_FIELDS) -> Set[str]:
+        """Return the packages that refer to a package."""
+        return {edge.package
+                for edge in self.reverse_relations(target, fields)}
+
+    def providers(self, name: str) -> Set[str]:
+        """Return the packages that provide a (virtual) package."""
+        return self.dependents(name, ['Provides'])
+
+    def transitive_dependencies(
+            self, package: str, fields: Iterable[str] = DEPENDS_FIELDS,
+            follow_provides: bool = False) -> Set[str]:
+        """Return all packages that a package (indirectly) refers to.
+
+        All alternatives are followed. Packages that are not in the graph
+        are included, but can not be followed.
+
+        Args:
+          package: Package name
+          fields: Fields to follow
+          follow_provides: Whether to also follow the providers of
+            virtual packages
+        """
+        fields = list(fields)
+        seen: Set[str] = set()
+        todo = deque([package])
+        while todo:
+            for target in self.dependencies(todo.popleft(), fields):
+                if target in seen:
+                    continue
+                seen.add(target)
+                todo.append(target)
+                if follow_provides:
+                    for provider in self.providers(target) - seen:
+                        seen.add(provider)
+                        todo.append(provider)
+        seen.discard(package)
+        return seen
+
+    def transitive_dependents(
+            self, target: str,
+            fields: Iterable[str] = DEPENDS_FIELDS) -> Set[str]:
+        """Return all packages that (indirectly) refer to a package."""
+        fields = list(fields)
+        seen: Set[str] = set()
+        todo = deque([target])
+        while todo:
+            for package in self.dependents(todo.popleft(), fields):
+                if package not in seen:
+                    seen.add(package)
+                    todo.append(package)
+        seen.discard(target)
+        return seen
+
+    def substvars(self, package: str, field: str) -> Set[str]:
+        """Return the substitution variables used in a field."""
+        return {r.name for edge in self.relations(package, [field])
+                for r in edge.relation if _is_substvar(r.name)}
+
+    def missing_substvars(
+            self, field: str = 'Depends') -> Dict[str, List[str]]:
+        """Find binary packages that lack the standard substvars.
+
+        ${misc:Depends} is expected for all binary packages and
+        ${shlibs:Depends} for architecture-dependent binary packages.
+
+        Returns:
+          dictionary mapping package names to missing substvars
+        """
+        ret = {}
+        for package in self._fields:
+            if package.startswith('src:'):
+                continue
+            expected = ['${misc:Depends}']
+            if self._architecture.get(package) not in (None, 'all'):
+                expected.append('${shlibs:Depends}')
+            present = self.substvars(package, field)
+            missing = [s for s in expected if s not in present]
+            if missing:
+                ret[package] = missing
+        return ret
+
+    def is_implied(self, package: str, field: str,
+                   relation: List[PkgRelation]) -> bool:
+        """Check whether a relation is implied by a field of a package."""
+        return any(is_relation_implied(relation, edge.relation)
+                   for edge in self.relations(package, [field]))
+
+    def implied_relations(
+            self, package: str, field: str
+            ) -> List[Tuple[RelationEdge, RelationEdge]]:
+        """Find relations in a field that are implied by other relations.
+
+        Returns:
+          list of (redundant relation, implying relation) tuples
+        """
+        edges = list(self.relations(package, [field]))
+        ret = []
+        redundant: Set[int] = set()
+        for edge in edges:
+            for other in edges:
+                # Skip relations that are already redundant, so that of
+                # two equivalent relations only one is reported
+                if (other is edge or other.position in redundant
+                        or not set(edge.targets) & set(other.targets)):
+                    continue
+                if is_relation_implied(edge.relation, other.relation):
+                    ret.append((edge, other))
+                    redundant.add(edge.position)
+                    break
+        return ret
@@ -0,0 +1,197 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Editing sessions spanning multiple files in a Debian package tree."""
+
+__all__ = [
+    'DebianTree',
+]
+
+import os
+from typing import Callable, Dict, List, Optional, Tuple
+
+from debian.deb822 import RestrictedField
+
+from ._rules import RulesEditor
+from .changelog import ChangelogEditor
+from .control import ControlEditor
+from .copyright import CopyrightEditor, upstream_fields_in_copyright
+from .debhelper import get_debhelper_compat_level, get_sequences
+from .vcs import get_vcs_info
+from .watch import WatchEditor
+
+
+class DebianTree:
+    """Editing session for the files in a Debian package tree.
+
+    Each file is parsed the first time it is accessed and the editor is
+    then kept around for the rest of the session, so that fixers and
+    helpers share a single parse. All modified files are written when the
+    session ends; if the session ends with an exception, nothing is
+    written. If writing one of the files fails (e.g. because it is
+    generated or its formatting can not be preserved), the files that were
+    already written are restored and the exception is raised.
+    """
+
+    changed_files: List[str]
+
+    def __init__(self, path: str = '.',
+                 allow_reformatting: Optional[bool] = None) -> None:
+        self.path = path
+        self.allow_reformatting = allow_reformatting
+        self._editors: Dict[str, object] = {}
+        self._opened: List[Tuple[str, object]] = []
+        self.changed_files = []
+
+    def _debian_path(self, name: str) -> str:
+        return os.path.normpath(os.path.join(self.path, 'debian', name))
+
+    def _editor(self, name: str, factory: Callable[[str], object]):
+        try:
+            return self._editors[name]
+        except KeyError:
+            pass
+        editor = factory(self._debian_path(name))
+        editor.__enter__()  # type: ignore
+        self._editors[name] = editor
+        self._opened.append((name, editor))
+        return editor
+
+    def has_file(self, name: str) -> bool:
+        """Check whether a file exists in the debian/ directory."""
+        return name in self._editors or os.path.exists(self._debian_path(name))
+
+    @property
+    def control(self) -> ControlEditor:
+        return self._editor('control', lambda path: ControlEditor(
+            path, allow_reformatting=self.allow_reformatting))
+
+    @property
+    def changelog(self) -> ChangelogEditor:
+        return self._editor('changelog', lambda path: ChangelogEditor(
+            path, allow_reformatting=self.allow_reformatting))
+
+    @property
+    def rules(self) -> RulesEditor:
+        return self._editor('rules', RulesEditor)
+
+    @property
+    def copyright(self) -> CopyrightEditor:
+        return self._editor('copyright', lambda path: CopyrightEditor(
+            path, allow_reformatting=self.allow_reformatting))
+
+    @property
+    def watch(self) -> WatchEditor:
+        return self._editor('watch', lambda path: WatchEditor(
+            path, allow_reformatting=self.allow_reformatting))
+
+    def debhelper_compat_level(self) -> Optional[int]:
+        """Determine the debhelper compat level.
+
+        See debmutate.debhelper.get_debhelper_compat_level.
+        """
+        if not self.has_file('control'):
+            return get_debhelper_compat_level(self.path)
+        return get_debhelper_compat_level(
+            self.path, control=self.control.source)
+
+    def sequences(self) -> List[str]:
+        """Return the dh sequences enabled through Build-Depends.
+
+        Returns an empty list if there is no control file.
+        """
+        try:
+            control = self.control
+        except FileNotFoundError:
+            return []
+        return list(get_sequences(source=control.source))
+
+    def vcs_info(self) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Return the VCS type, URL and subpath from the control file.
+
+        Returns (None, None, None) if there is no control file.
+        """
+        try:
+            control = self.control
+        except FileNotFoundError:
+            return (None, None, None)
+        return get_vcs_info(control.source)
+
+    def upstream_fields_in_copyright(self) -> Dict[str, RestrictedField]:
+        """Extract upstream fields from the copyright file.
+
+        See debmutate.copyright.upstream_fields_in_copyright.
+        """
+        if 'copyright' in self._editors:
+            return upstream_fields_in_copyright(
+                copyright=self.copyright.copyright)
+        return upstream_fields_in_copyright(self._debian_path('copyright'))
+
+    def _snapshot(self) -> Dict[str, Tuple[bytes, int]]:
+        # All editors write to files directly in debian/ (including control
+        # templates), so those are the files that may need to be restored.
+        snapshot: Dict[str, Tuple[bytes, int]] = {}
+        try:
+            entries = list(os.scandir(self._debian_path('')))
+        except FileNotFoundError:
+            return snapshot
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                with open(entry.path, 'rb') as f:
+                    snapshot[entry.path] = (f.read(), entry.stat().st_mode)
+        return snapshot
+
+    def _restore(self, snapshot: Dict[str, Tuple[bytes, int]]) -> None:
+        try:
+            entries = list(os.scandir(self._debian_path('')))
+        except FileNotFoundError:
+            entries = []
+        for entry in entries:
+            if (entry.is_file(follow_symlinks=False)
+                    and entry.path not in snapshot):
+                os.unlink(entry.path)
+        for path, (content, mode) in snapshot.items():
+            try:
+                with open(path, 'rb') as f:
+                    if f.read() == content:
+                        continue
+            except FileNotFoundError:
+                pass
+            with open(path, 'wb') as f:
+                f.write(content)
+            os.chmod(path, mode)
+
+    def __enter__(self) -> 'DebianTree':
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        opened = self._opened
+        self._opened = []
+        self._editors = {}
+        if exc_type is not None or not opened:
+            return False
+        snapshot = self._snapshot()
+        changed_files: List[str] = []
+        try:
+            for name, editor in opened:
+                editor.__exit__(None, None, None)  # type: ignore
+                changed_files.extend(getattr(editor, 'changed_files', []))
+        except BaseException:
+            self._restore(snapshot)
+            raise
+        self.changed_files.extend(changed_files)
+        return False
@@ -18,7 +18,9 @@
 """Utility functions for dealing with Debian versions."""
 
 import re
+import string
 from datetime import datetime
+from functools import lru_cache
 from typing import Optional, Tuple, Union
 
 from debian.changelog import Version
@@ -27,6 +29,7 @@ __all__ = [
     'git_snapshot_data_from_version',
     'mangle_version_for_git',
     'upstream_version_add_revision',
+    'version_sort_key',
 ]
 
 
@@ -287,3 +290,55 @@ def add_dfsg_suffix(
             if m.group(4):
                 style += "1"
     return upstream_version + style
+
+
+# Weights for characters in the non-digit parts of a version, as used by
+# dpkg: ~ sorts before the end of a part, which sorts before letters, which
+# sort before all other characters.
+_CHAR_WEIGHTS = {c: (-1 if c == '~' else ord(c)
+                     if c in string.ascii_letters else ord(c) + 256)
+                 for c in map(chr, range(256))}
+_VERSION_PART_RE = re.compile(r'([^0-9]*)([0-9]*)')
+_EMPTY_PART = ((0, ), 0)
+
+
+def _part_sort_key(text: str) -> Tuple[Tuple[Tuple[int, ...], int], ...]:
+    key = []
+    for nondigit, digit in _VERSION_PART_RE.findall(text):
+        key.append((
+            tuple(_CHAR_WEIGHTS.get(c, ord(c) + 256) for c in nondigit)
+            + (0, ), int(digit or '0')))
+    # Missing parts compare equal to empty ones; strip any trailing empty
+    # parts (but keep the first one) and terminate with a single empty part
+    # so that keys of different lengths compare correctly.
+    while len(key) > 1 and key[-1] == _EMPTY_PART:
+        key.pop()
+    key.append(_EMPTY_PART)
+    return tuple(key)
+
+
+@lru_cache(maxsize=8192)
+def _version_sort_key(version: str):
+    epoch, sep, rest = version.partition(':')
+    if not sep:
+        epoch, rest = '0', version
+    upstream, sep, revision = rest.rpartition('-')
+    if not upstream or not revision:
+        upstream, revision = rest, ''
+    return (int(epoch or '0'), _part_sort_key(upstream),
+            _part_sort_key(revision))
+
+
+def version_sort_key(version: Union[str, Version]):
+    """Return a key for sorting Debian versions.
+
+    The keys compare the same way dpkg compares the versions, so they can
+    be used with sort(), bisect and heapq. Two versions that dpkg considers
+    equal (e.g. "1.0" and "1.0-0") have equal keys.
+
+    Args:
+      version: Version, either as a string or a Version object
+    Returns:
+      a tuple
+    """
+    return _version_sort_key(str(version))
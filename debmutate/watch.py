@@ -17,19 +17,20 @@
 
 """Functions for working with watch files."""
 
+import json
 import logging
 import re
 import sys
+from functools import lru_cache
 from io import StringIO
-from typing import (Callable, Iterable, Iterator, List, Optional, TextIO,
-                    Tuple, Union)
+from typing import (Callable, Dict, Iterable, Iterator, List, Optional,
+                    TextIO, Tuple, Union)
 from urllib.parse import urljoin
 
-import pcre
-from debian.changelog import Version
-
 from . import __version__
 from .reformatting import Editor
+from .vcs import unsplit_vcs_url
+from .versions import version_sort_key
 
 DEFAULT_USER_AGENT = 'debmutate/%s' % '.'.join([str(x) for x in __version__])
 
@@ -58,56 +59,131 @@ class InvalidUVersionMangle(ValueError):
     """uversionmangle is invalid"""
 
 
+class WatchOptions:
+    """Ordered collection of watch file options.
+
+    Options are parsed once when they are added, so that lookups, updates
+    and removals by name do not have to scan the option list. The original
+    order (and any duplicate options) are preserved when iterating.
+    """
+
+    def __init__(self, options: Optional[Iterable[str]] = None) -> None:
+        self._items: Dict[int, Tuple[str, Optional[str]]] = {}
+        self._index: Dict[str, List[int]] = {}
+        self._next = 0
+        if options is not None:
+            self.extend(options)
+
+    @staticmethod
+    def _split(option: str) -> Tuple[str, Optional[str]]:
+        key, sep, value = option.partition('=')
+        if not sep:
+            return key, None
+        return key, value
+
+    @staticmethod
+    def _join(key: str, value: Optional[str]) -> str:
+        if value is None:
+            return key
+        return '{}={}'.format(key, value)
+
+    def _add(self, key: str, value: Optional[str]) -> None:
+        self._items[self._next] = (key, value)
+        self._index.setdefault(key, []).append(self._next)
+        self._next += 1
+
+    def append(self, option: str) -> None:
+        """Add an option in its serialized (key=value) form."""
+        self._add(*self._split(option))
+
+    def extend(self, options: Iterable[str]) -> None:
+        for option in options:
+            self.append(option)
+
+    def get(self, name: str) -> Optional[str]:
+        """Return the value of an option.
+
+        Raises:
+          KeyError: if the option is not set
+        """
+        return self._items[self._index[name][0]][1]
+
+    def set(self, name: str, value: Optional[str] = None) -> None:
+        """Set an option, replacing the first existing occurrence."""
+        try:
+            positions = self._index[name]
+        except KeyError:
+            self._add(name, value)
+        else:
+            self._items[positions[0]] = (name, value)
+
+    def delete(self, name: str) -> None:
+        """Remove the first occurrence of an option.
+
+        Raises:
+          KeyError: if the option is not set
+        """
+        positions = self._index[name]
+        del self._items[positions.pop(0)]
+        if not positions:
+            del self._index[name]
+
+    def has(self, name: str) -> bool:
+        return name in self._index
+
+    def items(self) -> Iterator[Tuple[str, Optional[str]]]:
+        return iter(self._items.values())
+
+    def __iter__(self) -> Iterator[str]:
+        for key, value in self._items.values():
+            yield self._join(key, value)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __bool__(self) -> bool:
+        return bool(self._items)
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, WatchOptions):
+            return list(self.items()) == list(other.items())
+        if isinstance(other, list):
+            return list(self) == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return '{}({!r})'.format(type(self).__name__, list(self))
+
+
 class WatchFile:
 
     def __init__(self, entries: Optional[List['Watch']] = None,
-                 options: Optional[List[str]] = None,
+                 options: Optional[Iterable[str]] = None,
                  version: int = DEFAULT_VERSION) -> None:
         self.version = version
         if entries is None:
             entries = []
         self.entries = entries
-        if options is None:
-            options = []
-        self.options = options
+        self.options = options  # type: ignore
+
+    @property
+    def options(self) -> WatchOptions:
+        return self._options
+
+    @options.setter
+    def options(self, options: Optional[Iterable[str]]) -> None:
+        if not isinstance(options, WatchOptions):
+            options = WatchOptions(options)
+        self._options = options
 
     def get_option(self, name):
-        for option in self.options:
-            try:
-                key, value = option.split('=', 1)
-            except ValueError:
-                key = option
-                value = None
-            if key == name:
-                return value
-        raise KeyError(name)
-
-    def set_option(self, name, newvalue=None):
-        if newvalue is None:
-            nv = name
-        else:
-            nv = '{}={}'.format(name, newvalue)
-        for i, option in enumerate(self.options):
-            try:
-                key, value = option.split('=', 1)
-            except ValueError:
-                key = option
-                value = None
-            if key == value:
-                self.options[i] = nv
-                return
-        self.options.append(nv)
-
-    def del_option(self, name):
-        for i, option in enumerate(self.options):
-            try:
-                key, value = option.split('=', 1)
-            except ValueError:
-                key = option
-            if key == name:
-                del self.options[i]
-                return
-        raise KeyError(name)
+        return self.options.get(name)
+
+    def set_option(self, name: str, newvalue: Optional[str] = None) -> None:
+        self.options.set(name, newvalue)
+
+    def del_option(self, name: str) -> None:
+        self.options.delete(name)
 
     def __iter__(self) -> Iterator['Watch']:
         return iter(self.entries)
@@ -122,7 +198,7 @@ class WatchFile:
                 self.version == other.version
 
     def dump(self, f: TextIO) -> None:
-        def serialize_options(opts: List[str]) -> str:
+        def serialize_options(opts: WatchOptions) -> str:
             s = ','.join(opts)
             if ' ' in s or '\t' in s:
                 return 'opts="' + s + '"'
@@ -156,6 +232,7 @@ def parse_sed_expr(vm):
 def parse_subst_expr(vm: str) -> Tuple[str, str, Optional[str]]:
     if vm[0] != 's':
         raise InvalidUVersionMangle(vm, 'not a substitution regex')
+    import pcre
     parts = pcre.split(r'(?<!\\)' + vm[1], vm)
     if len(parts) < 3:
         raise InvalidUVersionMangle(vm)
@@ -176,6 +253,7 @@ def parse_transl_expr(vm: str) -> Tuple[str, str, Optional[str]]:
         s = vm[1:]
     else:
         raise InvalidUVersionMangle(vm, 'not a translation regex')
+    import pcre
     parts = pcre.split(r'(?<!\\)' + s[0], vm)
     if len(parts) < 3:
         raise InvalidUVersionMangle(vm)
@@ -192,6 +270,7 @@ def parse_transl_expr(vm: str) -> Tuple[str, str, Optional[str]]:
 def apply_sed_expr(vm: str, orig: str) -> str:
     (kind, (pattern, replacement, flags)) = parse_sed_expr(vm)
     if kind == 's':
+        import pcre
         # TODO(jelmer): Handle flags
         replacement = re.sub(
             r'\$([0-9]+)', lambda x: '{%s}' % x.group(1), replacement)
@@ -221,7 +300,8 @@ class Release:
     def __lt__(self, other):
         if type(self) != type(other):
             raise TypeError(other)
-        return Version(self.version) < Version(other.version)
+        return version_sort_key(self.version) < version_sort_key(
+            other.version)
 
     def __repr__(self):
         return "{}({!r}, {!r}, pgpsigurl={!r})".format(
@@ -229,6 +309,21 @@ class Release:
             self.pgpsigurl)
 
 
+@lru_cache(maxsize=256)
+def _compile_matching_pattern(pattern):
+    """Compile a matching pattern.
+
+    Matching patterns are Perl regular expressions. The re module is used
+    for the patterns it accepts, so the pcre module is only needed for
+    patterns that use Perl-specific syntax.
+    """
+    try:
+        return re.compile(pattern)
+    except re.error:
+        import pcre
+        return pcre.compile(pattern)
+
+
 def html_search(body, matching_pattern, base_url):
     from bs4 import BeautifulSoup
     soup = BeautifulSoup(body, 'html.parser')
@@ -240,7 +335,7 @@ def html_search(body, matching_pattern, base_url):
         if not href:
             continue
         href = urljoin(base_url.rstrip('/') + '/', href)
-        m = pcre.match(matching_pattern, href)
+        m = _compile_matching_pattern(matching_pattern).match(href)
         if m:
             logging.debug('Matched pattern %r to %r', matching_pattern, href)
             yield m
@@ -250,12 +345,143 @@ def html_search(body, matching_pattern, base_url):
 
 
 def plain_search(body, matching_pattern, base_url):
-    return pcre.finditer(matching_pattern.encode(), body)
+    return _compile_matching_pattern(matching_pattern.encode()).finditer(body)
+
+
+def _match_urls(urls, matching_pattern):
+    if '://' not in matching_pattern:
+        matching_pattern = '.*/' + matching_pattern
+    pattern = _compile_matching_pattern('(?:%s)$' % matching_pattern)
+    for url in urls:
+        m = pattern.match(url)
+        if m:
+            logging.debug('Matched pattern %r to %r', matching_pattern, url)
+            yield m
+        else:
+            logging.debug(
+                'Did not match pattern %r to %r', matching_pattern, url)
+
+
+def _iter_pkt_lines(body: bytes) -> Iterator[bytes]:
+    i = 0
+    while i < len(body):
+        size = int(body[i:i+4], 16)
+        if size == 0:
+            # flush packet
+            i += 4
+            continue
+        yield body[i+4:i+size]
+        i += size
+
+
+def parse_git_refs(body: bytes) -> Iterator[Tuple[bytes, str]]:
+    """Parse a git ref advertisement, as returned by info/refs.
+
+    Both the smart HTTP protocol (pkt-lines) and the dumb HTTP protocol
+    (tab-separated lines) are supported.
+
+    Args:
+      body: Response body
+    Returns:
+      iterator over (sha, refname) tuples
+    """
+    lines: Iterable[bytes]
+    if re.match(b'[0-9a-f]{40}\t', body):
+        lines = body.splitlines()
+    else:
+        lines = _iter_pkt_lines(body)
+    for line in lines:
+        if line.startswith(b'#'):
+            # service announcement
+            continue
+        line = line.rstrip(b'\n').split(b'\0', 1)[0]
+        try:
+            sha, ref = line.replace(b'\t', b' ').split(b' ', 1)
+        except ValueError:
+            continue
+        if ref.endswith(b'^{}'):
+            # peeled tag
+            continue
+        yield sha, ref.decode('utf-8')
+
+
+def git_info_refs_url(url: str) -> str:
+    """Return the URL of the smart HTTP ref advertisement for a repository.
+    """
+    return url.rstrip('/') + '/info/refs?service=git-upload-pack'
+
+
+def git_search(body, matching_pattern, base_url):
+    pattern = _compile_matching_pattern('(?:%s)$' % matching_pattern)
+    for _sha, ref in parse_git_refs(body):
+        m = pattern.match(ref)
+        if m:
+            logging.debug('Matched pattern %r to %r', matching_pattern, ref)
+            yield m
+
+
+def pypi_search(body, matching_pattern, base_url):
+    data = json.loads(body)
+    urls = []
+    if 'releases' in data:
+        files = [f for fs in data['releases'].values() for f in fs]
+    else:
+        files = data.get('urls', [])
+    for f in files:
+        if not f.get('yanked'):
+            urls.append(f['url'])
+    return _match_urls(urls, matching_pattern)
+
+
+CRATES_DOWNLOAD_URL = (
+    'https://static.crates.io/crates/{name}/{name}-{vers}.crate')
+
+
+def crates_search(body, matching_pattern, base_url):
+    urls = []
+    for line in body.splitlines():
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if entry.get('yanked'):
+            continue
+        urls.append(CRATES_DOWNLOAD_URL.format(
+            name=entry['name'], vers=entry['vers']))
+    return _match_urls(urls, matching_pattern)
+
+
+def github_search(body, matching_pattern, base_url):
+    urls = []
+    for release in json.loads(body):
+        if release.get('draft'):
+            continue
+        for asset in release.get('assets', []):
+            urls.append(asset['browser_download_url'])
+        for key in ['tarball_url', 'zipball_url']:
+            if release.get(key):
+                urls.append(release[key])
+    return _match_urls(urls, matching_pattern)
+
+
+def gitlab_search(body, matching_pattern, base_url):
+    urls = []
+    for release in json.loads(body):
+        assets = release.get('assets', {})
+        for source in assets.get('sources', []):
+            urls.append(source['url'])
+        for link in assets.get('links', []):
+            urls.append(link['url'])
+    return _match_urls(urls, matching_pattern)
 
 
 searchers = {
     'plain': plain_search,
     'html': html_search,
+    'git': git_search,
+    'pypi': pypi_search,
+    'crates': crates_search,
+    'github': github_search,
+    'gitlab': gitlab_search,
     }
 
 
@@ -274,20 +500,29 @@ class Watch:
 
     def __init__(self, url: str, matching_pattern: Optional[str] = None,
                  version: Optional[str] = None, script: Optional[str] = None,
-                 opts: Optional[List[str]] = None) -> None:
+                 opts: Optional[Iterable[str]] = None) -> None:
         self.url = url
         self.matching_pattern = matching_pattern
         self.version = version
         self.script = script
-        if opts is None:
-            opts = []
-        self.options = opts
+        self.options = opts  # type: ignore
+
+    @property
+    def options(self) -> WatchOptions:
+        return self._options
+
+    @options.setter
+    def options(self, options: Optional[Iterable[str]]) -> None:
+        if not isinstance(options, WatchOptions):
+            options = WatchOptions(options)
+        self._options = options
 
     def uversionmangle(self, version):
         try:
             vm = self.get_option('uversionmangle')
         except KeyError:
             return version
+        import pcre
         try:
             return apply_sed_expr(vm, version)
         except pcre.error as e:
@@ -295,49 +530,16 @@ class Watch:
                 'invalid uversionmangle {!r}: {}'.format(vm, e)) from e
 
     def get_option(self, name):
-        for option in self.options:
-            try:
-                key, value = option.split('=', 1)
-            except ValueError:
-                key = option
-                value = None
-            if key == name:
-                return value
-        raise KeyError(name)
+        return self.options.get(name)
 
-    def has_option(self, name):
-        try:
-            self.get_option(name)
-        except KeyError:
-            return False
-        return True
+    def has_option(self, name: str) -> bool:
+        return self.options.has(name)
 
-    def set_option(self, name, newvalue=None):
-        if newvalue is None:
-            nv = name
-        else:
-            nv = '{}={}'.format(name, newvalue)
-        for i, option in enumerate(self.options):
-            try:
-                key, value = option.split('=', 1)
-            except ValueError:
-                key = option
-                value = None
-            if key == value:
-                self.options[i] = nv
-                return
-        self.options.append(nv)
-
-    def del_option(self, name):
-        for i, option in enumerate(self.options):
-            try:
-                key, value = option.split('=', 1)
-            except ValueError:
-                key = option
-            if key == name:
-                del self.options[i]
-                return
-        raise KeyError(name)
+    def set_option(self, name: str, newvalue: Optional[str] = None) -> None:
+        self.options.set(name, newvalue)
+
+    def del_option(self, name: str) -> None:
+        self.options.delete(name)
 
     def __repr__(self) -> str:
         return (
@@ -345,7 +547,7 @@ class Watch:
              "version={!r}, script={!r}, opts={!r})")
             .format(
                 self.__class__.__name__, self.url, self.matching_pattern,
-                self.version, self.script, self.options))
+                self.version, self.script, list(self.options)))
 
     def __eq__(self, other: object) -> bool:
         if not isinstance(other, Watch):
@@ -356,6 +558,24 @@ class Watch:
                 other.script == self.script and
                 other.options == self.options)
 
+    def searchmode(self) -> str:
+        """Return the search mode to use for this entry.
+
+        This is the searchmode option if set, 'git' for entries with
+        mode=git and 'html' otherwise.
+        """
+        try:
+            return self.get_option('searchmode')
+        except KeyError:
+            pass
+        try:
+            mode = self.get_option('mode')
+        except KeyError:
+            return 'html'
+        if mode == 'git':
+            return 'git'
+        return 'html'
+
     def format_url(self, package: Union[str, Callable[[], str]]) -> str:
         return _subst(self.url, package)
 
@@ -366,18 +586,23 @@ class Watch:
             user_agent = self.get_option('user-agent')
         except KeyError:
             user_agent = DEFAULT_USER_AGENT
-        try:
-            searchmode = self.get_option('searchmode')
-        except KeyError:
-            searchmode = 'html'
-        logging.debug('Fetching url %s; searchmode=%s', url, searchmode)
-        req = Request(url, headers={'User-Agent': user_agent})
+        searchmode = self.searchmode()
+        if searchmode == 'git':
+            fetch_url = git_info_refs_url(url)
+        else:
+            fetch_url = url
+        logging.debug('Fetching url %s; searchmode=%s', fetch_url, searchmode)
+        req = Request(fetch_url, headers={'User-Agent': user_agent})
         resp = urlopen(req)
         assert self.matching_pattern
         for m in searchers[searchmode](
                 resp.read(), _subst(self.matching_pattern, package), url):
             # TODO(jelmer): Apply uversionmangle
-            full_url = urljoin(url, m.group(0))
+            if searchmode == 'git':
+                full_url = unsplit_vcs_url(
+                    url, re.sub('^refs/(tags|heads)/', '', m.group(0)))
+            else:
+                full_url = urljoin(url, m.group(0))
             try:
                 pgpsigurlmangle = self.get_option('pgpsigurlmangle')
             except KeyError:
@@ -395,82 +620,102 @@ class WatchSyntaxError(Exception):
     """Syntax error in watch file."""
 
 
+_PATTERN_IN_URL_RE = re.compile(r'/([^/]*\([^/]*\)[^/]*)$')
+
+
+def _parse_version_line(line: str) -> int:
+    try:
+        key, value = line.split('=', 1)
+    except ValueError:
+        raise MissingVersion()
+    if key.strip() != 'version':
+        raise MissingVersion()
+    return int(value.strip())
+
+
+def _parse_watch_line(
+        line: str) -> Tuple[Optional[List[str]], Optional[Watch]]:
+    """Parse a single logical line from a watch file.
+
+    Args:
+      line: Line to parse, with continuations joined and whitespace stripped
+    Returns:
+      tuple with options and entry; the entry is None for lines that only
+      set persistent options
+    """
+    opts: Optional[List[str]] = None
+    if line.startswith('opts='):
+        if line[5:6] == '"':
+            optend = line.find('"', 6)
+            if optend == -1:
+                raise ValueError('Not matching " in %r' % line)
+            opts_str = line[6:optend]
+            line = line[optend+1:]
+        else:
+            try:
+                (opts_str, line) = line[5:].split(maxsplit=1)
+            except ValueError:
+                opts_str = line[5:]
+                line = ''
+        opts = opts_str.split(',')
+    if not line:
+        return opts, None
+    try:
+        url, line = line.split(maxsplit=1)
+    except ValueError:
+        url = line.strip()
+        line = ''
+    m = _PATTERN_IN_URL_RE.search(url)
+    if m:
+        parts = [m.group(1)] + line.split(maxsplit=1)
+        url = url[:m.start()].strip()
+    else:
+        parts = line.split(maxsplit=2)
+    return opts, Watch(url, *parts, opts=opts)  # type: ignore
+
+
 def parse_watch_file(f: Iterable[str]) -> Optional[WatchFile]:
     """Parse a watch file.
 
     Args:
       f: watch file to parse
     """
-    line: Optional[str]
-    lines: List[List[str]] = []
+    version: Optional[int] = None
+    persistent_options: List[str] = []
+    entries: List[Watch] = []
     continued: List[str] = []
+
+    def process(chunks: List[str]) -> None:
+        nonlocal version
+        if version is None:
+            version = _parse_version_line(''.join(chunks))
+            return
+        if version > 3:
+            chunks = [chunk.lstrip() for chunk in chunks]
+        line = ''.join(chunks).strip()
+        if not line:
+            return
+        opts, entry = _parse_watch_line(line)
+        if entry is not None:
+            entries.append(entry)
+        elif opts:
+            persistent_options.extend(opts)
+
     for line in f:
-        if line.startswith('#'):
-            continue
-        if not line.strip():
+        if line.startswith('#') or not line.strip():
             continue
-        if line.rstrip('\n').endswith('\\'):
+        if line.endswith('\\\n') or line.endswith('\\'):
             continued.append(line.rstrip('\n\\'))
-        else:
-            continued.append(line)
-            lines.append(continued)
-            continued = []
+            continue
+        continued.append(line)
+        process(continued)
+        continued = []
     if continued:
         # Hmm, broken line?
         logging.warning('watchfile ended with \\; skipping last line')
-        lines.append(continued)
-    if not lines:
+        process(continued)
+    if version is None:
         return None
-    firstline = ''.join(lines.pop(0))
-    try:
-        key, value = firstline.split('=', 1)
-    except ValueError:
-        raise MissingVersion()
-    if key.strip() != 'version':
-        raise MissingVersion()
-    version = int(value.strip())
-    persistent_options: List[str] = []
-    entries: List[Watch] = []
-    chunked: List[str]
-    for chunked in lines:
-        if version > 3:
-            chunked = [chunk.lstrip() for chunk in chunked]
-        line = ''.join(chunked).strip()
-        if not line:
-            continue
-        opts: Optional[List[str]]
-        if line.startswith('opts='):
-            if line[5] == '"':
-                optend = line.index('"', 6)
-                if optend == -1:
-                    raise ValueError('Not matching " in %r' % line)
-                opts_str = line[6:optend]
-                line = line[optend+1:]
-            else:
-                try:
-                    (opts_str, line) = line[5:].split(maxsplit=1)
-                except ValueError:
-                    opts_str = line[5:]
-                    line = None
-            opts = opts_str.split(',')
-        else:
-            opts = None
-        if not line:
-            if opts:
-                persistent_options.extend(opts)
-        else:
-            try:
-                url, line = line.split(maxsplit=1)
-            except ValueError:
-                url = line
-                line = ''
-            m = pcre.findall(r'/([^/]*\([^/]*\)[^/]*)$', url)
-            if m:
-                parts = [m[0]] + line.split(maxsplit=1)
-                url = url[:-len(m[0])-1].strip()
-            else:
-                parts = line.split(maxsplit=2)
-            entries.append(Watch(url, *parts, opts=opts))  # type: ignore
     return WatchFile(
         entries=entries, options=persistent_options, version=version)
 
@@ -0,0 +1,269 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Offline resolution of upstream versions from cached listings.
+
+Discovering upstream releases requires network access. The store in this
+module keeps the results of earlier discovery runs around, so that questions
+like "is there a newer upstream release than the packaged one?" can be
+answered for many packages from local data only.
+"""
+
+__all__ = [
+    'UpstreamListingStore',
+    'UpstreamStatus',
+    'discover_and_record',
+    'newest_upstream_release',
+    'upstream_status',
+    'iter_upstream_status',
+]
+
+import logging
+import os
+import time
+from typing import (Dict, Iterable, Iterator, List, NamedTuple, Optional,
+                    Tuple)
+
+from debian.changelog import Changelog, Version
+
+from ._persist import JsonStore
+from .versions import strip_dfsg_suffix, version_sort_key
+from .watch import (Release, Watch, WatchFile, apply_sed_expr,
+                    parse_watch_file)
+
+STORE_FORMAT_VERSION = 1
+
+
+def _entry_key(entry: Watch) -> str:
+    return '{} {}'.format(entry.url, entry.matching_pattern or '')
+
+
+class UpstreamListingStore(JsonStore):
+    """Locally persisted store of discovered upstream releases.
+
+    Listings are stored per source package and per watch entry, using the
+    unsubstituted URL and matching pattern of the entry as key.
+    """
+
+    _format_version = STORE_FORMAT_VERSION
+    _format_kind = 'store'
+
+    _listings: Dict[str, Dict[str, Tuple[float, List[Release]]]]
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        self._listings = {}
+        super().__init__(path)
+
+    def _load(self, data) -> None:
+        for package, entries in data['listings'].items():
+            self._listings[package] = {
+                key: (timestamp, [Release(*r) for r in releases])
+                for key, (timestamp, releases) in entries.items()}
+
+    def _dump(self):
+        return {
+            'listings': {
+                package: {
+                    key: (timestamp, [
+                        (r.version, r.url, r.pgpsigurl) for r in releases])
+                    for key, (timestamp, releases) in entries.items()}
+                for package, entries in self._listings.items()},
+        }
+
+    def record(self, package: str, entry: Watch,
+               releases: Iterable[Release],
+               timestamp: Optional[float] = None) -> None:
+        """Record the releases discovered for a watch entry.
+
+        Args:
+          package: Source package name
+          entry: Watch entry the releases were discovered for
+          releases: Discovered releases
+          timestamp: Time of discovery (defaults to now)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        self._listings.setdefault(package, {})[_entry_key(entry)] = (
+            timestamp, list(releases))
+        self._dirty = True
+
+    def releases(self, package: str, entry: Watch) -> List[Release]:
+        """Return the recorded releases for a watch entry.
+
+        Raises:
+          KeyError: if no listing was recorded for the entry
+        """
+        return self._listings[package][_entry_key(entry)][1]
+
+    def last_updated(self, package: str, entry: Watch) -> float:
+        """Return the time at which a listing was last recorded.
+
+        Raises:
+          KeyError: if no listing was recorded for the entry
+        """
+        return self._listings[package][_entry_key(entry)][0]
+
+    def packages(self) -> List[str]:
+        return list(self._listings)
+
+    def __contains__(self, package: object) -> bool:
+        return package in self._listings
+
+
+def discover_and_record(
+        store: UpstreamListingStore, wf: WatchFile,
+        package: str) -> List[Release]:
+    """Discover releases for all entries in a watch file and record them.
+
+    Args:
+      store: Store to record listings in
+      wf: Watch file
+      package: Source package name
+    Returns:
+      list of all discovered releases
+    """
+    ret = []
+    for entry in wf.entries:
+        releases = list(entry.discover(package))
+        store.record(package, entry, releases)
+        ret.extend(releases)
+    return ret
+
+
+def _get_option(wf: WatchFile, entry: Watch, name: str) -> Optional[str]:
+    try:
+        return entry.get_option(name)
+    except KeyError:
+        pass
+    try:
+        return wf.get_option(name)
+    except KeyError:
+        return None
+
+
+def _packaged_upstream_version(
+        wf: WatchFile, version: Version) -> Optional[str]:
+    upstream_version = version.upstream_version
+    if upstream_version is None:
+        return None
+    for entry in wf.entries:
+        dversionmangle = _get_option(wf, entry, 'dversionmangle')
+        if dversionmangle is None:
+            continue
+        if dversionmangle == 'auto':
+            return strip_dfsg_suffix(upstream_version)
+        return apply_sed_expr(dversionmangle, upstream_version)
+    return upstream_version
+
+
+def newest_upstream_release(
+        store: UpstreamListingStore, wf: WatchFile,
+        package: str) -> Optional[Release]:
+    """Find the newest recorded upstream release for a package.
+
+    Args:
+      store: Store with upstream listings
+      wf: Watch file for the package
+      package: Source package name
+    Returns:
+      newest release (with uversionmangle applied), or None if no
+      releases were recorded
+    """
+    newest: Optional[Tuple[tuple, Release]] = None
+    for entry in wf.entries:
+        try:
+            releases = store.releases(package, entry)
+        except KeyError:
+            continue
+        for release in releases:
+            mangled = entry.uversionmangle(release.version)
+            try:
+                Version(mangled)
+            except ValueError:
+                logging.debug(
+                    'Ignoring invalid upstream version %r for %s',
+                    mangled, package)
+                continue
+            key = version_sort_key(mangled)
+            if newest is None or key > newest[0]:
+                newest = (key, Release(
+                    mangled, release.url, pgpsigurl=release.pgpsigurl))
+    if newest is None:
+        return None
+    return newest[1]
+
+
+class UpstreamStatus(NamedTuple):
+    """Upstream status of a package."""
+
+    package: str
+    packaged_version: Optional[str]
+    newest: Optional[Release]
+
+    @property
+    def outdated(self) -> Optional[bool]:
+        """Whether a newer upstream release is available.
+
+        None if this can not be determined from the available data.
+        """
+        if self.newest is None or self.packaged_version is None:
+            return None
+        return (version_sort_key(self.newest.version)
+                > version_sort_key(self.packaged_version))
+
+
+def upstream_status(
+        store: UpstreamListingStore, path: str = '.',
+        package: Optional[str] = None) -> UpstreamStatus:
+    """Determine the upstream status of a package from local data.
+
+    Args:
+      store: Store with upstream listings
+      path: Path to the package tree
+      package: Source package name (defaults to the name in the changelog)
+    Returns:
+      an UpstreamStatus
+    """
+    with open(os.path.join(path, 'debian/changelog')) as f:
+        cl = Changelog(f, max_blocks=1, strict=False)
+    if package is None:
+        package = cl.package
+    try:
+        with open(os.path.join(path, 'debian/watch')) as f:
+            wf = parse_watch_file(f)
+    except FileNotFoundError:
+        wf = None
+    if wf is None:
+        return UpstreamStatus(package, None, None)
+    return UpstreamStatus(
+        package, _packaged_upstream_version(wf, cl.version),
+        newest_upstream_release(store, wf, package))
+
+
+def iter_upstream_status(
+        store: UpstreamListingStore,
+        paths: Iterable[str]) -> Iterator[UpstreamStatus]:
+    """Determine the upstream status for a set of package trees.
+
+    Args:
+      store: Store with upstream listings
+      paths: Paths to package trees
+    Returns:
+      iterator over UpstreamStatus objects
+    """
+    for path in paths:
+        yield upstream_status(store, path)
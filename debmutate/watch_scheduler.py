@@ -0,0 +1,315 @@
+#!/usr/bin/python3
+# Copyright (C) 2023 Jelmer Vernooij <jelmer@debian.org>
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Rate-limited scheduling of upstream discovery for many packages.
+
+Watch entries for many packages tend to point at a small set of hosts. The
+scheduler in this module runs discovery for a large set of watch files in
+parallel, while limiting the request rate per host.
+"""
+
+__all__ = [
+    'TokenBucket',
+    'DiscoveryResult',
+    'UscanScheduler',
+    'host_for_entry',
+    'parse_retry_after',
+]
+
+import heapq
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import (Callable, Deque, Dict, Iterable, Iterator, List,
+                    NamedTuple, Optional, Set, Tuple)
+from urllib.error import HTTPError
+from urllib.parse import urlparse
+
+from .watch import Release, Watch, WatchFile
+
+# HTTP status codes that indicate the host wants us to back off.
+RETRY_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """Token bucket rate limiter.
+
+    This class is not thread-safe; callers are expected to serialize access.
+    """
+
+    def __init__(self, rate: float, burst: float = 1,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        if rate <= 0:
+            raise ValueError('rate must be positive: %r' % rate)
+        if burst < 1:
+            raise ValueError('burst must be at least 1: %r' % burst)
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._tokens = float(burst)
+        self._last = clock()
+        self._blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        if now > self._last:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+
+    def delay(self, now: Optional[float] = None) -> float:
+        """Return the number of seconds until a token is available."""
+        if now is None:
+            now = self._clock()
+        self._refill(now)
+        wait = max(0.0, (1 - self._tokens) / self.rate)
+        return max(wait, self._blocked_until - now)
+
+    def consume(self, now: Optional[float] = None) -> None:
+        """Take a token from the bucket."""
+        if now is None:
+            now = self._clock()
+        self._refill(now)
+        self._tokens -= 1
+
+    def block_until(self, when: float) -> None:
+        """Do not hand out any tokens before the specified time."""
+        self._blocked_until = max(self._blocked_until, when)
+
+
+def parse_retry_after(
+        value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Parse a Retry-After header.
+
+    Args:
+      value: Header value; either a number of seconds or a HTTP date
+      now: Current (wall clock) time
+    Returns:
+      number of seconds to wait, or None if the value could not be parsed
+    """
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    if now is None:
+        now = time.time()
+    return max(0.0, when.timestamp() - now)
+
+
+def host_for_entry(entry: Watch, package: str) -> str:
+    """Return the host that discovery for a watch entry will contact."""
+    return urlparse(entry.format_url(package)).hostname or ''
+
+
+class DiscoveryResult(NamedTuple):
+    """Result of running discovery for a single watch entry."""
+
+    package: str
+    entry: Watch
+    releases: Optional[List[Release]]
+    error: Optional[Exception]
+
+
+def _discover(entry: Watch, package: str) -> List[Release]:
+    return list(entry.discover(package))
+
+
+class UscanScheduler:
+    """Run upstream discovery for many watch files.
+
+    Entries are grouped by host. Requests to each host are limited by a token
+    bucket, hosts that respond with 429 or 503 are backed off (honouring
+    Retry-After if present) and the total number of requests in flight is
+    limited by max_workers.
+    """
+
+    def __init__(self, max_workers: int = 8, rate: float = 1.0,
+                 burst: float = 1,
+                 host_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 max_retries: int = 5, backoff: float = 1.0,
+                 max_backoff: float = 600.0,
+                 clock: Callable[[], float] = time.monotonic) -> None:
+        """Create a new scheduler.
+
+        Args:
+          max_workers: Maximum number of requests in flight
+          rate: Default number of requests per second per host
+          burst: Default burst size per host
+          host_limits: Dictionary mapping host names to (rate, burst) tuples
+          max_retries: Maximum number of retries for throttled requests
+          backoff: Initial backoff (in seconds) for throttled requests
+          max_backoff: Maximum backoff (in seconds)
+          clock: Monotonic clock to use
+        """
+        self.max_workers = max_workers
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = host_limits or {}
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._clock = clock
+
+    def _bucket(self, host: str) -> TokenBucket:
+        rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+        return TokenBucket(rate, burst, clock=self._clock)
+
+    def _retry_delay(self, error: HTTPError, attempt: int) -> float:
+        headers = error.headers
+        delay = parse_retry_after(
+            headers.get('Retry-After') if headers is not None else None)
+        if delay is None:
+            delay = self.backoff * (2 ** attempt)
+        return min(delay, self.max_backoff)
+
+    def run(self, jobs: Iterable[Tuple[str, WatchFile]],
+            discover: Callable[[Watch, str], List[Release]] = _discover
+            ) -> Iterator[DiscoveryResult]:
+        """Run discovery for a set of watch files.
+
+        Args:
+          jobs: Iterable over (package, watch file) tuples
+          discover: Function that runs discovery for a single entry
+        Returns:
+          iterator over DiscoveryResult objects, in order of completion
+        """
+        pending: Dict[str, Deque[Tuple[str, Watch, int]]] = {}
+        total = 0
+        for package, wf in jobs:
+            for entry in wf.entries:
+                pending.setdefault(
+                    host_for_entry(entry, package), deque()).append(
+                        (package, entry, 0))
+                total += 1
+        if not total:
+            return
+        buckets = {host: self._bucket(host) for host in pending}
+        now = self._clock()
+        heap = [(now, host) for host in pending]
+        heapq.heapify(heap)
+        in_heap: Set[str] = set(pending)
+        cond = threading.Condition()
+        results: 'queue.Queue[DiscoveryResult]' = queue.Queue()
+        state = {'in_flight': 0, 'queued': total, 'stopped': False}
+
+        def schedule(host: str) -> None:
+            # Called with cond held
+            if host not in in_heap and pending[host]:
+                when = self._clock() + buckets[host].delay()
+                heapq.heappush(heap, (when, host))
+                in_heap.add(host)
+
+        def next_job() -> Optional[Tuple[str, Tuple[str, Watch, int]]]:
+            with cond:
+                while not state['stopped']:
+                    if not heap:
+                        if not state['in_flight']:
+                            return None
+                        # Jobs in flight may still be requeued
+                        cond.wait()
+                        continue
+                    host = heap[0][1]
+                    now = self._clock()
+                    delay = buckets[host].delay(now)
+                    if delay > 0:
+                        heapq.heapreplace(heap, (now + delay, host))
+                        if heap[0][0] > now:
+                            cond.wait(heap[0][0] - now)
+                        continue
+                    heapq.heappop(heap)
+                    in_heap.discard(host)
+                    buckets[host].consume(now)
+                    job = pending[host].popleft()
+                    state['queued'] -= 1
+                    state['in_flight'] += 1
+                    schedule(host)
+                    return host, job
+                return None
+
+        def retry(host: str, package: str, entry: Watch, attempt: int,
+                  error: HTTPError) -> None:
+            delay = self._retry_delay(error, attempt)
+            logging.info(
+                '%s: throttled by %s (HTTP %d); retrying in %.1fs',
+                package, host, error.code, delay)
+            with cond:
+                buckets[host].block_until(self._clock() + delay)
+                pending[host].appendleft((package, entry, attempt + 1))
+                state['queued'] += 1
+                schedule(host)
+
+        def worker() -> None:
+            while True:
+                item = next_job()
+                if item is None:
+                    return
+                host, (package, entry, attempt) = item
+                result: Optional[DiscoveryResult] = None
+                requeued = False
+                try:
+                    releases = discover(entry, package)
+                except HTTPError as e:
+                    result = DiscoveryResult(package, entry, None, e)
+                    if (e.code in RETRY_STATUS_CODES
+                            and attempt < self.max_retries):
+                        try:
+                            retry(host, package, entry, attempt, e)
+                        except Exception:
+                            logging.exception(
+                                '%s: unable to schedule retry', package)
+                        else:
+                            requeued = True
+                except Exception as e:
+                    result = DiscoveryResult(package, entry, None, e)
+                else:
+                    result = DiscoveryResult(package, entry, releases, None)
+                finally:
+                    # Every job that is not requeued has to produce a
+                    # result, or the consumer would wait forever.
+                    with cond:
+                        state['in_flight'] -= 1
+                        cond.notify_all()
+                    if not requeued:
+                        if result is None:
+                            result = DiscoveryResult(
+                                package, entry, None,
+                                RuntimeError('discovery aborted'))
+                        results.put(result)
+
+        threads = [
+            threading.Thread(target=worker, daemon=True)
+            for i in range(min(self.max_workers, total))]
+        for thread in threads:
+            thread.start()
+        try:
+            for i in range(total):
+                yield results.get()
+        finally:
+            with cond:
+                state['stopped'] = True
+                cond.notify_all()
+            for thread in threads:
+                thread.join()
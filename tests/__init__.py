@@ -72,18 +72,27 @@ class TestCaseInTempDir(TestCase):
 def test_suite():
     names = [
         'changelog',
+        'changelog_analysis',
+        'changelog_bugs',
+        'changelog_index',
+        'changelog_scan',
         'control',
         'copyright',
         'deb822',
         'debcargo',
         'debhelper',
         'debmutate',
+        'lintian_override_check',
         'lintian_overrides',
         'patch',
         'reformatting',
+        'relation_graph',
+        'tree',
         'vcs',
         'versions',
         'watch',
+        'watch_cache',
+        'watch_scheduler',
         '_rules',
         ]
     module_names = [__name__ + '.test_' + name for name in names]
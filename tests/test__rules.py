@@ -17,10 +17,16 @@
 
 """Tests for debmutate.rules."""
 
-from debmutate._rules import (Makefile, Rule, dh_invoke_add_with,
+import os
+
+from debmutate._cache import FileCache
+from debmutate._rules import (Assignment, Conditional, DhInvocation, Include,
+                              Makefile, Rule, RulesEditor,
+                              RulesTransformPipeline,
+                              RulesTree, check_cdbs, dh_invoke_add_with,
                               dh_invoke_drop_with, dh_invoke_get_with,
-                              discard_pointless_override, matches_wildcard,
-                              update_rules)
+                              discard_pointless_override, load_rules_tree,
+                              matches_wildcard, update_rules)
 
 from . import TestCase, TestCaseInTempDir
 
@@ -211,6 +217,97 @@ all:
 """, 'debian/rules')
 
 
+class RulesTransformPipelineTests(TestCaseInTempDir):
+
+    def setUp(self):
+        super().setUp()
+        self.build_tree_contents([('debian/', ), ('debian/rules', """\
+SOMETHING = 1
+OBSOLETE = 1
+
+%:
+\tdh $@
+
+override_dh_auto_build:
+\techo blah
+\tdh_auto_build
+""")])
+
+    def test_many_transforms(self):
+        seen = []
+
+        def drop_echo(line, target):
+            seen.append(line)
+            if line.startswith(b'echo '):
+                return []
+            return line
+
+        def split(line, target):
+            if line == b'dh $@':
+                return [line, b'echo done']
+            return line
+
+        def drop_obsolete(line):
+            if line.startswith(b'OBSOLETE'):
+                return None
+            return line
+
+        pipeline = RulesTransformPipeline()
+        pipeline.add_command_line_transform(drop_echo)
+        pipeline.add_command_line_transform(split)
+        pipeline.add_global_line_transform(drop_obsolete)
+        with RulesEditor() as editor:
+            self.assertTrue(editor.apply_transforms(pipeline))
+        # Each line is visited once, even with multiple transforms
+        self.assertEqual([b'dh $@', b'echo blah', b'dh_auto_build'], seen)
+        # The override that became pointless is dropped
+        self.assertFileEqual("""\
+SOMETHING = 1
+
+%:
+\tdh $@
+\techo done
+""", 'debian/rules')
+
+    def test_unchanged(self):
+        pipeline = RulesTransformPipeline()
+        pipeline.add_command_line_transform(lambda line, target: line)
+        pipeline.add_global_line_transform(lambda line: line)
+        pipeline.add_rule_transform(lambda rule: None)
+        pipeline.add_makefile_transform(lambda mf: None)
+        with RulesEditor() as editor:
+            self.assertFalse(editor.apply_transforms(pipeline))
+        self.assertFalse(editor.changed)
+
+    def test_legacy_update_unchanged(self):
+        formatted = []
+
+        class CountingRulesEditor(RulesEditor):
+
+            def _format(self, parsed):
+                formatted.append(parsed)
+                return super()._format(parsed)
+
+        with CountingRulesEditor() as editor:
+            del formatted[:]
+            self.assertFalse(editor.legacy_update(
+                command_line_cb=lambda line, target: line,
+                global_line_cb=lambda line: line))
+            # Nothing was serialized to find out whether there were changes
+            self.assertEqual([], formatted)
+
+    def test_rule_transform(self):
+        def add_component(rule):
+            if rule.target == b'override_dh_auto_build':
+                rule.append_component(b'build-stamp')
+        pipeline = RulesTransformPipeline()
+        pipeline.add_rule_transform(add_component)
+        with RulesEditor() as editor:
+            self.assertTrue(editor.apply_transforms(pipeline))
+        self.assertIn(b'override_dh_auto_build: build-stamp\n',
+                      editor.makefile.dump())
+
+
 class MakefileTests(TestCase):
 
     def test_add_rule(self):
@@ -259,6 +356,84 @@ all:
         self.assertEqual(b'4', mf.get_variable(b'SOMETHING_EXPORTED'))
         self.assertRaises(KeyError, mf.get_variable, b'SOMETHING_MISSING')
 
+    def test_get_variable_first_wins(self):
+        mf = Makefile.from_bytes(b"""\
+SOMETHING = 1
+SOMETHING = 2
+""")
+        self.assertEqual(b'1', mf.get_variable(b'SOMETHING'))
+        mf.contents.insert(0, b'SOMETHING = 0')
+        self.assertEqual(b'0', mf.get_variable(b'SOMETHING'))
+
+    def test_iter_rules_after_changes(self):
+        mf = Makefile.from_bytes(b"""\
+all:
+\techo blah
+
+override_dh_%:
+\tdh $@
+""")
+        self.assertEqual([], list(mf.iter_rules(b'build')))
+        build = mf.add_rule(b'build')
+        self.assertEqual([build], list(mf.iter_rules(b'build')))
+        build.rename_target(b'build', b'build-arch')
+        self.assertEqual([], list(mf.iter_rules(b'build')))
+        self.assertEqual([build], list(mf.iter_rules(b'build-arch')))
+        mf.contents = [build]
+        self.assertEqual([], list(mf.iter_rules(b'all')))
+
+    def test_index_invalidation(self):
+        mf = Makefile.from_bytes(b"""\
+all:
+\techo blah
+""")
+        all_rule = next(mf.iter_rules(b'all'))
+        index = mf._get_index()
+        # Rules that are not part of the makefile don't affect its index
+        other = Makefile.from_bytes(b'build:\n')
+        Rule(b'clean')
+        next(other.iter_rules(b'build')).target = b'build-arch'
+        self.assertIs(index, mf._get_index())
+        all_rule.target = b'all-arch'
+        self.assertIsNot(index, mf._get_index())
+        self.assertEqual([all_rule], list(mf.iter_rules(b'all-arch')))
+
+    def test_iter_rules_wildcard(self):
+        mf = Makefile.from_bytes(b"""\
+override_dh_%:
+\tdh $@
+
+override_dh_auto_build:
+\tdh_auto_build
+
+%:
+\tdh $@
+""")
+        self.assertEqual(
+            [b'override_dh_auto_build'],
+            [r.target for r in mf.iter_rules(b'override_dh_auto_build')])
+        self.assertEqual(
+            [b'override_dh_%', b'override_dh_auto_build', b'%'],
+            [r.target for r in mf.iter_rules(
+                b'override_dh_auto_build', exact=False)])
+        self.assertEqual(
+            [b'%'], [r.target for r in mf.iter_rules(b'build', exact=False)])
+
+    def test_mark_phony(self):
+        mf = Makefile.from_bytes(b"""\
+all:
+\techo blah
+""")
+        mf.mark_phony(b'all')
+        mf.mark_phony(b'all')
+        mf.mark_phony(b'clean')
+        self.assertEqual(b"""\
+all:
+\techo blah
+
+.PHONY: all clean
+""", mf.dump())
+
 
 class InvokeDropWithTests(TestCase):
 
@@ -328,6 +503,139 @@ class InvokeAddWithTests(TestCase):
             dh_invoke_add_with(b'dh --with=foo --other', b'blah'))
 
 
+class DhInvocationTests(TestCase):
+
+    def modify(self, line, cb):
+        invocation = DhInvocation.parse(line)
+        assert invocation is not None
+        cb(invocation)
+        return bytes(invocation)
+
+    def test_not_dh(self):
+        self.assertIs(None, DhInvocation.parse(b'dh_install foo'))
+        self.assertIs(None, DhInvocation.parse(b''))
+
+    def test_roundtrip(self):
+        for line in [b'dh $@', b'dh  $@\t--with=foo   --buildsystem cmake',
+                     b'@dh $@ --with "a b" || true # comment']:
+            self.assertEqual(line, self.modify(line, lambda i: None))
+
+    def test_parse(self):
+        invocation = DhInvocation.parse(
+            b'dh $@ --with python3 --with=sphinxdoc,gir -Scmake --parallel '
+            b'&& touch stamp')
+        assert invocation is not None
+        self.assertEqual(b'$@', invocation.sequence)
+        self.assertEqual(
+            [b'python3', b'sphinxdoc', b'gir'], invocation.get_with())
+        self.assertEqual(b'cmake', invocation.buildsystem)
+        self.assertEqual([b'$@'], invocation.arguments)
+        self.assertTrue(invocation.has_argument(b'--parallel'))
+        self.assertEqual(b' && touch stamp', invocation.tail)
+
+    def test_options_with_value(self):
+        for line in [b'dh -D src $@', b'dh --sourcedirectory src $@',
+                     b'dh -B build $@ -Dsrc', b'dh -p foo $@ --package bar',
+                     b'dh -N foo -Pdebian/tmp $@ --tmpdir x',
+                     b'dh --builddirectory=build $@ --no-package foo']:
+            invocation = DhInvocation.parse(line)
+            assert invocation is not None
+            self.assertEqual(b'$@', invocation.sequence, line)
+            self.assertEqual([b'$@'], invocation.arguments, line)
+            self.assertEqual(line, bytes(invocation))
+
+    def test_fd_redirection(self):
+        invocation = DhInvocation.parse(b'dh $@ --with a 2>&1 | tee log')
+        assert invocation is not None
+        self.assertEqual([b'$@'], invocation.arguments)
+        self.assertEqual([b'a'], invocation.get_with())
+        self.assertEqual(b' 2>&1 | tee log', invocation.tail)
+        self.assertEqual(
+            b'dh $@ --with a,b 2>&1 | tee log',
+            self.modify(b'dh $@ --with a 2>&1 | tee log',
+                        lambda i: i.add_with(b'b')))
+
+    def test_pass_through_options(self):
+        self.assertEqual(
+            b'dh $@ --with=python3 -- -O--foo',
+            self.modify(b'dh $@ -- -O--foo',
+                        lambda i: i.add_with(b'python3')))
+        self.assertEqual(
+            b'dh $@ --buildsystem=cmake -- --with=foo',
+            self.modify(b'dh $@ -- --with=foo',
+                        lambda i: setattr(i, 'buildsystem', b'cmake')))
+        invocation = DhInvocation.parse(b'dh $@ -- --with=foo bar')
+        assert invocation is not None
+        self.assertEqual([], invocation.get_with())
+        self.assertEqual([b'$@'], invocation.arguments)
+
+    def test_with(self):
+        self.assertEqual(
+            b'dh --with=blah',
+            self.modify(b'dh', lambda i: i.add_with(b'blah')))
+        self.assertEqual(
+            b'dh --with=foo,blah --other',
+            self.modify(b'dh --with=foo --other',
+                        lambda i: i.add_with(b'blah')))
+        self.assertEqual(
+            b'dh --with=foo --other',
+            self.modify(b'dh --with=foo --other',
+                        lambda i: i.add_with(b'foo')))
+        self.assertEqual(
+            b'dh $@ --verbose --with autoreconf,cme-upgrade',
+            self.modify(
+                b'dh $@ --verbose --with autoreconf,systemd,cme-upgrade',
+                lambda i: i.drop_with(b'systemd')))
+        self.assertEqual(
+            b'dh $@ --without autoreconf --buildsystem=cmake',
+            self.modify(
+                b'dh $@ --with systemd --without autoreconf '
+                b'--buildsystem=cmake',
+                lambda i: i.drop_with(b'systemd')))
+        self.assertEqual(
+            b'dh $@',
+            self.modify(b'dh $@ --with=systemd --with systemd',
+                        lambda i: i.drop_with(b'systemd')))
+
+    def test_buildsystem(self):
+        def set_meson(invocation):
+            invocation.buildsystem = b'meson'
+
+        def unset(invocation):
+            invocation.buildsystem = None
+        self.assertEqual(
+            b'dh $@ -Smeson', self.modify(b'dh $@ -Scmake', set_meson))
+        self.assertEqual(
+            b'dh $@ --buildsystem meson',
+            self.modify(b'dh $@ --buildsystem cmake', set_meson))
+        self.assertEqual(
+            b'dh $@ --buildsystem=meson', self.modify(b'dh $@', set_meson))
+        self.assertEqual(
+            b'dh $@ --foo',
+            self.modify(b'dh $@ -S cmake --foo', unset))
+
+    def test_arguments(self):
+        self.assertEqual(
+            b'dh $@ --with=foo',
+            self.modify(b'dh $@ --parallel --with=foo',
+                        lambda i: i.drop_argument(b'--parallel')))
+        self.assertEqual(
+            b'dh $@ --no-parallel',
+            self.modify(b'dh $@ --parallel',
+                        lambda i: i.replace_argument(
+                            b'--parallel', b'--no-parallel')))
+
+    def test_pipeline(self):
+        rule = Rule(b'%', commands=[b'dh $@ --with systemd', b'echo dh'])
+        mf = Makefile()
+        mf.contents.append(rule)
+        pipeline = RulesTransformPipeline()
+        pipeline.add_dh_transform(lambda i, target: i.drop_with(b'systemd'))
+        self.assertTrue(pipeline.apply(mf))
+        self.assertEqual([b'dh $@', b'echo dh'], rule.commands())
+        self.assertFalse(pipeline.apply(mf))
+
+
 class MatchesWildcardTests(TestCase):
 
     def test_some(self):
@@ -355,3 +663,115 @@ override_dh_blah:
         self.assertEqual(rule.lines, [])
         phony = next(mf.iter_rules(b'.PHONY'))
         self.assertEqual([], phony.components)
+
+
+class RulesTreeTests(TestCase):
+
+    def test_conditional(self):
+        tree = RulesTree.from_bytes(b"""\
+export DEB_BUILD_MAINT_OPTIONS = hardening=+all
+
+ifeq ($(DEB_HOST_ARCH),amd64)
+CFLAGS += -O3
+else ifneq (,$(filter nocheck,$(DEB_BUILD_OPTIONS)))
+CFLAGS += -O1
+else
+override_dh_auto_test:
+\tdh_auto_test -- -j1
+endif
+
+%:
+\tdh $@
+""")
+        self.assertEqual(
+            Assignment(b'DEB_BUILD_MAINT_OPTIONS', b'=', b'hardening=+all',
+                       export=True),
+            tree.nodes[0])
+        conditional = tree.nodes[1]
+        assert isinstance(conditional, Conditional)
+        self.assertEqual(
+            [(b'ifeq', b'($(DEB_HOST_ARCH),amd64)'),
+             (b'ifneq', b'(,$(filter nocheck,$(DEB_BUILD_OPTIONS)))'),
+             (b'else', b'')],
+            [(b.directive, b.condition) for b in conditional.branches])
+        self.assertTrue(tree.has_target(b'override_dh_auto_test'))
+        [rule] = tree.iter_rules(b'override_dh_auto_test')
+        self.assertEqual([b'dh_auto_test -- -j1'], rule.commands)
+        self.assertEqual(
+            b'hardening=+all', tree.get_variable(b'DEB_BUILD_MAINT_OPTIONS'))
+        self.assertEqual(b'-O3 -O1', tree.get_variable(b'CFLAGS'))
+        self.assertRaises(KeyError, tree.get_variable, b'LDFLAGS')
+
+    def test_define(self):
+        tree = RulesTree.from_bytes(b"""\
+define HELP
+line 1
+line 2
+endef
+""")
+        self.assertEqual(b'line 1\nline 2', tree.get_variable(b'HELP'))
+
+    def test_include(self):
+        tree = RulesTree.from_bytes(b"""\
+include /usr/share/cdbs/1/rules/debhelper.mk
+-include /usr/share/dpkg/*.mk
+""")
+        self.assertEqual(
+            [Include([b'/usr/share/cdbs/1/rules/debhelper.mk']),
+             Include([b'/usr/share/dpkg/*.mk'], optional=True)],
+            list(tree.iter_includes()))
+        self.assertTrue(tree.uses_cdbs())
+
+
+class LoadRulesTreeTests(TestCaseInTempDir):
+
+    def test_follow_includes(self):
+        self.build_tree_contents([
+            ('debian/', ),
+            ('debian/rules', """\
+include debian/*.mk
+include $(CURDIR)/debian/missing.mk
+-include debian/nonexistent.mk
+
+%:
+\tdh $@
+"""),
+            ('debian/vars.mk', """\
+DEB_BUILD_MAINT_OPTIONS = hardening=+all
+include debian/vars.mk
+""")])
+        tree = load_rules_tree('debian/rules')
+        self.assertRaises(
+            KeyError, tree.get_variable, b'DEB_BUILD_MAINT_OPTIONS')
+        self.assertEqual(
+            b'hardening=+all',
+            tree.get_variable(b'DEB_BUILD_MAINT_OPTIONS',
+                              follow_includes=True))
+
+    def test_cached(self):
+        self.build_tree_contents([
+            ('debian/', ),
+            ('debian/rules',
+             'include /usr/share/cdbs/1/rules/debhelper.mk\n')])
+        cache: FileCache[RulesTree] = FileCache(maxsize=1)
+        tree = load_rules_tree('debian/rules', cache=cache)
+        self.assertIs(tree, load_rules_tree('debian/rules', cache=cache))
+        self.assertIsNot(tree, load_rules_tree('debian/rules'))
+        self.assertTrue(check_cdbs('debian/rules'))
+        with open('debian/rules', 'w') as f:
+            f.write('%:\n\tdh $@\n')
+        self.assertIsNot(tree, load_rules_tree('debian/rules', cache=cache))
+        self.assertFalse(check_cdbs('debian/rules'))
+        os.unlink('debian/rules')
+        self.assertFalse(check_cdbs('debian/rules'))
+
+    def test_cache_bounded(self):
+        self.build_tree_contents([
+            ('debian/', ), ('debian/rules', 'include debian/vars.mk\n'),
+            ('debian/vars.mk', 'FOO = 1\n')])
+        cache: FileCache[RulesTree] = FileCache(maxsize=1)
+        tree = load_rules_tree('debian/rules', cache=cache)
+        self.assertEqual(b'1', tree.get_variable(b'FOO', follow_includes=True))
+        # The included file pushed out debian/rules
+        self.assertEqual(1, len(cache))
+        self.assertIsNot(tree, load_rules_tree('debian/rules', cache=cache))
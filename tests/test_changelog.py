@@ -33,10 +33,11 @@ from debmutate.changelog import (ChangelogCreateError, ChangelogEditor,
                                  changeblock_ensure_first_line,
                                  changes_sections, find_extra_authors,
                                  find_last_distribution, find_thanks,
-                                 increment_version,
+                                 increment_version, new_changelog_entries,
                                  new_upstream_package_version, release,
-                                 rewrap_change, strip_changelog_message,
-                                 take_uploadership,
+                                 any_long_lines, rewrap_change,
+                                 rewrap_changes, scan_changelog_headers,
+                                 strip_changelog_message, take_uploadership,
                                  upstream_merge_changelog_line)
 
 
@@ -201,6 +202,12 @@ class TextWrapperTests(TestCase):
              'Closes: #123456'],
             self.wrapper._split('And this fixes something. Closes: #123456'))
 
+    def test_wrap_lp(self):
+        self.assertEqual(
+            ['Fix', ' ', 'it', ' ', '(LP: #123).', ' ', 'Closes:', ' ',
+             'nothing'],
+            self.wrapper._split('Fix it (LP:\t#123). Closes: nothing'))
+
 
 LONG_LINE = (
     "This is a very long line that could have been broken "
@@ -253,6 +260,77 @@ the exclamation mark and this comment between brackets]
 """.splitlines()))
 
 
+class RewrapChangesTests(TestCase):
+
+    def test_any_long_lines(self):
+        self.assertFalse(any_long_lines(iter(['a', 'b'])))
+        self.assertTrue(any_long_lines(iter(['a', 'b' * 81])))
+        self.assertTrue(any_long_lines(['abc'], width=2))
+
+    def test_rewrap(self):
+        self.assertEqual(
+            ['', '  * Short line.',
+             '  * This is a very long line that could have been '
+             'broken and should have been',
+             '    broken but was not broken.',
+             ''],
+            list(rewrap_changes(
+                ['', '  * Short line.', '  * ' + LONG_LINE, ''])))
+
+    def test_last_entry(self):
+        self.assertEqual(
+            ['  * Short line.',
+             '  * This is a very long line that could have been '
+             'broken and should have been',
+             '    broken but was not broken.'],
+            list(rewrap_changes(['  * Short line.', '  * ' + LONG_LINE])))
+
+
+class NewChangelogEntriesTests(TestCase):
+
+    OLD = b"""\
+blah (0.2-1) unstable; urgency=medium
+
+  * New upstream release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sat, 13 Oct 2018 11:21:39 +0100
+
+blah (0.1-1) unstable; urgency=low
+
+  * Initial release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Fri, 12 Oct 2018 11:21:39 +0100
+""".splitlines(True)
+
+    def test_prepended(self):
+        new = b"""\
+blah (0.3-1) UNRELEASED; urgency=medium
+
+  * Another release.
+  * And a fix.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sun, 14 Oct 2018 11:21:39 +0100
+
+""".splitlines(True) + self.OLD
+        self.assertEqual(
+            ['  * Another release.\n', '  * And a fix.\n'],
+            new_changelog_entries(self.OLD, new))
+
+    def test_added_to_first(self):
+        new = list(self.OLD)
+        new.insert(3, b'  * Fix a bug.\n')
+        self.assertEqual(
+            ['  * Fix a bug.\n'], new_changelog_entries(self.OLD, new))
+
+    def test_rewritten(self):
+        new = [line.replace(b'Initial', b'First') for line in self.OLD]
+        self.assertEqual(
+            ['  * First release.\n'], new_changelog_entries(self.OLD, new))
+
+    def test_unchanged(self):
+        self.assertEqual([], new_changelog_entries(self.OLD, self.OLD))
+
+
 class IncVersionTests(TestCase):
 
     def test_native(self):
@@ -643,6 +721,39 @@ class ChangelogInfoTests(TestCase):
         self.assert_thanks_is(changes, ["\xc1deodato Sim\xc3\xb3"])
 
 
+class ScanChangelogHeadersTests(TestCase):
+
+    def test_scan(self):
+        lines = b"""\
+blah (0.2-1) UNRELEASED; urgency=medium
+
+  * New upstream release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sat, 13 Oct 2018 11:21:39 +0100
+
+blah (0.1-1) unstable experimental; urgency=low
+
+  * Initial release.
+ -- Joe Example <joe@example.com>  Fri, 12 Oct 2018 11:21:39 +0100
+
+Old Changelog:
+blah (0.0) unstable; urgency=low
+""".splitlines(True)
+        self.assertEqual([
+            ('blah', '0.2-1', 'UNRELEASED', 'medium',
+             'Jelmer Vernooij <jelmer@debian.org>',
+             'Sat, 13 Oct 2018 11:21:39 +0100'),
+            ('blah', '0.1-1', 'unstable experimental', 'low',
+             'Joe Example <joe@example.com>',
+             'Fri, 12 Oct 2018 11:21:39 +0100')],
+            list(scan_changelog_headers(lines)))
+
+    def test_missing_trailer(self):
+        self.assertEqual(
+            [('blah', '0.1', 'unstable', None, None, None)],
+            list(scan_changelog_headers([b'blah (0.1) unstable;\n'])))
+
+
 class UpstreamMergeChangelogLineTests(TestCase):
 
     def test_release(self):
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.changelog_analysis."""
+
+from debian.changelog import Changelog
+
+from debmutate.changelog_analysis import analyze_changelog, analyze_changes
+
+from . import TestCase
+
+
+class AnalyzeChangesTests(TestCase):
+
+    def test_sections(self):
+        analysis = analyze_changes([
+            '',
+            '  [ Jelmer Vernooij ]',
+            '  * Fix a bug. Closes: #123, #456',
+            '    Thanks to Joe Example.',
+            '',
+            '  [ Joe Example ]',
+            '  * Fix another bug. (LP: #789)',
+            ''])
+        self.assertEqual(
+            ['Jelmer Vernooij', 'Joe Example'],
+            [author for (author, linenos, entries) in analysis.sections])
+        self.assertEqual(['Jelmer Vernooij', 'Joe Example'], analysis.authors)
+        self.assertEqual(['Joe Example'], analysis.thanks)
+        self.assertEqual([123, 456], analysis.bugs_closed)
+        self.assertEqual([789], analysis.lp_bugs_closed)
+        self.assertFalse(analysis.sha_prefixed)
+
+    def test_sha_prefixed(self):
+        self.assertTrue(analyze_changes([
+            '',
+            '  * [1234567] Do a thing.',
+            '  * [abcdef0] Do another thing.',
+            '']).sha_prefixed)
+        self.assertFalse(analyze_changes([
+            '',
+            '  * [1234567] Do a thing.',
+            '  * Do another thing.',
+            '']).sha_prefixed)
+        self.assertFalse(analyze_changes(['']).sha_prefixed)
+
+    def test_changelog(self):
+        cl = Changelog("""\
+blah (0.2) unstable; urgency=low
+
+  * Fix things. Closes: #1
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sat, 13 Oct 2018 11:21:39 +0100
+
+blah (0.1) unstable; urgency=low
+
+  * Initial release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Fri, 12 Oct 2018 11:21:39 +0100
+""")
+        self.assertEqual(
+            [('0.2', [1]), ('0.1', [])],
+            [(str(block.version), analysis.bugs_closed)
+             for (block, analysis) in analyze_changelog(cl)])
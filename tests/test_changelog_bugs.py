@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.changelog_bugs."""
+
+from debian.changelog import Changelog
+
+from debmutate.changelog_bugs import (BugClosure, BugClosureIndex,
+                                      iter_bug_closures, scan_bug_closures)
+
+from . import TestCase, TestCaseInTempDir
+
+CHANGELOG = b"""\
+blah (0.2-1) unstable; urgency=low
+
+  * New upstream release. Closes: #123, #456
+  * Fix build on Ubuntu. LP: #7890
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Fri, 12 Oct 2018 11:21:39 +0100
+
+blah (0.1-1) unstable; urgency=high
+
+  * Initial release. (closes: Bug#42)
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Thu, 11 Oct 2018 11:21:39 +0100
+"""
+
+DATE1 = 'Thu, 11 Oct 2018 11:21:39 +0100'
+DATE2 = 'Fri, 12 Oct 2018 11:21:39 +0100'
+
+
+class BugClosuresTests(TestCase):
+
+    def test_scan(self):
+        self.assertEqual([
+            BugClosure('debian', 123, 'blah', '0.2-1', DATE2),
+            BugClosure('debian', 456, 'blah', '0.2-1', DATE2),
+            BugClosure('launchpad', 7890, 'blah', '0.2-1', DATE2),
+            BugClosure('debian', 42, 'blah', '0.1-1', DATE1),
+            ], list(scan_bug_closures(CHANGELOG)))
+
+    def test_changelog(self):
+        self.assertEqual(
+            [BugClosure('debian', 42, 'blah', '0.1-1', DATE1)],
+            list(iter_bug_closures(Changelog(CHANGELOG)))[3:])
+
+    def test_trailing_text(self):
+        # Older blocks after "Old Changelog:" are ignored, as by
+        # debian.changelog.
+        changelog = CHANGELOG.replace(
+            b'\nblah (0.1-1)', b'\nOld Changelog:\n\nblah (0.1-1)')
+        self.assertEqual(
+            [123, 456, 7890],
+            [closure.bug for closure in scan_bug_closures(changelog)])
+        self.assertEqual(
+            list(iter_bug_closures(Changelog(changelog))),
+            list(scan_bug_closures(changelog)))
+
+    def test_matches_changelog(self):
+        self.assertEqual(
+            list(iter_bug_closures(Changelog(CHANGELOG))),
+            list(scan_bug_closures(CHANGELOG)))
+
+
+class BugClosureIndexTests(TestCaseInTempDir):
+
+    def test_update(self):
+        index = BugClosureIndex()
+        self.assertTrue(index.update('blah', CHANGELOG))
+        self.assertFalse(index.update('blah', CHANGELOG))
+        # Identical contents are only scanned once
+        self.assertFalse(index.update('blah-copy', CHANGELOG))
+        self.assertEqual(['blah', 'blah-copy'], index.keys())
+        self.assertEqual(
+            [('blah', BugClosure('debian', 123, 'blah', '0.2-1', DATE2)),
+             ('blah-copy',
+              BugClosure('debian', 123, 'blah', '0.2-1', DATE2))],
+            index.lookup(123))
+        self.assertEqual([], index.lookup(7890))
+        self.assertEqual(2, len(index.lookup(7890, 'launchpad')))
+        index.remove('blah-copy')
+        self.assertEqual(1, len(index.lookup(123)))
+
+    def test_persist(self):
+        self.build_tree_contents([('changelog', CHANGELOG.decode())])
+        with BugClosureIndex('index.json') as index:
+            self.assertEqual(1, index.update_files(['changelog']))
+            self.assertEqual(0, index.update_files(['changelog']))
+        index = BugClosureIndex('index.json')
+        self.assertIn('changelog', index)
+        self.assertEqual(4, len(index.closures('changelog')))
+        self.assertEqual(0, index.update_files(['changelog']))
+        with open('changelog', 'ab') as f:
+            f.write(b'\n')
+        self.assertTrue(index.update_file('changelog'))
+        self.assertEqual(
+            [('changelog',
+              BugClosure('debian', 42, 'blah', '0.1-1', DATE1))],
+            index.lookup(42))
+
+    def test_unsupported_version(self):
+        self.build_tree_contents([('index.json', '{"version": 0}')])
+        self.assertRaises(ValueError, BugClosureIndex, 'index.json')
@@ -0,0 +1,125 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.changelog_index."""
+
+import json
+import os
+
+from debmutate.changelog import ChangelogBlockHeader
+from debmutate.changelog_index import ChangelogIndex, load_changelog_index
+
+from . import TestCase, TestCaseInTempDir
+
+CHANGELOG = b"""\
+blah (0.3-1) UNRELEASED; urgency=medium
+
+  * New upstream release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sat, 13 Oct 2018 11:21:39 +0100
+
+blah (0.2-1) experimental; urgency=low
+
+  * New upstream release.
+  * Closes some bugs. Closes: #123
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Fri, 12 Oct 2018 11:21:39 +0100
+
+blah (0.1-1) unstable; urgency=high
+
+  * Initial release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Thu, 11 Oct 2018 11:21:39 +0100
+"""
+
+
+class ChangelogIndexTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.index = ChangelogIndex.from_bytes(CHANGELOG)
+
+    def test_headers(self):
+        self.assertEqual(3, len(self.index))
+        self.assertEqual(
+            ChangelogBlockHeader(
+                'blah', '0.3-1', 'UNRELEASED', 'medium',
+                'Jelmer Vernooij <jelmer@debian.org>',
+                'Sat, 13 Oct 2018 11:21:39 +0100'),
+            self.index[0])
+        self.assertEqual(
+            ['0.3-1', '0.2-1', '0.1-1'], [h.version for h in self.index])
+        self.assertEqual((0, 142), self.index.span(0))
+        self.assertEqual(len(CHANGELOG), self.index.span(2)[1])
+
+    def test_find_version(self):
+        self.assertEqual(1, self.index.find_version('0.2-1'))
+        self.assertEqual(2, self.index.find_version('0.1-1'))
+        self.assertIsNone(self.index.find_version('0.2-2'))
+
+    def test_find_distribution(self):
+        self.assertEqual([1], self.index.find_distribution('experimental'))
+        self.assertEqual([], self.index.find_distribution('stable'))
+
+    def test_last_released(self):
+        self.assertEqual(1, self.index.last_released())
+        self.assertEqual('experimental', self.index.last_distribution())
+
+    def test_block(self):
+        block = self.index.block(1)
+        self.assertEqual('0.2-1', str(block.version))
+        self.assertEqual(
+            ['', '  * New upstream release.',
+             '  * Closes some bugs. Closes: #123', ''],
+            block.changes())
+        self.assertIs(block, self.index.block(1))
+
+    def test_trailing_old_changelog(self):
+        index = ChangelogIndex.from_bytes(
+            CHANGELOG + b'\nOld Changelog:\nblah (0.0) unstable; \n')
+        self.assertEqual(3, len(index))
+        self.assertIn(b'Old Changelog:', index.block_bytes(2))
+
+    def test_json(self):
+        index = ChangelogIndex.from_json(
+            json.loads(json.dumps(self.index.to_json())))
+        self.assertEqual(self.index.headers, index.headers)
+        self.assertRaises(ValueError, index.block, 0)
+        self.assertRaises(ValueError, index.attach, b'')
+        index.attach(CHANGELOG)
+        self.assertEqual('0.3-1', str(index.block(0).version))
+
+
+class LoadChangelogIndexTests(TestCaseInTempDir):
+
+    def test_persist(self):
+        self.build_tree_contents(
+            [('debian/', ), ('debian/changelog', CHANGELOG.decode())])
+        index = load_changelog_index('debian/changelog', 'index.json')
+        self.assertTrue(os.path.exists('index.json'))
+        with open('index.json', 'r') as f:
+            data = json.load(f)
+        data['headers'][0][1] = 'cached'
+        with open('index.json', 'w') as f:
+            json.dump(data, f)
+        index = load_changelog_index('debian/changelog', 'index.json')
+        self.assertEqual('cached', index[0].version)
+        self.build_tree_contents(
+            [('debian/changelog',
+              CHANGELOG.decode().replace('0.3-1', '0.4-1'))])
+        index = load_changelog_index('debian/changelog', 'index.json')
+        self.assertEqual('0.4-1', index[0].version)
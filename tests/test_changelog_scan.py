@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.changelog_scan."""
+
+import gzip
+from io import StringIO
+
+from debmutate.changelog_scan import (scan_changelog_file,
+                                      scan_changelog_files,
+                                      write_changelog_csv)
+
+from . import TestCaseInTempDir
+
+CHANGELOG = b"""\
+blah (0.1-1) unstable; urgency=low
+
+  * Initial release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sat, 13 Oct 2018 11:21:39 +0100
+"""
+
+
+class ScanChangelogFilesTests(TestCaseInTempDir):
+
+    def setUp(self):
+        super().setUp()
+        with open('changelog', 'wb') as f:
+            f.write(CHANGELOG)
+        with gzip.open('changelog.gz', 'wb') as f:
+            f.write(CHANGELOG.replace(b'blah', b'foo'))
+
+    def test_scan_file(self):
+        self.assertEqual(
+            ['blah'], [h.package for h in scan_changelog_file('changelog')])
+        self.assertEqual(
+            ['foo'], [h.package for h in scan_changelog_file('changelog.gz')])
+
+    def test_scan_files(self):
+        results = list(scan_changelog_files(
+            ['changelog', 'missing', 'changelog.gz'], max_workers=2))
+        self.assertEqual(
+            ['changelog', 'missing', 'changelog.gz'],
+            [r.path for r in results])
+        self.assertEqual(
+            ['blah'], [h.package for h in results[0].headers or []])
+        self.assertIsNone(results[1].headers)
+        self.assertIsNotNone(results[1].error)
+        self.assertEqual(
+            ['foo'], [h.package for h in results[2].headers or []])
+
+    def test_write_csv(self):
+        f = StringIO()
+        with self.assertLogs(level='WARNING'):
+            rows = write_changelog_csv(f, scan_changelog_files(
+                ['changelog', 'missing'], max_workers=1))
+        self.assertEqual(1, rows)
+        self.assertEqual(
+            'path,package,version,distributions,urgency,author,date\r\n'
+            'changelog,blah,0.1-1,unstable,low,'
+            'Jelmer Vernooij <jelmer@debian.org>,'
+            '"Sat, 13 Oct 2018 11:21:39 +0100"\r\n', f.getvalue())
@@ -19,9 +19,13 @@
 """Tests for debmutate.control."""
 
 import os
+import shutil
+from unittest import skipIf
 
 from debmutate.control import (ControlEditor, MissingSourceParagraph,
-                               PkgRelation, _cdbs_resolve_conflict,
+                               PkgRelation, TemplateExpandCommandMissing,
+                               VersionInterval,
+                               _cdbs_resolve_conflict,
                                add_dependency, delete_from_list,
                                drop_dependency, ensure_exact_version,
                                ensure_minimum_version, ensure_relation,
@@ -29,7 +33,8 @@ from debmutate.control import (ControlEditor, MissingSourceParagraph,
                                get_relation, guess_template_type,
                                is_dep_implied, is_relation_implied,
                                iter_relations, parse_relations,
-                               parse_standards_version, update_control)
+                               parse_standards_version, simplify_relations,
+                               update_control)
 from debmutate.reformatting import FormattingUnpreservable, GeneratedFile
 
 from . import TestCase, TestCaseInTempDir
@@ -365,6 +370,110 @@ Testsuite: autopkgtest8
 Vcs-Git: example.com
 """, "debian/control", strip_trailing_whitespace=True)
 
+    def test_update_template_native(self):
+        self.build_tree_contents([('debian/', ), ('debian/control', """\
+Source: blah
+Testsuite: autopkgtest
+Uploaders: Jelmer Vernooij <jelmer@jelmer.uk>
+
+Package: blah
+Description: Jelmer Vernooij <jelmer@jelmer.uk>
+"""), ('debian/control.in', """\
+Source: blah
+Testsuite: autopkgtest
+Uploaders: @GNOME_TEAM@
+
+Package: blah
+Description: @GNOME_TEAM@
+"""), ('debian/rules', """\
+#!/usr/bin/make -f
+
+debian/control: debian/control.in
+\tfalse
+""")])
+        os.chmod('debian/rules', 0o755)
+
+        with ControlEditor() as updater:
+            updater.source['Testsuite'] = 'autopkgtest8'
+        self.assertFileEqual("""\
+Source: blah
+Testsuite: autopkgtest8
+Uploaders: Jelmer Vernooij <jelmer@jelmer.uk>
+
+Package: blah
+Description: Jelmer Vernooij <jelmer@jelmer.uk>
+""", "debian/control")
+
+    def build_gnome_tree(self):
+        self.build_tree_contents([('debian/', ), ('debian/changelog', """\
+blah (0.1-1) unstable; urgency=medium
+
+  * Initial release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sat, 13 Oct 2018 11:21:39 +0100
+"""), ('debian/control', """\
+Source: blah
+Testsuite: autopkgtest
+Uploaders: Jelmer Vernooij <jelmer@debian.org>
+"""), ('debian/control.in', """\
+Source: blah
+Testsuite: autopkgtest
+Uploaders: @GNOME_TEAM@
+""")])
+
+    def test_update_gnome_template_native(self):
+        self.build_gnome_tree()
+        os.utime('debian/changelog', ns=(0, 0))
+
+        with ControlEditor() as updater:
+            updater.source['Testsuite'] = 'autopkgtest8'
+        self.assertFileEqual("""\
+Source: blah
+Testsuite: autopkgtest8
+Uploaders: Jelmer Vernooij <jelmer@debian.org>
+""", "debian/control")
+
+    @skipIf(shutil.which('dh_gnome_clean'), 'dh_gnome_clean is available')
+    def test_update_gnome_template_changelog_changed(self):
+        self.build_gnome_tree()
+        os.utime('debian/control', ns=(0, 0))
+
+        # Uploaders have to be recomputed by dh_gnome_clean
+        with self.assertRaises(TemplateExpandCommandMissing):
+            with ControlEditor() as updater:
+                updater.source['Testsuite'] = 'autopkgtest8'
+
+    def test_update_postgresql_template(self):
+        self.build_tree_contents([('debian/', ), ('debian/control', """\
+Source: blah
+Testsuite: autopkgtest
+
+Package: postgresql-15-blah
+Depends: postgresql-15
+
+Package: postgresql-16-blah
+Depends: postgresql-16
+"""), ('debian/control.in', """\
+Source: blah
+Testsuite: autopkgtest
+
+Package: postgresql-PGVERSION-blah
+Depends: postgresql-PGVERSION
+""")])
+
+        with ControlEditor() as updater:
+            updater.source['Testsuite'] = 'autopkgtest8'
+        self.assertFileEqual("""\
+Source: blah
+Testsuite: autopkgtest8
+
+Package: postgresql-15-blah
+Depends: postgresql-15
+
+Package: postgresql-16-blah
+Depends: postgresql-16
+""", "debian/control")
+
     def test_update_cdbs_template(self):
         self.build_tree_contents([('debian/', ), ('debian/control', """\
 Source: blah
@@ -526,6 +635,10 @@ class EnsureMinimumVersionTests(TestCase):
             ensure_minimum_version(
                 'blah, debhelper (>= 8), debhelper (>= 10) | dh-systemd',
                 'debhelper', '9'))
+        self.assertEqual(
+            'blah, debhelper (>= 9)',
+            ensure_minimum_version(
+                'blah, debhelper | dh-systemd', 'debhelper', '9'))
 
 
 class EnsureRelationTests(TestCase):
@@ -881,6 +994,110 @@ class IsRelationImpliedTests(TestCase):
         self.assertFalse(is_relation_implied('bzr (= 3)', 'bzr (>= 3)'))
 
 
+class VersionIntervalTests(TestCase):
+
+    def test_from_constraint(self):
+        self.assertEqual(VersionInterval(), VersionInterval.from_constraint(
+            None))
+        self.assertEqual(
+            VersionInterval(('1.0', True), ('1.0', True)),
+            VersionInterval.from_constraint(('=', '1.0')))
+        self.assertEqual(
+            VersionInterval(None, ('1.0', False)),
+            VersionInterval.from_constraint(('<<', '1.0')))
+        self.assertRaises(
+            ValueError, VersionInterval.from_constraint, ('!=', '1.0'))
+
+    def test_intersection(self):
+        a = VersionInterval.from_constraint(('>=', '1.0'))
+        b = VersionInterval.from_constraint(('<<', '2.0'))
+        self.assertEqual(
+            VersionInterval(('1.0', True), ('2.0', False)),
+            a.intersection(b))
+        self.assertEqual(
+            VersionInterval(('1.0', False), None),
+            a.intersection(VersionInterval.from_constraint(('>>', '1.0'))))
+        self.assertTrue(a.intersection(
+            VersionInterval.from_constraint(('<<', '1.0'))).is_empty())
+        self.assertFalse(a.intersection(
+            VersionInterval.from_constraint(('<=', '1.0'))).is_empty())
+
+    def test_union(self):
+        a = VersionInterval.from_constraint(('>=', '2.0'))
+        b = VersionInterval.from_constraint(('<<', '2.0'))
+        self.assertEqual(VersionInterval(), a.union(b))
+        self.assertIsNone(
+            a.union(VersionInterval.from_constraint(('<<', '1.0'))))
+        self.assertEqual(
+            VersionInterval(('1.0', True), None),
+            VersionInterval.from_constraint(('=', '1.0')).union(
+                VersionInterval.from_constraint(('>>', '1.0'))))
+
+    def test_issubset(self):
+        self.assertTrue(
+            VersionInterval.from_constraint(('=', '2.0')).issubset(
+                VersionInterval.from_constraint(('>=', '2.0'))))
+        self.assertTrue(
+            VersionInterval.from_constraint(('>=', '2.0')).issubset(
+                VersionInterval.from_constraint(('>=', '2.00'))))
+        self.assertFalse(
+            VersionInterval.from_constraint(('>=', '2.0')).issubset(
+                VersionInterval.from_constraint(('>>', '2.0'))))
+
+    def test_constraints(self):
+        self.assertEqual([], VersionInterval().constraints())
+        self.assertEqual(
+            [('=', '1.0')],
+            VersionInterval(('1.0', True), ('1.0', True)).constraints())
+        self.assertEqual(
+            [('>>', '1.0'), ('<=', '2.0')],
+            VersionInterval(('1.0', False), ('2.0', True)).constraints())
+
+
+class SimplifyRelationsTests(TestCase):
+
+    def test_unchanged(self):
+        self.assertEqual('a, b', simplify_relations('a, b'))
+        self.assertEqual(
+            'foo (>= 2), foo (<< 1)',
+            simplify_relations('foo (>= 2), foo (<< 1)'))
+        self.assertEqual(
+            'foo [amd64], foo (>= 1)',
+            simplify_relations('foo [amd64], foo (>= 1)'))
+
+    def test_merge(self):
+        self.assertEqual(
+            'foo (>= 2), bar',
+            simplify_relations('foo (>= 1), bar, foo (>= 2)'))
+        self.assertEqual(
+            'foo (>= 2), foo (<< 3), bar',
+            simplify_relations('foo (>= 1), foo (<< 3), bar, foo (>= 2)'))
+        self.assertEqual('foo (= 1)', simplify_relations('foo, foo (= 1)'))
+        self.assertEqual(
+            'foo (>= 1.0),\n bar',
+            simplify_relations('foo,\n foo (>= 1.0),\n bar'))
+
+    def test_drop_implied_alternatives(self):
+        self.assertEqual(
+            'foo (>= 2), baz',
+            simplify_relations('foo (>= 2), foo (>= 1) | bar, baz'))
+        self.assertEqual(
+            'foo (>= 2)', simplify_relations('bar | foo, foo (>= 2)'))
+        self.assertEqual(
+            'foo (>= 2), foo (>= 3) | bar',
+            simplify_relations('foo (>= 2), foo (>= 3) | bar'))
+
+    def test_packages(self):
+        self.assertEqual(
+            'foo (>= 2), bar, bar (>= 1)',
+            simplify_relations(
+                'foo (>= 1), bar, foo (>= 2), bar (>= 1)', packages={'foo'}))
+        self.assertEqual(
+            'foo (>= 1) | bar, bar (>= 1)',
+            simplify_relations(
+                'foo (>= 1) | bar, bar (>= 1)', packages={'foo'}))
+
+
 class CdbsResolverConflictTests(TestCase):
 
     def test_build_depends(self):
@@ -899,6 +1116,16 @@ class CdbsResolverConflictTests(TestCase):
             'debhelper (>= 10), foo')
         self.assertEqual(val, '@cdbs@, debhelper (>= 10)')
 
+    def test_cdbs_resolve_conflict_unrelated(self):
+        # Only the relations on the added packages are simplified
+        val = _cdbs_resolve_conflict(
+            ('Source', 'libnetsds-perl'), 'Build-Depends',
+            'debhelper (>= 6), foo',
+            '@cdbs@, bar (>= 1), bar (>= 2), debhelper (>= 9)',
+            'debhelper (>= 10), foo')
+        self.assertEqual(
+            val, '@cdbs@, bar (>= 1), bar (>= 2), debhelper (>= 10)')
+
 
 class ParseStandardsVersionTests(TestCase):
 
@@ -935,6 +1162,22 @@ debian/%: debian/%.in
         self.assertEqual(
             'rules', guess_template_type('debian/control.in', 'debian'))
 
+    def test_rules_uses_control(self):
+        with open('debian/control.in', 'w') as f:
+            f.write("""\
+Source: blah
+Build-Depends: bar
+""")
+        with open('debian/rules', 'w') as f:
+            f.write("""\
+%:
+    dh $@
+
+check: debian/control
+    grep blah debian/control
+""")
+        self.assertIs(None, guess_template_type('debian/control.in', 'debian'))
+
     def test_blends(self):
         with open('debian/rules', 'w') as f:
             f.write("""\
@@ -1025,3 +1268,30 @@ Build-Depends: bar
             f.write('maintainer = Joe Example <joe@example.com>\n')
         self.assertEqual(
             'debcargo', guess_template_type('debian/control.in', 'debian'))
+
+    def test_cached(self):
+        with open('debian/control.in', 'w') as f:
+            f.write("""\
+Source: blah
+Build-Depends: bar
+""")
+        self.assertIs(None, guess_template_type('debian/control.in', 'debian'))
+        with open('debian/debcargo.toml', 'w') as f:
+            f.write('maintainer = Joe Example <joe@example.com>\n')
+        self.assertEqual(
+            'debcargo', guess_template_type('debian/control.in', 'debian'))
+        with open('debian/rules', 'w') as f:
+            f.write("""\
+debian/control: debian/control.in
+\tcp $< $@
+""")
+        self.assertEqual(
+            'rules', guess_template_type('debian/control.in', 'debian'))
+        with open('debian/control.in', 'w') as f:
+            f.write("""\
+Source: blah
+Build-Depends: @cdbs@
+""")
+        os.unlink('debian/rules')
+        self.assertEqual(
+            'cdbs', guess_template_type('debian/control.in', 'debian'))
@@ -0,0 +1,112 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.lintian_override_check."""
+
+from debmutate.lintian_override_check import (StaleOverride,
+                                              find_override_files,
+                                              find_stale_overrides,
+                                              parse_lintian_output)
+from debmutate.lintian_overrides import LintianIssue, LintianOverride
+
+from . import TestCase, TestCaseInTempDir
+
+LINTIAN_OUTPUT = """\
+W: blah source: debian-watch-file-is-missing
+N:
+N:   Explanation of the tag.
+N:
+O: blah source: source-is-missing [src/foo.min.js]
+I: libblah1: package-name-doesnt-match-sonames libblah2
+O: blah-udeb udeb: some-udeb-tag
+E: other: some-tag
+"""
+
+
+class ParseLintianOutputTests(TestCase):
+
+    def test_parse(self):
+        self.assertEqual([
+            LintianIssue('debian-watch-file-is-missing', None, 'blah',
+                         'source'),
+            LintianIssue('source-is-missing', '[src/foo.min.js]', 'blah',
+                         'source'),
+            LintianIssue('package-name-doesnt-match-sonames', 'libblah2',
+                         'libblah1', 'binary'),
+            LintianIssue('some-udeb-tag', None, 'blah-udeb', 'udeb'),
+            LintianIssue('some-tag', None, 'other', 'binary'),
+            ], list(parse_lintian_output(LINTIAN_OUTPUT.splitlines())))
+
+    def test_arch(self):
+        self.assertEqual(
+            [LintianIssue('some-tag', 'info', 'blah', 'binary', 'amd64')],
+            list(parse_lintian_output(['W: blah amd64: some-tag info\n'])))
+
+
+class FindStaleOverridesTests(TestCaseInTempDir):
+
+    def setUp(self):
+        super().setUp()
+        self.build_tree_contents([
+            ('blah/', ),
+            ('blah/debian/', ),
+            ('blah/debian/control', """\
+Source: blah
+
+Package: libblah1
+"""),
+            ('blah/debian/source/', ),
+            ('blah/debian/source/lintian-overrides', """\
+# Minified upstream files
+source-is-missing [src/foo.min.js]
+source-is-missing [src/bar.min.js]
+"""),
+            ('blah/debian/lintian-overrides', """\
+package-name-doesnt-match-sonames libblah2
+embedded-library
+"""),
+            ('blah/debian/blah-udeb.lintian-overrides', """\
+some-udeb-tag
+"""),
+        ])
+
+    def test_find_override_files(self):
+        self.assertEqual([
+            ('blah/debian/source/lintian-overrides', 'blah', 'source'),
+            ('blah/debian/blah-udeb.lintian-overrides', 'blah-udeb',
+             'binary'),
+            ('blah/debian/lintian-overrides', 'libblah1', 'binary'),
+            ], find_override_files('blah', 'blah'))
+
+    def test_stale(self):
+        self.assertEqual([
+            StaleOverride(
+                'blah', 'blah/debian/source/lintian-overrides',
+                LintianOverride(tag='source-is-missing',
+                                info='[src/bar.min.js]'), 'outdated'),
+            StaleOverride(
+                'blah', 'blah/debian/lintian-overrides',
+                LintianOverride(tag='embedded-library'), 'unused'),
+            ], list(find_stale_overrides(
+                {'blah': 'blah', 'other': 'other'},
+                LINTIAN_OUTPUT.splitlines(), max_workers=1)))
+
+    def test_parallel(self):
+        self.assertEqual(
+            2, len(list(find_stale_overrides(
+                {'blah': 'blah'}, LINTIAN_OUTPUT.splitlines(),
+                max_workers=2))))
@@ -17,11 +17,16 @@
 
 """Tests for lintian_brush.lintian_overrides."""
 
+import itertools
+import pickle
 from io import StringIO
 
-from debmutate.lintian_overrides import (LintianOverride,
+from debmutate.lintian_overrides import (LintianIssue, LintianOverride,
+                                         LintianOverrideSet,
                                          LintianOverridesEditor,
-                                         iter_overrides, parse_override,
+                                         LintianPointer, iter_overrides,
+                                         load_lintian_overrides,
+                                         parse_override, parse_pointer,
                                          serialize_override)
 
 from . import TestCase, TestCaseInTempDir
@@ -67,6 +72,26 @@ foo binary: another-tag optional-extra
 foo [any-i386] binary: another-tag optional-extra
 """, 'overrides')
 
+    def test_override_set(self):
+        self.build_tree_contents([('overrides', """\
+# comment
+foo binary: another-tag optional-extra
+unused-tag
+""")])
+
+        with LintianOverridesEditor(path='overrides') as editor:
+            usage = editor.override_set().match_all(
+                [LintianIssue('another-tag', 'optional-extra', 'foo')])
+        self.assertEqual([editor.overrides[1]], usage.unused)
+
+    def test_load_cached(self):
+        self.build_tree_contents([('overrides', 'some-tag\n')])
+        overrides = load_lintian_overrides('overrides')
+        self.assertIs(overrides, load_lintian_overrides('overrides'))
+        self.build_tree_contents([('overrides', 'some-tag\nother-tag\n')])
+        overrides = load_lintian_overrides('overrides')
+        self.assertEqual(2, len(overrides))
+
 
 class ParseOverrideTests(TestCase):
 
@@ -85,6 +110,57 @@ class ParseOverrideTests(TestCase):
             LintianOverride(tag='sometag', archlist=['i386', 'amd64']),
             parse_override('[i386 amd64]: sometag\n'))
 
+    def test_full(self):
+        self.assertEqual(
+            LintianOverride(package='foo', archlist=['i386', 'amd64'],
+                            type='binary', tag='sometag', info='some info'),
+            parse_override('foo [i386 amd64] binary: sometag some info\n'))
+
+    def test_type_only(self):
+        self.assertEqual(
+            LintianOverride(tag='sometag', type='source'),
+            parse_override('source: sometag\n'))
+
+    def test_colon_in_info(self):
+        self.assertEqual(
+            LintianOverride(tag='sometag', info='example: some/path'),
+            parse_override('sometag example: some/path\n'))
+
+    def test_pointer(self):
+        override = parse_override('source: sometag [debian/rules:12]\n')
+        self.assertEqual('[debian/rules:12]', override.info)
+        self.assertEqual(
+            LintianPointer(None, 'debian/rules', '12'), override.pointer)
+
+    def test_unusual_order(self):
+        self.assertEqual(
+            LintianOverride(tag='sometag', package='foo', archlist=['i386']),
+            parse_override('[i386] foo: sometag\n'))
+
+    def test_origin_orders(self):
+        fields = ['foo', 'binary', '[amd64]']
+        for origin in itertools.chain.from_iterable(
+                itertools.permutations(fields, n) for n in range(1, 4)):
+            line = ' '.join(origin) + ': sometag some info\n'
+            self.assertEqual(
+                LintianOverride(
+                    package='foo' if 'foo' in origin else None,
+                    type='binary' if 'binary' in origin else None,
+                    archlist=['amd64'] if '[amd64]' in origin else None,
+                    tag='sometag', info='some info'),
+                parse_override(line), line)
+
+    def test_round_trip(self):
+        for line in [
+                'sometag\n',
+                'foo: sometag\n',
+                'source: sometag\n',
+                '[i386]: sometag\n',
+                'foo [i386 amd64] udeb: sometag some info\n',
+                'sometag context [usr/share/foo/*:*]\n']:
+            self.assertEqual(
+                line, serialize_override(parse_override(line)))
+
     def test_iter_overrides(self):
         self.assertEqual([
             LintianOverride(tag='sometag', archlist=['i386', 'amd64']),
@@ -95,6 +171,23 @@ anothertag optional-extra
 """))))
 
 
+class ParsePointerTests(TestCase):
+
+    def test_path(self):
+        self.assertEqual(
+            LintianPointer(None, 'usr/bin/foo', None),
+            parse_pointer('[usr/bin/foo]'))
+
+    def test_context(self):
+        self.assertEqual(
+            LintianPointer('some context', 'debian/rules', '*'),
+            parse_pointer('some context [debian/rules:*]'))
+
+    def test_no_pointer(self):
+        self.assertIsNone(parse_pointer('some/path'))
+        self.assertIsNone(parse_pointer('[some/path] trailing'))
+
+
 class SerializeOverrideTests(TestCase):
 
     def test_tag_only(self):
@@ -128,3 +221,69 @@ class MatchesOverrideTests(TestCase):
                 tag='debian-source-options-has-custom-compression-settings',
                 info='compression = gzip (line 15)',
                 type='source'))
+
+    def test_pointer(self):
+        override = parse_override('foo: some-tag [src/foo.min.js]')
+        self.assertTrue(
+            override.matches(tag='some-tag', info='[src/foo.min.js]'))
+        self.assertFalse(override.matches(tag='some-tag', info='s'))
+
+    def test_pickle(self):
+        override = parse_override('foo: some-tag some/* path')
+        override = pickle.loads(pickle.dumps(override))
+        self.assertTrue(
+            override.matches(tag='some-tag', info='some/file path'))
+
+    def test_plain(self):
+        override = parse_override('foo: some-tag some/path')
+        self.assertTrue(override.matches(tag='some-tag', info='some/path'))
+        self.assertFalse(override.matches(tag='some-tag', info='some/pat'))
+        self.assertFalse(override.matches(tag='some-ta', info='some/path'))
+        self.assertFalse(override.matches(package='bar', tag='some-tag'))
+
+
+class LintianOverrideSetTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.overrides = list(iter_overrides(StringIO("""\
+foo: some-tag some/path
+[i386 amd64]: arch-tag
+*-wildcard-tag
+foo source: some-tag other/*
+unused-tag
+""")))
+        self.set = LintianOverrideSet(self.overrides)
+
+    def test_find(self):
+        self.assertEqual(
+            self.overrides[3],
+            self.set.find(LintianIssue(
+                'some-tag', 'other/path', package='foo', type='source')))
+        self.assertIsNone(
+            self.set.find(LintianIssue('some-tag', 'other/path',
+                                       package='bar')))
+        self.assertEqual(
+            self.overrides[2],
+            self.set.find(LintianIssue('a-wildcard-tag')))
+
+    def test_arch(self):
+        self.assertIn(LintianIssue('arch-tag', arch='amd64'), self.set)
+        self.assertNotIn(LintianIssue('arch-tag', arch='armhf'), self.set)
+        self.assertIn(LintianIssue('arch-tag'), self.set)
+
+    def test_match_all(self):
+        usage = self.set.match_all([
+            LintianIssue('some-tag', 'some/path', package='foo'),
+            LintianIssue('arch-tag', arch='armhf'),
+            LintianIssue('b-wildcard-tag'),
+            LintianIssue('other-tag'),
+        ])
+        self.assertEqual(
+            [self.overrides[0], self.overrides[2]], usage.used)
+        self.assertEqual(
+            [self.overrides[1], self.overrides[3], self.overrides[4]],
+            usage.unused)
+        self.assertEqual(
+            [LintianIssue('arch-tag', arch='armhf'),
+             LintianIssue('other-tag')], usage.unmatched)
@@ -20,8 +20,8 @@
 import os
 from io import BytesIO
 
-from debmutate.patch import (QuiltSeriesEditor, find_common_patch_suffix,
-                             read_quilt_series)
+from debmutate.patch import (QuiltSeries, QuiltSeriesEditor,
+                             find_common_patch_suffix, read_quilt_series)
 
 from . import TestCase, TestCaseInTempDir
 
@@ -84,6 +84,139 @@ class FindCommonPatchSuffixTests(TestCase):
             find_common_patch_suffix(['series', 'foo.patch', 'bar.patch']))
 
 
+SERIES = b"""\
+# Upstream fixes
+fix-build.patch -p1
+  fix-tests.patch
+
+# Disabled for now
+# broken.patch
+debian-paths.patch   -p0
+"""
+
+
+class QuiltSeriesTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.series = QuiltSeries.from_bytes(SERIES)
+
+    def test_round_trip(self):
+        self.assertEqual(SERIES, self.series.to_bytes())
+
+    def test_patches(self):
+        self.assertEqual(
+            ['fix-build.patch', 'fix-tests.patch', 'debian-paths.patch'],
+            list(self.series.patches()))
+        self.assertEqual(3, len(self.series))
+        self.assertIn('fix-tests.patch', self.series)
+        self.assertNotIn('broken.patch', self.series)
+        self.assertIn(
+            'broken.patch',
+            [entry.name for entry in self.series.entries() if entry.quoted])
+        self.assertEqual(['-p0'], self.series.options('debian-paths.patch'))
+
+    def test_insert_after(self):
+        self.series.insert_after('fix-build.patch', 'new.patch', ['-p1'])
+        self.series.insert_after(None, 'first.patch')
+        self.assertEqual(b"""\
+first.patch
+# Upstream fixes
+fix-build.patch -p1
+new.patch -p1
+  fix-tests.patch
+
+# Disabled for now
+# broken.patch
+debian-paths.patch   -p0
+""", self.series.to_bytes())
+        self.assertRaises(
+            KeyError, self.series.insert_after, 'missing.patch', 'x.patch')
+        self.assertRaises(
+            ValueError, self.series.insert_after, None, 'fix-build.patch')
+
+    def test_duplicates(self):
+        series = QuiltSeries.from_bytes(b'patch1\npatch2\n')
+        series.append('patch1', ['-p0'])
+        self.assertEqual(
+            ['patch1', 'patch2', 'patch1'], list(series.patches()))
+        self.assertEqual(3, len(series))
+        series.remove('patch1')
+        self.assertIn('patch1', series)
+        self.assertEqual(['-p0'], series.options('patch1'))
+        self.assertEqual(['patch2', 'patch1'], list(series.patches()))
+        series.remove('patch1')
+        self.assertNotIn('patch1', series)
+        self.assertEqual(b'patch2\n', series.to_bytes())
+
+    def test_rename_duplicates(self):
+        series = QuiltSeries.from_bytes(b'patch1\npatch2\npatch1\n')
+        series.rename('patch1', 'patch3')
+        self.assertEqual(b'patch3\npatch2\npatch3\n', series.to_bytes())
+        series.reorder(['patch2', 'patch3'])
+        self.assertEqual(b'patch2\npatch3\npatch3\n', series.to_bytes())
+        series.remove('patch3')
+        self.assertEqual(['patch2', 'patch3'], list(series.patches()))
+
+    def test_remove(self):
+        self.series.remove('fix-tests.patch')
+        self.series.remove('broken.patch')
+        self.assertRaises(KeyError, self.series.remove, 'fix-tests.patch')
+        self.assertEqual(b"""\
+# Upstream fixes
+fix-build.patch -p1
+
+# Disabled for now
+debian-paths.patch   -p0
+""", self.series.to_bytes())
+
+    def test_rename(self):
+        self.series.rename('fix-tests.patch', 'fix-testsuite.patch')
+        self.series.rename_many({
+            'fix-build.patch': 'debian-paths.patch',
+            'debian-paths.patch': 'fix-build.patch'})
+        self.assertEqual(b"""\
+# Upstream fixes
+debian-paths.patch -p1
+  fix-testsuite.patch
+
+# Disabled for now
+# broken.patch
+fix-build.patch   -p0
+""", self.series.to_bytes())
+        self.assertRaises(
+            ValueError, self.series.rename, 'fix-build.patch',
+            'fix-testsuite.patch')
+        self.assertRaises(
+            KeyError, self.series.rename, 'missing.patch', 'other.patch')
+        self.assertIn('fix-build.patch', self.series)
+
+    def test_reorder(self):
+        self.series.reorder(
+            ['debian-paths.patch', 'fix-build.patch', 'fix-tests.patch'])
+        self.assertEqual(b"""\
+# Upstream fixes
+debian-paths.patch   -p0
+fix-build.patch -p1
+
+# Disabled for now
+# broken.patch
+  fix-tests.patch
+""", self.series.to_bytes())
+        self.assertEqual(
+            ['-p1'], self.series.options('fix-build.patch'))
+        self.assertRaises(
+            ValueError, self.series.reorder, ['fix-build.patch'])
+
+    def test_missing_trailing_newline(self):
+        series = QuiltSeries.from_bytes(b'patch1\npatch2')
+        series.reorder(['patch2', 'patch1'])
+        self.assertEqual(b'patch2\npatch1\n', series.to_bytes())
+        series = QuiltSeries.from_bytes(b'patch1')
+        series.extend(['patch2', 'patch3'])
+        self.assertEqual(b'patch1\npatch2\npatch3\n', series.to_bytes())
+
+
 class SeriesTests(TestCaseInTempDir):
 
     def setUp(self):
@@ -147,4 +280,21 @@ patch2
             self.assertEqual([], list(editor.patches()))
         self.assertFileEqual("""\
 # patch1
+""", 'debian/patches/series')
+
+    def test_preserves_formatting(self):
+        self.build_tree_contents([
+            ('debian/patches/series', SERIES.decode())])
+        with QuiltSeriesEditor(allow_reformatting=False) as editor:
+            self.assertIn('fix-tests.patch', editor)
+            editor.remove('fix-tests.patch')
+            editor.insert_after('fix-build.patch', 'new.patch')
+        self.assertFileEqual("""\
+# Upstream fixes
+fix-build.patch -p1
+new.patch
+
+# Disabled for now
+# broken.patch
+debian-paths.patch   -p0
 """, 'debian/patches/series')
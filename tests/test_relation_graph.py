@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.relation_graph."""
+
+from debmutate._deb822 import PkgRelation
+from debmutate.control import ControlEditor
+from debmutate.relation_graph import RelationGraph
+
+from . import TestCase, TestCaseInTempDir
+
+
+PARAGRAPHS = [
+    {'Source': 'blah',
+     'Build-Depends': 'debhelper-compat (= 12), libfoo-dev'},
+    {'Package': 'blah', 'Architecture': 'any',
+     'Depends': 'libblah1 (= 1.0), ${misc:Depends}, '
+                '${shlibs:Depends}'},
+    {'Package': 'libblah1', 'Architecture': 'any',
+     'Depends': 'blah-common, ${misc:Depends}'},
+    {'Package': 'blah-common', 'Architecture': 'all',
+     'Depends': 'python3 | python3-dev, ${misc:Depends}',
+     'Provides': 'blah-data'},
+    {'Package': 'blah-doc', 'Architecture': 'all',
+     'Recommends': 'blah-data'},
+]
+
+
+class RelationGraphTests(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.graph = RelationGraph.from_paragraphs(PARAGRAPHS)
+
+    def test_packages(self):
+        self.assertEqual(
+            ['src:blah', 'blah', 'libblah1', 'blah-common', 'blah-doc'],
+            self.graph.packages())
+        self.assertIn('src:blah', self.graph)
+        self.assertNotIn('libfoo-dev', self.graph)
+
+    def test_dependencies(self):
+        self.assertEqual({'libblah1'}, self.graph.dependencies('blah'))
+        self.assertEqual(
+            {'debhelper-compat', 'libfoo-dev'},
+            self.graph.dependencies('src:blah', ['Build-Depends']))
+        self.assertEqual(set(), self.graph.dependencies('unknown'))
+
+    def test_dependents(self):
+        self.assertEqual({'libblah1'}, self.graph.dependents('blah-common'))
+        self.assertEqual(
+            {'blah-doc'}, self.graph.dependents('blah-data', ['Recommends']))
+        self.assertEqual({'blah-common'}, self.graph.providers('blah-data'))
+
+    def test_relations(self):
+        [edge] = self.graph.relations('blah-common', ['Provides'])
+        self.assertEqual('Provides', edge.field)
+        self.assertEqual(['blah-data'], edge.targets)
+        edges = list(self.graph.reverse_relations('python3-dev'))
+        self.assertEqual([('blah-common', 'Depends', 0)],
+                         [(e.package, e.field, e.position) for e in edges])
+
+    def test_transitive(self):
+        self.assertEqual(
+            {'libblah1', 'blah-common', 'python3', 'python3-dev'},
+            self.graph.transitive_dependencies('blah'))
+        self.assertEqual(
+            {'libblah1', 'blah'},
+            self.graph.transitive_dependents('blah-common'))
+        self.assertEqual(
+            {'blah-data', 'blah-common', 'python3', 'python3-dev'},
+            self.graph.transitive_dependencies(
+                'blah-doc', ['Depends', 'Recommends'], follow_provides=True))
+
+    def test_cycle(self):
+        graph = RelationGraph.from_paragraphs([
+            {'Package': 'a', 'Depends': 'b'},
+            {'Package': 'b', 'Depends': 'a'}])
+        self.assertEqual({'b'}, graph.transitive_dependencies('a'))
+        self.assertEqual({'b'}, graph.transitive_dependents('a'))
+
+    def test_substvars(self):
+        self.assertEqual(
+            {'${misc:Depends}', '${shlibs:Depends}'},
+            self.graph.substvars('blah', 'Depends'))
+        self.assertEqual(
+            {'libblah1': ['${shlibs:Depends}'],
+             'blah-doc': ['${misc:Depends}']},
+            self.graph.missing_substvars())
+
+    def test_set_field(self):
+        self.graph.set_field('blah', 'Depends', 'blah-common')
+        self.assertEqual({'blah-common'}, self.graph.dependencies('blah'))
+        self.assertEqual(set(), self.graph.dependents('libblah1'))
+        self.assertEqual(
+            {'libblah1', 'blah'}, self.graph.dependents('blah-common'))
+        self.graph.set_field('blah', 'Depends', None)
+        self.assertEqual({'libblah1'}, self.graph.dependents('blah-common'))
+
+    def test_update_paragraph(self):
+        self.graph.update_paragraph(
+            {'Package': 'blah-doc', 'Architecture': 'all',
+             'Depends': '${misc:Depends}'})
+        self.assertEqual(set(), self.graph.dependents('blah-data'))
+        self.assertNotIn('blah-doc', self.graph.missing_substvars())
+
+    def test_remove_package(self):
+        self.graph.remove_package('libblah1')
+        self.assertNotIn('libblah1', self.graph)
+        self.assertEqual(set(), self.graph.dependents('blah-common'))
+
+    def test_implied(self):
+        graph = RelationGraph.from_paragraphs([
+            {'Package': 'a',
+             'Depends': 'foo (>= 1.0), foo (>= 2.0), bar | foo, baz'}])
+        self.assertTrue(graph.is_implied(
+            'a', 'Depends', [PkgRelation('foo', ('>=', '0.5'))]))
+        self.assertFalse(graph.is_implied(
+            'a', 'Depends', [PkgRelation('foo', ('>=', '3.0'))]))
+        # The implying relation is never one that is itself redundant
+        self.assertEqual(
+            [(0, 1), (2, 1)],
+            [(redundant.position, implying.position)
+             for (redundant, implying) in graph.implied_relations(
+                 'a', 'Depends')])
+
+    def test_implied_duplicates(self):
+        graph = RelationGraph.from_paragraphs([
+            {'Package': 'a', 'Depends': 'foo (>= 1), foo (>= 1), bar'}])
+        self.assertEqual(
+            [(0, 1)],
+            [(redundant.position, implying.position)
+             for (redundant, implying) in graph.implied_relations(
+                 'a', 'Depends')])
+
+
+class FromControlTests(TestCaseInTempDir):
+
+    def test_from_control(self):
+        self.build_tree_contents([('debian/', ), ('debian/control', """\
+Source: blah
+Build-Depends: debhelper-compat (= 12)
+
+Package: blah
+Architecture: all
+Depends: ${misc:Depends}, python3
+""")])
+        with ControlEditor('debian/control') as editor:
+            graph = RelationGraph.from_control(editor)
+        self.assertEqual(['src:blah', 'blah'], graph.packages())
+        self.assertEqual({'python3'}, graph.dependencies('blah'))
+        self.assertEqual({}, graph.missing_substvars())
@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.tree."""
+
+import os
+
+from debmutate.reformatting import GeneratedFile
+from debmutate.tree import DebianTree
+
+from . import TestCaseInTempDir
+
+CONTROL = """\
+Source: blah
+Build-Depends: debhelper-compat (= 12), dh-sequence-python3
+Vcs-Git: https://salsa.debian.org/jelmer/blah.git
+
+Package: blah
+Description: Blah
+"""
+
+COPYRIGHT = """\
+Format: https://www.debian.org/doc/packaging-manuals/copyright-format/1.0/
+Upstream-Name: blah
+Upstream-Contact: Joe Example <joe@example.com>
+
+Files: *
+Copyright: 2023 Joe Example
+License: GPL-2+
+"""
+
+
+class DebianTreeTests(TestCaseInTempDir):
+
+    def setUp(self):
+        super().setUp()
+        self.build_tree_contents([
+            ('debian/', ),
+            ('debian/control', CONTROL),
+            ('debian/copyright', COPYRIGHT),
+            ('debian/rules', '%:\n\tdh $@\n'),
+        ])
+
+    def test_shared_editor(self):
+        with DebianTree() as tree:
+            self.assertIs(tree.control, tree.control)
+            self.assertEqual(12, tree.debhelper_compat_level())
+            self.assertEqual(['python3'], tree.sequences())
+            self.assertEqual(
+                ('Git', 'https://salsa.debian.org/jelmer/blah.git', None),
+                tree.vcs_info())
+        self.assertEqual([], tree.changed_files)
+
+    def test_helpers_see_pending_changes(self):
+        with DebianTree() as tree:
+            tree.control.source['Build-Depends'] = 'debhelper-compat (= 13)'
+            self.assertEqual(13, tree.debhelper_compat_level())
+            self.assertEqual([], tree.sequences())
+
+    def test_commit(self):
+        with DebianTree() as tree:
+            tree.control.source['Rules-Requires-Root'] = 'no'
+            tree.rules.makefile.add_rule(b'override_dh_auto_test')
+        self.assertEqual(
+            ['debian/control', 'debian/rules'], sorted(tree.changed_files))
+        with open('debian/control') as f:
+            self.assertIn('Rules-Requires-Root: no\n', f.read())
+
+    def test_exception_discards(self):
+        try:
+            with DebianTree() as tree:
+                tree.control.source['Rules-Requires-Root'] = 'no'
+                raise KeyError
+        except KeyError:
+            pass
+        self.assertFileEqual(CONTROL, 'debian/control')
+
+    def test_failed_commit_restores(self):
+        self.build_tree_contents([('debian/rules.in', '%:\n\tdh $@\n')])
+        os.chmod('debian/rules', 0o755)
+        with self.assertRaises(GeneratedFile):
+            with DebianTree() as tree:
+                tree.control.source['Rules-Requires-Root'] = 'no'
+                tree.rules.makefile.add_rule(b'override_dh_auto_test')
+        self.assertFileEqual(CONTROL, 'debian/control')
+        self.assertFileEqual('%:\n\tdh $@\n', 'debian/rules')
+        self.assertEqual(0o755, os.stat('debian/rules').st_mode & 0o777)
+        self.assertEqual([], tree.changed_files)
+
+    def test_missing_control(self):
+        os.unlink('debian/control')
+        with DebianTree() as tree:
+            self.assertEqual([], tree.sequences())
+            self.assertEqual((None, None, None), tree.vcs_info())
+
+    def test_upstream_fields(self):
+        with DebianTree() as tree:
+            self.assertEqual(
+                'blah', tree.upstream_fields_in_copyright()['Name'])
+            header = tree.copyright.copyright.header
+            header.upstream_name = 'blah2'  # type: ignore
+            self.assertEqual(
+                'blah2', tree.upstream_fields_in_copyright()['Name'])
+
+    def test_compat_file(self):
+        self.build_tree_contents([('debian/compat', '11\n')])
+        with DebianTree() as tree:
+            self.assertEqual(11, tree.debhelper_compat_level())
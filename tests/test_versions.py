@@ -27,7 +27,8 @@ from debmutate.versions import (add_dfsg_suffix, debianize_upstream_version,
                                 git_snapshot_data_from_version,
                                 mangle_version_for_git, matches_release,
                                 new_package_version, strip_dfsg_suffix,
-                                upstream_version_add_revision)
+                                upstream_version_add_revision,
+                                version_sort_key)
 
 
 class MangleVersionForGitTests(TestCase):
@@ -272,3 +273,33 @@ class StripDfsgSuffixTests(TestCase):
     def test_strip(self):
         self.assertEqual('1.0', strip_dfsg_suffix('1.0+ds1'))
         self.assertEqual('1.0', strip_dfsg_suffix('1.0+dfsg2'))
+
+
+class VersionSortKeyTests(TestCase):
+
+    def test_sort(self):
+        versions = [
+            '1.0', '1:0.1', '1.0~rc1', '1.0-1', '1.0a', '1.0+dfsg-1',
+            '1.0.0', '10', '2', '1.0-1~bpo1', '1.0-1+b1', '1.0~~', '1.0~',
+            '0.9-12', '0.9-2']
+        self.assertEqual(
+            sorted(versions, key=Version),
+            sorted(versions, key=version_sort_key))
+        self.assertEqual(
+            ['1.0~~', '1.0~', '1.0~rc1', '1.0', '1.0-1~bpo1', '1.0-1',
+             '1.0-1+b1'],
+            sorted(['1.0', '1.0~rc1', '1.0-1', '1.0-1~bpo1', '1.0-1+b1',
+                    '1.0~~', '1.0~'], key=version_sort_key))
+
+    def test_equal(self):
+        self.assertEqual(version_sort_key('1.0'), version_sort_key('1.0-0'))
+        self.assertEqual(version_sort_key('1.0'), version_sort_key('0:1.00'))
+        self.assertEqual(
+            version_sort_key('1.0'), version_sort_key(Version('1.0')))
+        self.assertNotEqual(
+            version_sort_key('1.0'), version_sort_key('1.0.0'))
+
+    def test_tilde(self):
+        self.assertLess(version_sort_key('0~'), version_sort_key('0'))
+        self.assertLess(version_sort_key('1.0~'), version_sort_key('1.0-1'))
+        self.assertLess(version_sort_key('1.0-1~'), version_sort_key('1.0-1'))
@@ -17,14 +17,25 @@
 
 """Tests for debmutate.watch."""
 
+import json
 import os
 import shutil
 import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from io import StringIO
-from unittest import TestCase
+from unittest import TestCase, skipIf
 
 from debmutate.watch import (InvalidUVersionMangle, MissingVersion, Watch,
-                             WatchEditor, WatchFile, parse_watch_file)
+                             WatchEditor, WatchFile, WatchOptions,
+                             parse_git_refs, parse_watch_file)
+
+try:
+    import pcre  # noqa: F401
+except ModuleNotFoundError:
+    have_pcre = False
+else:
+    have_pcre = True
 
 
 class ParseWatchFileTests(TestCase):
@@ -123,6 +134,37 @@ opts="pgpmode=mangle" https://samba.org/~jelmer blah-(\\d+).tar.gz
             [Watch('https://samba.org/~jelmer',
                    'blah-(\\d+).tar.gz', opts=['pgpmode=mangle'])])
 
+    def test_parse_opt_quotes_with_spaces(self):
+        wf = parse_watch_file(StringIO("""\
+version=4
+opts="uversionmangle=s/ /_/,pgpmode=none" https://samba.org/~jelmer/ \\
+  blah-(\\d+).tar.gz
+"""))
+        assert wf is not None
+        self.assertEqual(
+            [Watch('https://samba.org/~jelmer/', 'blah-(\\d+).tar.gz',
+                   opts=['uversionmangle=s/ /_/', 'pgpmode=none'])],
+            wf.entries)
+
+    def test_parse_opt_unterminated_quotes(self):
+        self.assertRaises(ValueError, parse_watch_file, StringIO("""\
+version=4
+opts="pgpmode=mangle https://samba.org/~jelmer blah-(\\d+).tar.gz
+"""))
+
+    def test_parse_comment_in_continuation(self):
+        wf = parse_watch_file(iter([
+            'version=4\n',
+            'opts=pgpmode=mangle \\\n',
+            '# a comment\n',
+            '  https://samba.org/~jelmer/ blah-(\\d+).tar.gz\n',
+        ]))
+        assert wf is not None
+        self.assertEqual(
+            [Watch('https://samba.org/~jelmer/', 'blah-(\\d+).tar.gz',
+                   opts=['pgpmode=mangle'])],
+            wf.entries)
+
     def test_parse_continued_leading_spaces_4(self):
         wf = parse_watch_file(StringIO("""\
 version=4
@@ -194,6 +236,7 @@ https://samba.org/~jelmer/@PACKAGE@ blah-(\\d+).tar.gz
             'https://samba.org/~jelmer/blah',
             wf.entries[0].format_url('blah'))
 
+    @skipIf(not have_pcre, 'pcre module not available')
     def test_parse_subst_expr(self):
         wf = parse_watch_file(StringIO("""\
 version = 3
@@ -206,6 +249,7 @@ opts=uversionmangle=s/(\\d)[_\\.\\-\\+]?((RC|rc|pre|alpha)\\d*)$/$1~$2/ \\
         self.assertEqual(
             '1.0~alpha1', wf.entries[0].uversionmangle('1.0alpha1'))
 
+    @skipIf(not have_pcre, 'pcre module not available')
     def test_parse_tr_expr(self):
         wf = parse_watch_file(StringIO("""\
 version = 3
@@ -222,6 +266,7 @@ opts=uversionmangle=tr/+/~/ \\
         self.assertEqual(
             '1.0~alpha1', wf.entries[0].uversionmangle('1.0+alpha1'))
 
+    @skipIf(not have_pcre, 'pcre module not available')
     def test_parse_y_expr(self):
         wf = parse_watch_file(StringIO("""\
 version = 3
@@ -238,6 +283,7 @@ opts=uversionmangle=y/+/~/ \\
         self.assertEqual(
             '1.0~alpha1', wf.entries[0].uversionmangle('1.0+alpha1'))
 
+    @skipIf(not have_pcre, 'pcre module not available')
     def test_parse_subst_expr_escape(self):
         wf = parse_watch_file(StringIO("""\
 version = 3
@@ -250,6 +296,7 @@ opts=uversionmangle=s/(\\d)[_\\.\\-\\+]?((RC|rc|pre|alpha|\\/)\\d*)$/$1~$2/ \\
         self.assertEqual(
             '1.0~alpha1', wf.entries[0].uversionmangle('1.0alpha1'))
 
+    @skipIf(not have_pcre, 'pcre module not available')
     def test_parse_subst_expr_percent(self):
         wf = parse_watch_file(StringIO("""\
 version = 3
@@ -262,6 +309,7 @@ opts=uversionmangle=s%(\\d)[_\\.\\-\\+]?((RC|rc|pre|alpha)\\d*)$%$1~$2% \\
         self.assertEqual(
             '1.0~alpha1', wf.entries[0].uversionmangle('1.0alpha1'))
 
+    @skipIf(not have_pcre, 'pcre module not available')
     def test_parse_subst_expr_invalid(self):
         wf = parse_watch_file(StringIO("""\
 version = 3
@@ -273,6 +321,43 @@ opts=uversionmangle=s/(\\d)[_\\.\\-\\+]?((RC|rc|pre|alpha)\\d*)$$1~$2 \\
             InvalidUVersionMangle, wf.entries[0].uversionmangle, '1.0alpha1')
 
 
+class WatchOptionsTests(TestCase):
+
+    def test_get(self):
+        opts = WatchOptions(['pgpmode=mangle', 'repack', 'mode=git'])
+        self.assertEqual('mangle', opts.get('pgpmode'))
+        self.assertIs(None, opts.get('repack'))
+        self.assertRaises(KeyError, opts.get, 'searchmode')
+
+    def test_set_existing(self):
+        entry = Watch('https://example.com/', opts=['a=1', 'b=2'])
+        entry.set_option('a', '3')
+        self.assertEqual(['a=3', 'b=2'], entry.options)
+        entry.set_option('c')
+        self.assertEqual(['a=3', 'b=2', 'c'], entry.options)
+
+    def test_delete(self):
+        opts = WatchOptions(['a=1', 'b=2', 'a=3'])
+        opts.delete('a')
+        self.assertEqual(['b=2', 'a=3'], opts)
+        self.assertEqual('3', opts.get('a'))
+        opts.delete('a')
+        self.assertFalse(opts.has('a'))
+        self.assertRaises(KeyError, opts.delete, 'a')
+
+    def test_dump_preserves_order(self):
+        text = """\
+version=4
+opts=z=1,repack,a=2 https://example.com/ blah-(\\d+).tar.gz
+"""
+        wf = parse_watch_file(StringIO(text))
+        assert wf is not None
+        wf.entries[0].set_option('repack', None)
+        f = StringIO()
+        wf.dump(f)
+        self.assertEqual(text, f.getvalue())
+
+
 class WatchEditorTests(TestCase):
 
     def setUp(self):
@@ -302,3 +387,172 @@ https://pypi.debian.net/case case-(.+)\\.tar.gz
 version=4
 https://pypi.debian.net/case case-(.+)\\.tar.gz
 """, f.read())
+
+
+class FixtureServer:
+    """Local HTTP server that serves a fixed set of responses."""
+
+    def __init__(self, fixtures):
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                try:
+                    body = fixtures[self.path]
+                except KeyError:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+
+def pkt_line(data):
+    return b'%04x' % (len(data) + 4) + data
+
+
+GIT_INFO_REFS = b''.join([
+    pkt_line(b'# service=git-upload-pack\n'), b'0000',
+    pkt_line(b'1' * 40 + b' HEAD\0multi_ack side-band-64k\n'),
+    pkt_line(b'1' * 40 + b' refs/heads/main\n'),
+    pkt_line(b'2' * 40 + b' refs/tags/v1.0\n'),
+    pkt_line(b'3' * 40 + b' refs/tags/v1.0^{}\n'),
+    pkt_line(b'4' * 40 + b' refs/tags/v1.1\n'),
+    b'0000'])
+
+
+class ParseGitRefsTests(TestCase):
+
+    def test_smart(self):
+        self.assertEqual([
+            (b'1' * 40, 'HEAD'),
+            (b'1' * 40, 'refs/heads/main'),
+            (b'2' * 40, 'refs/tags/v1.0'),
+            (b'4' * 40, 'refs/tags/v1.1')],
+            list(parse_git_refs(GIT_INFO_REFS)))
+
+    def test_dumb(self):
+        self.assertEqual([
+            (b'2' * 40, 'refs/tags/v1.0')],
+            list(parse_git_refs(b'2' * 40 + b'\trefs/tags/v1.0\n')))
+
+
+class SearcherTests(TestCase):
+
+    def discover(self, fixtures, url, pattern, opts):
+        with FixtureServer(fixtures) as server:
+            entry = Watch(server.url + url, pattern, opts=opts)
+            return server.url, [
+                (r.version, r.url) for r in entry.discover('blah')]
+
+    def test_git(self):
+        base_url, releases = self.discover(
+            {'/blah.git/info/refs?service=git-upload-pack': GIT_INFO_REFS},
+            '/blah.git', r'refs/tags/v?(\d\S*)', ['mode=git'])
+        self.assertEqual([
+            ('1.0', base_url + '/blah.git -b v1.0'),
+            ('1.1', base_url + '/blah.git -b v1.1')], releases)
+
+    def test_pypi(self):
+        body = json.dumps({
+            'releases': {
+                '1.0': [
+                    {'url': 'https://files.example.com/ab/blah-1.0.tar.gz'},
+                    {'url': 'https://files.example.com/cd/'
+                            'blah-1.0-py3-none-any.whl'}],
+                '1.1': [
+                    {'url': 'https://files.example.com/ef/blah-1.1.tar.gz',
+                     'yanked': True}],
+            }}).encode()
+        base_url, releases = self.discover(
+            {'/pypi/blah/json': body}, '/pypi/blah/json',
+            r'blah-(.+)\.tar\.gz', ['searchmode=pypi'])
+        self.assertEqual(
+            [('1.0', 'https://files.example.com/ab/blah-1.0.tar.gz')],
+            releases)
+
+    def test_crates(self):
+        body = b'\n'.join([
+            json.dumps({'name': 'blah', 'vers': '0.1.0',
+                        'yanked': False}).encode(),
+            json.dumps({'name': 'blah', 'vers': '0.2.0',
+                        'yanked': True}).encode(),
+            json.dumps({'name': 'blah', 'vers': '0.3.0',
+                        'yanked': False}).encode()])
+        base_url, releases = self.discover(
+            {'/bl/ah/blah': body}, '/bl/ah/blah',
+            r'blah-(.+)\.crate', ['searchmode=crates'])
+        self.assertEqual([
+            ('0.1.0',
+             'https://static.crates.io/crates/blah/blah-0.1.0.crate'),
+            ('0.3.0',
+             'https://static.crates.io/crates/blah/blah-0.3.0.crate')],
+            releases)
+
+    def test_github(self):
+        body = json.dumps([
+            {'tag_name': 'v1.1', 'draft': True,
+             'tarball_url':
+                'https://api.github.com/repos/j/blah/tarball/v1.1'},
+            {'tag_name': 'v1.0',
+             'tarball_url':
+                'https://api.github.com/repos/j/blah/tarball/v1.0',
+             'assets': [{
+                 'browser_download_url':
+                 'https://github.com/j/blah/releases/download/v1.0/'
+                 'blah-1.0.tar.gz'}]}]).encode()
+        base_url, releases = self.discover(
+            {'/repos/j/blah/releases': body}, '/repos/j/blah/releases',
+            r'blah-(.+)\.tar\.gz', ['searchmode=github'])
+        self.assertEqual([
+            ('1.0', 'https://github.com/j/blah/releases/download/v1.0/'
+                    'blah-1.0.tar.gz')], releases)
+
+    @skipIf(not have_pcre, 'pcre module not available')
+    def test_perl_pattern(self):
+        # Named groups in Perl syntax are not supported by the re module
+        body = json.dumps({
+            'urls': [{'url': 'https://files.example.com/blah-1.0.tar.gz'}],
+        }).encode()
+        base_url, releases = self.discover(
+            {'/pypi/blah/json': body}, '/pypi/blah/json',
+            r'blah-(?<version>.+)\.tar\.gz', ['searchmode=pypi'])
+        self.assertEqual(
+            [('1.0', 'https://files.example.com/blah-1.0.tar.gz')],
+            releases)
+
+    def test_gitlab(self):
+        body = json.dumps([
+            {'tag_name': 'v1.0',
+             'assets': {
+                 'sources': [
+                     {'format': 'tar.gz',
+                      'url': 'https://gitlab.com/j/blah/-/archive/v1.0/'
+                             'blah-v1.0.tar.gz'},
+                     {'format': 'zip',
+                      'url': 'https://gitlab.com/j/blah/-/archive/v1.0/'
+                             'blah-v1.0.zip'}],
+                 'links': []}}]).encode()
+        base_url, releases = self.discover(
+            {'/api/v4/projects/1/releases': body},
+            '/api/v4/projects/1/releases',
+            r'blah-v(.+)\.tar\.gz', ['searchmode=gitlab'])
+        self.assertEqual([
+            ('1.0', 'https://gitlab.com/j/blah/-/archive/v1.0/'
+                    'blah-v1.0.tar.gz')], releases)
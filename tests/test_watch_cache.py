@@ -0,0 +1,190 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.watch_cache."""
+
+import os
+
+from debmutate.watch import Release, Watch, WatchFile
+from debmutate.watch_cache import (UpstreamListingStore, UpstreamStatus,
+                                   discover_and_record, iter_upstream_status,
+                                   newest_upstream_release, upstream_status)
+
+from . import TestCase, TestCaseInTempDir
+
+CHANGELOG = """\
+blah (1.0-1) unstable; urgency=medium
+
+  * Initial release.
+
+ -- Jelmer Vernooij <jelmer@debian.org>  Sat, 13 Oct 2018 11:21:39 +0100
+"""
+
+
+class UpstreamListingStoreTests(TestCaseInTempDir):
+
+    def test_missing(self):
+        store = UpstreamListingStore('store.json')
+        self.assertNotIn('blah', store)
+        self.assertRaises(
+            KeyError, store.releases, 'blah', Watch('https://example.com/'))
+
+    def test_roundtrip(self):
+        entry = Watch('https://example.com/', 'blah-(.*).tar.gz')
+        with UpstreamListingStore('store.json') as store:
+            store.record('blah', entry, [
+                Release('1.0', 'https://example.com/blah-1.0.tar.gz'),
+                Release('1.1', 'https://example.com/blah-1.1.tar.gz',
+                        pgpsigurl='https://example.com/blah-1.1.tar.gz.asc'),
+            ], timestamp=1000)
+        self.assertTrue(os.path.exists('store.json'))
+        store = UpstreamListingStore('store.json')
+        self.assertEqual(['blah'], store.packages())
+        self.assertEqual(1000, store.last_updated('blah', entry))
+        self.assertEqual(
+            [('1.0', 'https://example.com/blah-1.0.tar.gz', None),
+             ('1.1', 'https://example.com/blah-1.1.tar.gz',
+              'https://example.com/blah-1.1.tar.gz.asc')],
+            [(r.version, r.url, r.pgpsigurl)
+             for r in store.releases('blah', entry)])
+
+    def test_save_without_path(self):
+        store = UpstreamListingStore()
+        self.assertRaises(ValueError, store.save)
+
+    def test_unsupported_version(self):
+        self.build_tree_contents([('store.json', '{"version": 0}')])
+        self.assertRaises(ValueError, UpstreamListingStore, 'store.json')
+
+
+class DiscoverAndRecordTests(TestCase):
+
+    def test_record(self):
+        class StaticWatch(Watch):
+
+            def __init__(self, url, releases):
+                super().__init__(url)
+                self.releases = releases
+
+            def discover(self, package):
+                return iter(self.releases)
+
+        release1 = Release('1.0', 'https://example.com/blah-1.0.tar.gz')
+        release2 = Release('2.0', 'https://example.org/blah-2.0.tar.gz')
+        entry1 = StaticWatch('https://example.com/', [release1])
+        entry2 = StaticWatch('https://example.org/', [release2])
+        store = UpstreamListingStore()
+        self.assertEqual(
+            [release1, release2],
+            discover_and_record(store, WatchFile([entry1, entry2]), 'blah'))
+        self.assertEqual([release1], store.releases('blah', entry1))
+        self.assertEqual([release2], store.releases('blah', entry2))
+
+
+class NewestUpstreamReleaseTests(TestCase):
+
+    def test_newest(self):
+        entry = Watch('https://example.com/', 'blah-(.*).tar.gz')
+        store = UpstreamListingStore()
+        store.record('blah', entry, [
+            Release('1.10', 'https://example.com/blah-1.10.tar.gz'),
+            Release('1.9', 'https://example.com/blah-1.9.tar.gz'),
+            Release('1.2', 'https://example.com/blah-1.2.tar.gz'),
+        ])
+        newest = newest_upstream_release(store, WatchFile([entry]), 'blah')
+        assert newest is not None
+        self.assertEqual('1.10', newest.version)
+
+    def test_no_listing(self):
+        entry = Watch('https://example.com/', 'blah-(.*).tar.gz')
+        self.assertIs(
+            None,
+            newest_upstream_release(
+                UpstreamListingStore(), WatchFile([entry]), 'blah'))
+
+    def test_invalid_versions_ignored(self):
+        entry = Watch('https://example.com/', 'blah-(.*).tar.gz')
+        store = UpstreamListingStore()
+        store.record('blah', entry, [
+            Release('latest version', 'https://example.com/blah.tar.gz'),
+            Release('1.0', 'https://example.com/blah-1.0.tar.gz'),
+        ])
+        newest = newest_upstream_release(store, WatchFile([entry]), 'blah')
+        assert newest is not None
+        self.assertEqual('1.0', newest.version)
+
+
+class UpstreamStatusTests(TestCaseInTempDir):
+
+    def setUp(self):
+        super().setUp()
+        self.build_tree_contents([
+            ('debian/', ),
+            ('debian/changelog', CHANGELOG),
+            ('debian/watch', """\
+version=4
+https://example.com/ blah-(.*).tar.gz
+""")])
+        self.store = UpstreamListingStore()
+        self.entry = Watch('https://example.com/', 'blah-(.*).tar.gz')
+
+    def test_outdated(self):
+        self.store.record('blah', self.entry, [
+            Release('1.1', 'https://example.com/blah-1.1.tar.gz')])
+        status = upstream_status(self.store)
+        self.assertEqual('blah', status.package)
+        self.assertEqual('1.0', status.packaged_version)
+        assert status.newest is not None
+        self.assertEqual('1.1', status.newest.version)
+        self.assertTrue(status.outdated)
+
+    def test_up_to_date(self):
+        self.store.record('blah', self.entry, [
+            Release('1.0', 'https://example.com/blah-1.0.tar.gz')])
+        self.assertFalse(upstream_status(self.store).outdated)
+
+    def test_unknown(self):
+        status = upstream_status(self.store)
+        self.assertIs(None, status.newest)
+        self.assertIs(None, status.outdated)
+
+    def test_no_watch_file(self):
+        os.unlink('debian/watch')
+        self.assertEqual(
+            UpstreamStatus('blah', None, None), upstream_status(self.store))
+
+    def test_dversionmangle_auto(self):
+        with open('debian/changelog', 'w') as f:
+            f.write(CHANGELOG.replace('1.0-1', '1.1+dfsg-1'))
+        with open('debian/watch', 'w') as f:
+            f.write("""\
+version=4
+opts=dversionmangle=auto https://example.com/ blah-(.*).tar.gz
+""")
+        self.store.record('blah', self.entry, [
+            Release('1.1', 'https://example.com/blah-1.1.tar.gz')])
+        status = upstream_status(self.store)
+        self.assertEqual('1.1', status.packaged_version)
+        self.assertFalse(status.outdated)
+
+    def test_iter(self):
+        self.store.record('blah', self.entry, [
+            Release('1.1', 'https://example.com/blah-1.1.tar.gz')])
+        self.assertEqual(
+            [True],
+            [status.outdated
+             for status in iter_upstream_status(self.store, ['.'])])
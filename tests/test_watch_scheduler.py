@@ -0,0 +1,239 @@
+#!/usr/bin/python
+# Copyright (C) 2023 Jelmer Vernooij
+#
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA
+
+"""Tests for debmutate.watch_scheduler."""
+
+import threading
+from email.message import Message
+from typing import Dict
+from urllib.error import HTTPError
+
+from debmutate.watch import Release, Watch, WatchFile
+from debmutate.watch_scheduler import (TokenBucket, UscanScheduler,
+                                       host_for_entry, parse_retry_after)
+
+from . import TestCase
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TokenBucketTests(TestCase):
+
+    def test_burst(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, burst=2, clock=clock)
+        self.assertEqual(0, bucket.delay())
+        bucket.consume()
+        self.assertEqual(0, bucket.delay())
+        bucket.consume()
+        self.assertEqual(1, bucket.delay())
+        clock.now = 0.5
+        self.assertEqual(0.5, bucket.delay())
+        clock.now = 10
+        bucket.consume()
+        bucket.consume()
+        self.assertEqual(1, bucket.delay())
+
+    def test_block_until(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=1, burst=1, clock=clock)
+        bucket.block_until(30)
+        self.assertEqual(30, bucket.delay())
+        clock.now = 31
+        self.assertEqual(0, bucket.delay())
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, TokenBucket, rate=0)
+        self.assertRaises(ValueError, TokenBucket, rate=1, burst=0)
+
+
+class ParseRetryAfterTests(TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(120, parse_retry_after('120'))
+
+    def test_date(self):
+        self.assertEqual(
+            30, parse_retry_after(
+                'Thu, 01 Jan 1970 00:01:00 GMT', now=30))
+        self.assertEqual(
+            0, parse_retry_after(
+                'Thu, 01 Jan 1970 00:01:00 GMT', now=90))
+
+    def test_invalid(self):
+        self.assertIs(None, parse_retry_after(None))
+        self.assertIs(None, parse_retry_after('soon'))
+
+
+class HostForEntryTests(TestCase):
+
+    def test_substituted(self):
+        self.assertEqual(
+            'pypi.debian.net',
+            host_for_entry(
+                Watch('https://pypi.debian.net/@PACKAGE@', 'x-(.*).tar.gz'),
+                'blah'))
+
+
+def throttled(code=429, retry_after=None):
+    headers = Message()
+    if retry_after is not None:
+        headers['Retry-After'] = retry_after
+    return HTTPError('https://example.com/', code, 'Throttled', headers, None)
+
+
+class UscanSchedulerTests(TestCase):
+
+    def jobs(self, hosts, count):
+        return [
+            ('pkg%d' % i, WatchFile([
+                Watch('https://%s/pkg%d/' % (hosts[i % len(hosts)], i),
+                      'pkg-(.*).tar.gz')]))
+            for i in range(count)]
+
+    def test_all_results(self):
+        def discover(entry, package):
+            return [Release('1.0', entry.url + 'pkg-1.0.tar.gz')]
+        scheduler = UscanScheduler(max_workers=4, rate=1000, burst=10)
+        results = list(scheduler.run(
+            self.jobs(['a.example.com', 'b.example.com'], 20), discover))
+        self.assertEqual(20, len(results))
+        self.assertEqual(
+            {'pkg%d' % i for i in range(20)},
+            {r.package for r in results})
+        self.assertTrue(all(r.error is None for r in results))
+
+    def test_empty(self):
+        self.assertEqual([], list(UscanScheduler().run([])))
+
+    def test_concurrency_budget(self):
+        lock = threading.Lock()
+        active = [0]
+        peak = [0]
+        event = threading.Event()
+
+        def discover(entry, package):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            event.wait(0.01)
+            with lock:
+                active[0] -= 1
+            return []
+        scheduler = UscanScheduler(max_workers=3, rate=1000, burst=100)
+        list(scheduler.run(
+            self.jobs(['a.example.com', 'b.example.com', 'c.example.com',
+                       'd.example.com'], 24), discover))
+        self.assertLessEqual(peak[0], 3)
+
+    def test_retry_on_throttle(self):
+        attempts: Dict[str, int] = {}
+
+        def discover(entry, package):
+            attempts[package] = attempts.get(package, 0) + 1
+            if attempts[package] == 1:
+                raise throttled(429, retry_after='0')
+            return [Release('1.0', entry.url + 'pkg-1.0.tar.gz')]
+        scheduler = UscanScheduler(max_workers=2, rate=1000, burst=10)
+        results = list(scheduler.run(
+            self.jobs(['a.example.com'], 3), discover))
+        self.assertEqual(3, len(results))
+        self.assertTrue(all(r.releases for r in results))
+        self.assertEqual({'pkg0': 2, 'pkg1': 2, 'pkg2': 2}, attempts)
+
+    def test_give_up(self):
+        def discover(entry, package):
+            raise throttled(503)
+        scheduler = UscanScheduler(
+            max_workers=1, rate=1000, max_retries=2, backoff=0.001)
+        [result] = scheduler.run(self.jobs(['a.example.com'], 1), discover)
+        self.assertIsInstance(result.error, HTTPError)
+        self.assertIs(None, result.releases)
+
+    def test_other_error(self):
+        def discover(entry, package):
+            raise throttled(404)
+        scheduler = UscanScheduler(max_workers=1, rate=1000)
+        [result] = scheduler.run(self.jobs(['a.example.com'], 1), discover)
+        assert isinstance(result.error, HTTPError)
+        self.assertEqual(404, result.error.code)
+
+    def test_retry_delay(self):
+        scheduler = UscanScheduler(backoff=2, max_backoff=10)
+        self.assertEqual(2, scheduler._retry_delay(throttled(), 0))
+        self.assertEqual(8, scheduler._retry_delay(throttled(), 2))
+        self.assertEqual(10, scheduler._retry_delay(throttled(), 5))
+        self.assertEqual(
+            3, scheduler._retry_delay(throttled(retry_after='3'), 5))
+
+    def test_retry_without_headers(self):
+        attempts: Dict[str, int] = {}
+
+        def discover(entry, package):
+            attempts[package] = attempts.get(package, 0) + 1
+            if attempts[package] == 1:
+                raise HTTPError(
+                    'https://example.com/', 429, 'Throttled',
+                    None, None)  # type: ignore
+            return []
+        scheduler = UscanScheduler(
+            max_workers=1, rate=1000, backoff=0.001)
+        [result] = scheduler.run(self.jobs(['a.example.com'], 1), discover)
+        self.assertEqual([], result.releases)
+        self.assertEqual({'pkg0': 2}, attempts)
+
+    def test_retry_failure(self):
+        class BrokenScheduler(UscanScheduler):
+            def _retry_delay(self, error, attempt):
+                raise AttributeError('broken')
+
+        def discover(entry, package):
+            raise throttled(429)
+        scheduler = BrokenScheduler(max_workers=1, rate=1000)
+        results = list(scheduler.run(
+            self.jobs(['a.example.com'], 2), discover))
+        self.assertEqual(2, len(results))
+        self.assertTrue(
+            all(isinstance(r.error, HTTPError) for r in results))
+
+    def test_host_rate_limit(self):
+        clock_lock = threading.Lock()
+        calls = []
+
+        def discover(entry, package):
+            with clock_lock:
+                calls.append(host_for_entry(entry, package))
+            return []
+        scheduler = UscanScheduler(
+            max_workers=4, rate=1000, burst=100,
+            host_limits={'slow.example.com': (20, 1)})
+        list(scheduler.run(
+            self.jobs(['slow.example.com', 'fast.example.com'], 8),
+            discover))
+        # The fast host is not held up by the slow one.
+        self.assertEqual(
+            ['fast.example.com'] * 4,
+            [c for c in calls if c == 'fast.example.com'])
+        self.assertLess(
+            calls.index('fast.example.com'), 2)